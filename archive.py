@@ -0,0 +1,238 @@
+import io
+import os
+import json
+import zlib
+import lzma
+import gzip
+import struct
+import hashlib
+import argparse
+from bisect import bisect_right
+
+import read_cs_files as cs
+from manifest import atomic_write
+
+# block archive: MAGIC, the compressed blocks, a JSON index and TRAILER
+# (offset and length of the index, MAGIC)
+MAGIC = b'CSBLOCK1'
+TRAILER = struct.Struct('<QQ8s')
+
+# raw bytes per block; blocks hold whole TOB3 frames
+BLOCK_SIZE = 1 << 20
+
+
+def _codec(name):
+    # compress and decompress functions of a block codec
+    if name == 'zlib':
+        return lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress
+    if name == 'xz':
+        return lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression needs the zstandard package') from None
+        return (lambda data, level: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data),
+                lambda data: zstandard.ZstdDecompressor().decompress(data))
+    raise ValueError(f'unknown codec {name}')
+
+
+def _frame_layout(data):
+    # end of the header and frame size of a TOB3 file, (None, None) otherwise
+    if not data.startswith(b'"TOB3"'):
+        return None, None
+    with io.BytesIO(data) as f:
+        meta = cs.read_cs_meta(f, 'TOB3')
+        data_start = f.tell()
+    recsize = sum(struct.calcsize(fmt) for fmt in cs.read_cs_formats(meta[5]))
+    n_rec_frame = (int(meta[1][2]) - 16) // recsize
+    return data_start, 16 + n_rec_frame * recsize
+
+
+def write_block_archive(data, filename, codec='zlib', level=None, block_size=BLOCK_SIZE):
+    """
+    Write data as a block archive.
+
+    The data is cut into blocks of about block_size bytes that are compressed
+    independently. For TOB3 files the header is a block of its own and every
+    other block holds whole frames, so a read of some frames (e.g. a byte range
+    from the catalog) only decompresses the blocks holding them.
+
+    Args:
+        data (bytes): Content of the file.
+        filename (str): Archive to write.
+        codec (str): 'zlib', 'xz' or 'zstd' (needs the zstandard package).
+        level (int, optional): Compression level of the codec.
+        block_size (int): Raw bytes per block.
+
+    Returns:
+        dict: The index of the archive.
+    """
+    compress, _ = _codec(codec)
+    data_start, frame_size = _frame_layout(data)
+    bounds = [0]
+    if data_start is not None:
+        step = max(1, block_size // frame_size) * frame_size
+        bounds += list(range(data_start, len(data), step))
+    else:
+        bounds += list(range(block_size, len(data), block_size))
+    bounds = sorted(set(bounds)) + [len(data)]
+
+    index = {'codec': codec, 'size': len(data), 'data_start': data_start, 'frame_size': frame_size,
+             'blocks': []}
+    with atomic_write(filename, 'wb') as f:
+        f.write(MAGIC)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            block = compress(data[start:stop], level)
+            index['blocks'].append([start, f.tell(), len(block)])
+            f.write(block)
+        offset = f.tell()
+        encoded = json.dumps(index).encode()
+        f.write(encoded)
+        f.write(TRAILER.pack(offset, len(encoded), MAGIC))
+    return index
+
+
+class BlockFile(io.RawIOBase):
+    """
+    Read-only, seekable file object of the uncompressed data of a block archive.
+
+    Blocks are decompressed when read; the last one is kept for the reads that follow.
+
+    Args:
+        filename (str): Block archive, see write_block_archive.
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        self.file = open(filename, 'rb')
+        self.file.seek(-TRAILER.size, os.SEEK_END)
+        offset, length, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != MAGIC:
+            self.file.close()
+            raise ValueError(f'{filename} is not a block archive')
+        self.file.seek(offset)
+        self.index = json.loads(self.file.read(length))
+        self.starts = [block[0] for block in self.index['blocks']]
+        self.size = self.index['size']
+        self.decompress = _codec(self.index['codec'])[1]
+        self.pos = 0
+        self.cached = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.pos, os.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def _block(self, i):
+        if self.cached[0] != i:
+            _, offset, length = self.index['blocks'][i]
+            self.file.seek(offset)
+            self.cached = (i, memoryview(self.decompress(self.file.read(length))))
+        return self.cached[1]
+
+    def readinto(self, buffer):
+        if self.pos >= self.size or not len(buffer):
+            return 0
+        i = bisect_right(self.starts, self.pos) - 1
+        block = self._block(i)
+        within = self.pos - self.starts[i]
+        n = min(len(buffer), len(block) - within)
+        buffer[:n] = block[within:within + n]
+        self.pos += n
+        return n
+
+    def readall(self):
+        # the rest of the data in one piece, e.g. all frames from a position on
+        parts = []
+        while self.pos < self.size:
+            i = bisect_right(self.starts, self.pos) - 1
+            block = self._block(i)
+            parts.append(block[self.pos - self.starts[i]:])
+            self.pos = self.starts[i] + len(block)
+        return b''.join(parts)
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+
+def open_block_archive(filename):
+    """Buffered, seekable file object of the uncompressed data of a block archive."""
+    return io.BufferedReader(BlockFile(filename), buffer_size=1 << 16)
+
+
+def compress_file(filename, fmt='blk', codec='zlib', level=None, delete=False):
+    """
+    Compress a raw datalogger file next to the original.
+
+    The compressed file is read back and compared with the original before
+    the original is deleted, and keeps its modification time.
+
+    Args:
+        filename (str): File to compress, e.g. ts_data_1.dat.
+        fmt (str): 'blk' (block archive, see write_block_archive), 'gz', 'xz' or 'zst'.
+        codec (str): Codec of the blocks of a block archive.
+        level (int, optional): Compression level.
+        delete (bool): Remove the original once the compressed file is verified.
+
+    Returns:
+        str: The compressed file.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    target = f'{filename}.{fmt}'
+    if fmt == 'blk':
+        write_block_archive(data, target, codec, level)
+    else:
+        if fmt == 'gz':
+            compressed = gzip.compress(data, 6 if level is None else level)
+        elif fmt == 'xz':
+            compressed = lzma.compress(data, preset=6 if level is None else level)
+        elif fmt == 'zst':
+            compressed = _codec('zstd')[0](data, level)
+        else:
+            raise ValueError(f'unknown format {fmt}')
+        with atomic_write(target, 'wb') as f:
+            f.write(compressed)
+
+    with cs.read_cs_source(target) as f:
+        if hashlib.sha1(f.read()).digest() != hashlib.sha1(data).digest():
+            os.remove(target)
+            raise IOError(f'{target} does not hold the data of {filename}')
+    stat = os.stat(filename)
+    os.utime(target, (stat.st_atime, stat.st_mtime))
+    if delete:
+        os.remove(filename)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress raw datalogger files, readable by read_cs_files.")
+    parser.add_argument('files', nargs='+', help='files to compress')
+    parser.add_argument('-f', '--format', choices=['blk', 'gz', 'xz', 'zst'], default='blk',
+                        help='blk: block archive keeping the frames addressable (default)')
+    parser.add_argument('-c', '--codec', choices=['zlib', 'xz', 'zstd'], default='zlib',
+                        help='codec of the blocks of a block archive')
+    parser.add_argument('-l', '--level', type=int, default=None, help='compression level')
+    parser.add_argument('--delete', action='store_true', help='remove the originals once verified')
+    args = parser.parse_args()
+
+    for filename in args.files:
+        size = os.path.getsize(filename)
+        target = compress_file(filename, args.format, args.codec, args.level, args.delete)
+        print(f'{filename} -> {target} ({os.path.getsize(target) / max(size, 1):.0%})')
+
+
+if __name__ == "__main__":
+    main()
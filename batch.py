@@ -0,0 +1,185 @@
+import os
+import time
+import argparse
+import configparser
+from datetime import datetime
+from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# station keys listing the tables of each processing step
+STEPS = ['split_days', 'monthly', 'monitor']
+
+
+def read_stations(filename):
+    """
+    Read a station manifest into processing jobs.
+
+    The manifest is an INI file with one section per station:
+
+        [setx]
+        src = /corral/utexas/CDA23001/water/eddycov/DataLogger/CRD
+        dst = /corral/utexas/CDA23001/water/eddycov/decoded_data
+        metadata = EddyPro/setx.metadata
+        split_days = ts_data
+        monthly = MetData, SondeData
+        monitor = MonitorCSAT
+
+        [setx MetData]
+        cutoff = 2025-08-26 08:15
+
+    Sections "<station> <table>" hold the options of one table: cutoff
+    (monthly), freq (monitor), glob (comma separated patterns) and format.
+    A station may also set catalog (default <dst>/catalog.sqlite), cache_dir
+    and float64 (yes for double precision columns); keys of [DEFAULT] apply
+    to every station.
+
+    Args:
+        filename (str): Station manifest.
+
+    Returns:
+        list: Jobs, dicts with 'station', 'step', 'table', 'dst_dir' and the
+              keyword arguments of the processing function in 'kwargs'.
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    if not config.read(filename):
+        raise FileNotFoundError(filename)
+
+    jobs = []
+    for station in config.sections():
+        if ' ' in station:
+            continue
+        section = config[station]
+        dst = section['dst']
+        common = {'src_dir': section['src'],
+                  'cache_dir': section.get('cache_dir'),
+                  'catalog': section.get('catalog', os.path.join(dst, 'catalog.sqlite')),
+                  'float64': section.getboolean('float64', False)}
+        for step in STEPS:
+            for table in [t.strip() for t in section.get(step, '').split(',') if t.strip()]:
+                options = config[f'{station} {table}'] if config.has_section(f'{station} {table}') else {}
+                kwargs = dict(common, var=table)
+                if options.get('glob'):
+                    kwargs['patterns'] = [p.strip() for p in options['glob'].split(',')]
+                if options.get('format'):
+                    kwargs['fmt'] = options['format']
+                if step == 'split_days':
+                    kwargs['file_meta'] = section.get('metadata')
+                elif step == 'monthly':
+                    kwargs['cutoff'] = options.get('cutoff')
+                elif options.get('freq'):
+                    kwargs['freq'] = options['freq']
+                jobs.append({'station': station, 'step': step, 'table': table,
+                             'dst_dir': os.path.join(dst, table), 'kwargs': kwargs})
+    return jobs
+
+
+def fair_order(jobs):
+    """Interleave the jobs of the stations, one table of each station in turn."""
+    stations = {}
+    for job in jobs:
+        stations.setdefault(job['station'], []).append(job)
+    return [job for turn in zip_longest(*stations.values()) for job in turn if job is not None]
+
+
+def run_job(job, pool, workers, start=None, end=None):
+    """
+    Process one table of one station, decoding in the shared pool.
+
+    Args:
+        job (dict): Job from read_stations.
+        pool (ProcessPoolExecutor): Process pool shared by all jobs.
+        workers (int): Share of the pool of this job, see ingest.decode_files.
+        start (str, optional): Only process data from this time on.
+        end (str, optional): Only process data before this time.
+
+    Returns:
+        float: Processing time in seconds.
+    """
+    from process_ts import process_files_by_day
+    from process_metdata import process_monthly
+    from process_monitor import process_monitor
+
+    function = {'split_days': process_files_by_day, 'monthly': process_monthly,
+                'monitor': process_monitor}[job['step']]
+    t0 = time.time()
+    os.makedirs(job['dst_dir'], exist_ok=True)
+    function(dst_dir=job['dst_dir'], workers=workers, start=start, end=end, pool=pool, **job['kwargs'])
+    return time.time() - t0
+
+
+def run_batch(jobs, workers=4, tables=None, start=None, end=None):
+    """
+    Run the jobs of all stations through one process pool.
+
+    Up to `tables` tables are processed at a time, each decoding its files
+    in the shared pool with an equal share of the workers, so the stations
+    progress together and the throughput scales with the pool size.
+
+    Args:
+        jobs (list): Jobs from read_stations.
+        workers (int): Number of decoding processes.
+        tables (int, optional): Number of tables processed at a time, workers by default.
+        start (str, optional): Only process data from this time on.
+        end (str, optional): Only process data before this time.
+
+    Returns:
+        list: (station, table, error) of the failed jobs.
+    """
+    jobs = fair_order(jobs)
+    tables = min(tables or workers, len(jobs)) or 1
+    share = max(1, workers // tables)
+    remaining = {}
+    for job in jobs:
+        remaining[job['station']] = remaining.get(job['station'], 0) + 1
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # start the workers before the job threads, they are forked from this process
+        pool.submit(int).result()
+        with ThreadPoolExecutor(max_workers=tables) as threads:
+            futures = {threads.submit(run_job, job, pool, share, start, end): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                remaining[job['station']] -= 1
+                error = future.exception()
+                status = f'failed: {error!r}' if error else f'done in {future.result():.0f} s'
+                print(f"[{job['station']}] {job['table']} {status} "
+                      f"({remaining[job['station']]} tables of {job['station']} left)")
+                if error:
+                    failed.append((job['station'], job['table'], error))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process the tables of several stations in one process pool.")
+    parser.add_argument('stations', type=str, help='station manifest (INI file)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of decoding processes')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='tables processed at a time (default: workers)')
+    parser.add_argument('--station', type=str, action='append', default=None,
+                        help='only process this station (repeatable)')
+    parser.add_argument('--start', type=str, default=None, help='first time to process, e.g. 2025-09-01')
+    parser.add_argument('--end', type=str, default=None, help='time to process up to (excluded)')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='log the time, bytes, records and memory of every stage to this JSON lines file')
+    args = parser.parse_args()
+    if args.profile:
+        from profiling import enable
+        enable(args.profile)
+
+    jobs = read_stations(args.stations)
+    if args.station:
+        jobs = [job for job in jobs if job['station'] in args.station]
+    print(f"Batch of {len(jobs)} tables started at {datetime.now()}")
+    failed = run_batch(jobs, args.workers, args.jobs, args.start, args.end)
+    print(f"Batch finished at {datetime.now()}, {len(failed)} tables failed")
+    if args.profile:
+        from profiling import print_summary
+        print_summary(args.profile)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import os
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from natsort import natsorted
+
+import read_cs_files as cs
+from scan import FRAME_FOOTER, files_covering, match_files, matches, ring_wrap, scan_directory, \
+    scan_file
+
+COLUMNS = ['file', 'size', 'mtime', 'filetype', 'table_name', 'created', 'signature', 'start', 'end',
+           'first_record', 'last_record', 'frame_size', 'n_frames', 'interval', 'data_start',
+           'validation', 'time_resolution']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    filetype TEXT,
+    table_name TEXT,
+    created TEXT,
+    signature TEXT,
+    start TEXT,
+    "end" TEXT,
+    first_record INTEGER,
+    last_record INTEGER,
+    frame_size INTEGER,
+    n_frames INTEGER,
+    interval REAL,
+    data_start INTEGER,
+    validation INTEGER,
+    time_resolution TEXT
+);
+CREATE INDEX IF NOT EXISTS files_span ON files (table_name, start, "end");
+'''
+
+INSERT = 'INSERT OR REPLACE INTO files ({}) VALUES ({})'.format(
+    ', '.join(f'"{column}"' for column in COLUMNS), ', '.join('?' * len(COLUMNS)))
+
+
+# one lock per catalog file: the tables of a station are processed in parallel
+# threads (batch.run_batch), which all update the catalog of the station
+_update_locks = {}
+_update_locks_guard = threading.Lock()
+
+
+def _update_lock(filename):
+    with _update_locks_guard:
+        return _update_locks.setdefault(os.path.abspath(filename), threading.Lock())
+
+
+def _iso(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else value
+
+
+def _catalog_entry(filename):
+    # scan_file plus what is needed to locate TOB3 frames without the header
+    info = scan_file(filename)
+    info['table_name'] = info.pop('table')
+    info['data_start'] = info['validation'] = info['time_resolution'] = None
+    if info['filetype'] == 'TOB3':
+        with cs.read_cs_open(filename) as f:
+            meta = [f.readline().rstrip().decode().replace('"', '').split(',') for _ in range(6)]
+            info['data_start'] = f.tell()
+        info['validation'] = int(meta[1][4])
+        info['time_resolution'] = meta[1][5]
+    return {key: _iso(info[key]) for key in COLUMNS}
+
+
+class Catalog:
+    """
+    SQLite catalog of the raw datalogger files of a deployment.
+
+    Every file is described by its table, time span and record range, read
+    from its frame headers (scan.scan_file). Updates only scan files that are
+    new or whose size or modification time changed, so the catalog can be kept
+    current cheaply, and files are ordered by time rather than by file name,
+    which does not survive logger renames or restarted numbering.
+
+    Args:
+        filename (str): Path of the SQLite database, created if missing.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, src_dir, patterns=('*.dat',), workers=8):
+        """
+        Bring the catalog up to date with the files of a directory.
+
+        Updates of the same catalog file from several threads run one after
+        the other, so they neither scan the same new files twice nor fail
+        with "database is locked".
+
+        Args:
+            src_dir (str): Directory of the datalogger files.
+            patterns (list): Glob patterns of the files, compressed files are
+                matched too (see scan.match_files).
+            workers (int): Number of files scanned at a time.
+
+        Returns:
+            tuple: Number of files scanned and number of files removed from the catalog.
+        """
+        with _update_lock(self.filename):
+            files = {os.path.abspath(f) for f in match_files(src_dir, patterns)}
+            known = {row['file']: (row['size'], row['mtime'])
+                     for row in self.db.execute('SELECT file, size, mtime FROM files')}
+            changed = sorted(f for f in files
+                             if known.get(f) != (os.path.getsize(f), os.path.getmtime(f)))
+            # only files below src_dir matching the patterns can have disappeared
+            prefix = os.path.join(os.path.abspath(src_dir), '')
+            gone = [f for f in known if f.startswith(prefix) and f not in files and matches(f, patterns)]
+            if not changed and not gone:
+                return 0, 0
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                entries = list(pool.map(_catalog_entry, changed))
+            with self.db:
+                self.db.executemany(INSERT, [[entry[key] for key in COLUMNS] for entry in entries])
+                self.db.executemany('DELETE FROM files WHERE file = ?', [(f,) for f in gone])
+        return len(changed), len(gone)
+
+    def files(self, table=None, start=None, end=None):
+        """
+        Catalog entries with records within [start, end), ordered by time.
+
+        Files whose time span could not be read are included.
+
+        Args:
+            table (str, optional): Table name, e.g. ts_data.
+            start (datetime or str, optional): Start of the period.
+            end (datetime or str, optional): End of the period (excluded).
+
+        Returns:
+            list: One dict per file with the keys of COLUMNS ('table_name' is the table).
+        """
+        query, args = 'SELECT * FROM files WHERE 1', []
+        if table is not None:
+            query += ' AND table_name = ?'
+            args.append(table)
+        if start is not None:
+            query += ' AND ("end" IS NULL OR "end" >= ?)'
+            args.append(_iso(start if isinstance(start, datetime) else datetime.fromisoformat(start)))
+        if end is not None:
+            query += ' AND (start IS NULL OR start < ?)'
+            args.append(_iso(end if isinstance(end, datetime) else datetime.fromisoformat(end)))
+        query += ' ORDER BY start, first_record, file'
+        return [dict(row) for row in self.db.execute(query, args)]
+
+    def byte_ranges(self, table, start=None, end=None):
+        """
+        Which file byte ranges cover [start, end) for a table.
+
+        For TOB3 files the range is narrowed to the frames holding the period
+        by a binary search over the frame headers; other files are covered as
+        a whole. The ranges can be passed to read_cs_files(byte_range=...).
+
+        Args:
+            table (str): Table name.
+            start (datetime or str, optional): Start of the period.
+            end (datetime or str, optional): End of the period (excluded).
+
+        Returns:
+            list: (file, first byte, end byte) tuples ordered by time.
+        """
+        ranges = []
+        for entry in self.files(table, start, end):
+            byte_range = self.byte_range(entry, start, end)
+            if byte_range is not None:
+                ranges.append((entry['file'],) + byte_range)
+        return ranges
+
+    def byte_range(self, entry, start=None, end=None):
+        """
+        Byte range of a catalogued file holding the records within [start, end).
+
+        The frames of a ring buffer file that has wrapped are searched in time
+        order (see scan.ring_wrap); if the period spans its wrap point, the
+        whole file is covered.
+
+        Args:
+            entry (dict): Catalog entry, from files.
+            start (datetime or str, optional): Start of the period.
+            end (datetime or str, optional): End of the period (excluded).
+
+        Returns:
+            tuple or None: (first byte, end byte), None if no frame is within the period.
+        """
+        start = datetime.fromisoformat(start) if isinstance(start, str) else start
+        end = datetime.fromisoformat(end) if isinstance(end, str) else end
+        if entry['filetype'] != 'TOB3' or entry['start'] is None:
+            return 0, entry['size']
+        # block archives only decompress the blocks of the probed frames
+        n_frames = entry['n_frames']
+        with cs.read_cs_open(entry['file']) as f:
+            wrap = ring_wrap(lambda i: _frame_time(f, entry, i), n_frames)
+            first = 0 if start is None else _first_frame_after(f, entry, start, wrap)
+            last = n_frames if end is None else _first_frame_after(f, entry, end, wrap)
+        first = max(first - 1, 0)  # the frame before may hold records within the period
+        if last <= first:
+            return None
+        # frames in time order -> frames in the file
+        first, last = (first + wrap) % n_frames, (last - 1 + wrap) % n_frames + 1
+        if last <= first:
+            # the period spans the wrap point, i.e. the end and the start of the file
+            first, last = 0, n_frames
+        return entry['data_start'] + first * entry['frame_size'], entry['data_start'] + last * entry['frame_size']
+
+
+def _frame_time(f, entry, i):
+    # time of the first record of frame i, None for an invalid frame
+    stamps = (entry['validation'], 2 ** 16 - 1 - entry['validation'])
+    f.seek(entry['data_start'] + i * entry['frame_size'])
+    frame = f.read(entry['frame_size'])
+    if len(frame) < entry['frame_size'] or \
+            FRAME_FOOTER.unpack_from(frame, len(frame) - FRAME_FOOTER.size)[1] not in stamps:
+        return None
+    return cs.read_cs_tob3_frame_header(frame, 0, cs.read_cs_tob3_resolution(entry['time_resolution']))[1]
+
+
+def _first_frame_after(f, entry, when, wrap=0):
+    # number of frames in time order before the first frame starting at or
+    # after when, by binary search; the frames of a ring buffer file that has
+    # wrapped are in time order from wrap on (see scan.ring_wrap)
+    target = (when - datetime(1990, 1, 1)).total_seconds()
+    n_frames = entry['n_frames']
+    lo, hi = 0, n_frames
+    while lo < hi:
+        mid = (lo + hi) // 2
+        probe = mid
+        t = _frame_time(f, entry, (probe + wrap) % n_frames)
+        while t is None and probe + 1 < hi:
+            # skip invalid frames to the next valid one
+            probe += 1
+            t = _frame_time(f, entry, (probe + wrap) % n_frames)
+        if t is None or t >= target:
+            hi = mid
+        else:
+            lo = probe + 1
+    return lo
+
+
+def find_files(src_dir, patterns, start=None, end=None):
+    """
+    Input files of a source directory matching table globs.
+
+    Args:
+        src_dir (str): Source directory.
+        patterns (list): Glob patterns, e.g. ['ts_data*.dat']; compressed files
+            (e.g. ts_data_1.dat.gz) are matched too, see scan.match_files.
+        start (str, optional): Only files with records from this time on.
+        end (str, optional): Only files with records before this time. The time
+            spans are read from the file headers (scan.scan_directory).
+
+    Returns:
+        list: Matching files in natural order, each once.
+    """
+    if start is not None or end is not None:
+        return natsorted(files_covering(scan_directory(src_dir, patterns), start, end))
+
+    return natsorted(match_files(src_dir, patterns))
+
+
+def plan_reads(src_dir, patterns, start=None, end=None, catalog=None):
+    """
+    Files to read for a period, with the byte ranges holding it.
+
+    Args:
+        src_dir (str): Source directory.
+        patterns (list): Glob patterns of the files.
+        start (str, optional): Start of the period.
+        end (str, optional): End of the period (excluded).
+        catalog (str, optional): Path of the SQLite catalog of the raw files (see
+            Catalog), brought up to date with src_dir first. Without a catalog the
+            files are found by find_files and always read as a whole.
+
+    Returns:
+        list: (filename, byte_range) tuples, in time order with a catalog and in
+              natural order otherwise; byte_range is None for a whole file.
+    """
+    if catalog is None:
+        return [(filename, None) for filename in find_files(src_dir, patterns, start, end)]
+
+    catalog = Catalog(catalog)
+    catalog.update(src_dir, patterns)
+    prefix = os.path.join(os.path.abspath(src_dir), '')
+    reads = []
+    for entry in catalog.files(start=start, end=end):
+        name = entry['file']
+        if not name.startswith(prefix) or not matches(name, patterns):
+            continue
+        if start is None and end is None:
+            reads.append((name, None))
+            continue
+        byte_range = catalog.byte_range(entry, start, end)
+        if byte_range is not None:
+            reads.append((name, byte_range))
+    catalog.close()
+    return reads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update and query the catalog of raw datalogger files.")
+    parser.add_argument('catalog', type=str, help='SQLite catalog file')
+    parser.add_argument('-s', '--src', type=str, default=None, help='folder to add to the catalog')
+    parser.add_argument('-p', '--pattern', type=str, action='append', default=None,
+                        help='glob pattern of the files (repeatable, default *.dat)')
+    parser.add_argument('-t', '--table', type=str, default=None, help='table to query')
+    parser.add_argument('--start', type=str, default=None, help='start of the period')
+    parser.add_argument('--end', type=str, default=None, help='end of the period (excluded)')
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.src:
+        scanned, removed = catalog.update(args.src, args.pattern or ['*.dat'])
+        print(f'{scanned} files scanned, {removed} removed')
+    if args.table:
+        for filename, first, last in catalog.byte_ranges(args.table, args.start, args.end):
+            print(f'{filename},{first},{last}')
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
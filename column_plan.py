@@ -0,0 +1,112 @@
+import configparser
+import numpy as np
+
+from read_cs_files import ALWAYS_READ
+
+
+# (unit logged by the datalogger, unit_in of the EddyPro metadata) -> factor
+UNIT_CONVERSIONS = {
+    ('umol/mol', 'mmol_m3'): 1 / 44,
+    ('umol/m^3', 'mmol_m3'): 1.,  # only relabelled, the logger value is already in mmol/m^3
+    ('mmol/mol', 'mmol_m3'): 1 / 0.018,
+    ('mmol/m^3', 'mmol_m3'): 1.,
+}
+
+# unit_in of the EddyPro metadata -> unit written to the decoded files
+UNIT_LABELS = {
+    'mmol_m3': 'mmol/m^3',
+}
+
+
+def compile_column_plan(file_meta):
+    """
+    Parse an EddyPro metadata file once into a column plan.
+
+    Args:
+        file_meta (str): EddyPro .metadata file (e.g. EddyPro/setx.metadata).
+
+    Returns:
+        list: One dict per described column, in column order, with the keys
+              'variable', 'unit_in', 'a_value', 'b_value' and 'calibrate'.
+              Column N of the metadata is entry N-1.
+    """
+    config = configparser.ConfigParser()
+    config.read(file_meta)
+    desc = config['FileDescription']
+
+    n_cols = max(int(key.split('_')[1]) for key in desc if key.startswith('col_'))
+    plan = []
+    for n in range(1, n_cols + 1):
+        a_value = float(desc.get(f'col_{n}_a_value', '1') or 1)
+        b_value = float(desc.get(f'col_{n}_b_value', '0') or 0)
+        plan.append({
+            'variable': desc.get(f'col_{n}_variable', 'ignore'),
+            'unit_in': desc.get(f'col_{n}_unit_in', ''),
+            'a_value': a_value,
+            'b_value': b_value,
+            # with a conversion set, EddyPro applies gain and offset itself
+            'calibrate': not desc.get(f'col_{n}_conversion', '') and (a_value, b_value) != (1., 0.),
+        })
+    return plan
+
+
+def plan_columns(plan, names):
+    """
+    Names of the decoded columns the plan needs.
+
+    Args:
+        plan (list): Column plan from compile_column_plan.
+        names (list): Column names of the decoded file (meta[2]).
+
+    Returns:
+        list: Column names that are not ignored. Columns beyond the ones described
+              in the metadata are kept, and so are TIMESTAMP and RECORD
+              (read_cs_files.ALWAYS_READ) even if the metadata ignores them:
+              process_ts.DayWriter drops repeated records by RECORD.
+    """
+    return [name for i, name in enumerate(names)
+            if i >= len(plan) or plan[i]['variable'] != 'ignore' or name in ALWAYS_READ]
+
+
+def apply_column_plan(plan, bin_data, meta):
+    """
+    Apply unit conversion and calibration of a column plan to decoded columns.
+
+    Ignored columns are left as they are; load_data does not decode them and
+    passes None, so they are written as empty fields and the column numbers of
+    the metadata stay valid.
+
+    Args:
+        plan (list): Column plan from compile_column_plan.
+        bin_data (list): Decoded columns (bycol=True), in the order of meta[2].
+        meta (list): Metadata of the decoded file, meta[2] names and meta[3] units.
+
+    Returns:
+        tuple: A tuple containing:
+            - bin_data (list): Converted columns.
+            - meta (list): Metadata with meta[3] holding the converted units.
+    """
+    if len(meta[2]) < len(plan):
+        print(f'Warning: the metadata describes {len(plan)} columns, '
+              f'but the file only has {len(meta[2])}')
+
+    units = list(meta[3])
+    bin_data = list(bin_data)
+    for i, column in enumerate(plan[:len(bin_data)]):
+        if column['variable'] in ['ignore', 'not_numeric'] or bin_data[i] is None:
+            continue
+
+        scale, offset = 1., 0.
+        key = (units[i], column['unit_in'])
+        if key in UNIT_CONVERSIONS:
+            scale = UNIT_CONVERSIONS[key]
+            units[i] = UNIT_LABELS.get(column['unit_in'], units[i])
+        if column['calibrate']:
+            scale, offset = scale * column['a_value'], offset + column['b_value']
+
+        if (scale, offset) != (1., 0.):
+            bin_data[i] = np.asarray(bin_data[i], dtype=float) * scale + offset
+
+    meta = list(meta)
+    meta[3] = units
+    return bin_data, meta
@@ -0,0 +1,235 @@
+import os
+import struct
+import asyncio
+import argparse
+import fnmatch
+import ftplib
+import calendar
+from datetime import datetime
+
+
+def _connect(host, user, passwd):
+    # host may carry a port, e.g. localhost:2121 for a local stand-in server
+    name, _, port = host.partition(':')
+    ftp = ftplib.FTP()
+    ftp.connect(name, int(port) if port else 21)
+    ftp.login(user, passwd)
+    return ftp
+
+
+def list_remote(host, user='anonymous', passwd='', remote_dir='/'):
+    """
+    List the files on the datalogger FTP server with their size and modification time.
+
+    Args:
+        host (str): Address of the datalogger, optionally with a port (host:port).
+        user (str): FTP user.
+        passwd (str): FTP password.
+        remote_dir (str): Folder on the datalogger.
+
+    Returns:
+        dict: File name -> (size in bytes, modification time as seconds since the epoch or None).
+    """
+    with _connect(host, user, passwd) as ftp:
+        ftp.cwd(remote_dir)
+        ftp.voidcmd('TYPE I')
+        files = {}
+        try:
+            for name, facts in ftp.mlsd(facts=['type', 'size', 'modify']):
+                if facts.get('type') == 'file':
+                    files[name] = (int(facts['size']), _ftp_time(facts.get('modify')))
+        except ftplib.error_perm:
+            # loggers without MLSD: fall back to NLST, SIZE and MDTM
+            for name in ftp.nlst():
+                try:
+                    size = ftp.size(name)
+                except ftplib.error_perm:
+                    continue  # a folder
+                try:
+                    mtime = _ftp_time(ftp.sendcmd(f'MDTM {name}').split()[-1])
+                except ftplib.error_perm:
+                    mtime = None
+                files[name] = (size, mtime)
+    return files
+
+
+def _ftp_time(value):
+    # YYYYMMDDHHMMSS[.sss] in UTC as seconds since the epoch
+    if not value:
+        return None
+    return calendar.timegm(datetime.strptime(value[:14], '%Y%m%d%H%M%S').timetuple())
+
+
+def verify_tob3_tail(filename, start=0):
+    """
+    Check the frames of a TOB3 file from a byte position to the end.
+
+    Args:
+        filename (str): TOB3 file.
+        start (int): Byte position from which frames are checked, e.g. the
+            size of the file before the last download.
+
+    Returns:
+        tuple: A tuple containing:
+            - good_end (int): End of the valid frames following start, i.e. the
+              start of the first frame with a wrong validation stamp or cut off
+              at the end of the file.
+            - n_valid (int): Number of valid frames checked.
+            - n_invalid (int): Number of frames from good_end to the end of the file.
+    """
+    with open(filename, 'rb') as f:
+        if not f.readline().startswith(b'"TOB3"'):
+            return os.path.getsize(filename), 0, 0
+        f.seek(0)
+        meta = [f.readline().rstrip().decode().replace('"', '').split(',') for _ in range(6)]
+        data_start = f.tell()
+        framesize = int(meta[1][2])
+        validation = int(meta[1][4])
+        stamps = (validation, 2 ** 16 - 1 - validation)
+
+        filesize = os.path.getsize(filename)
+        first = max(0, (start - data_start) // framesize)
+        f.seek(data_start + first * framesize)
+        good_end = data_start + first * framesize
+        n_valid = 0
+        while True:
+            frame = f.read(framesize)
+            if len(frame) < framesize or struct.unpack_from('<HH', frame, framesize - 4)[1] not in stamps:
+                break
+            n_valid += 1
+            good_end = f.tell()
+    n_invalid = -(-(filesize - good_end) // framesize)
+    return good_end, n_valid, n_invalid
+
+
+def fetch_file(host, name, size, mtime, dest, user='anonymous', passwd='', remote_dir='/'):
+    """
+    Download one file, resuming from the local copy if the remote file has grown.
+
+    Files whose local copy has the remote size and modification time are skipped.
+    A file that has grown only has its new bytes transferred. For TOB3 files the
+    newly received frames are validated, and invalid frames at the end (e.g. a
+    frame cut off while it was written) are fetched once more. If they are
+    still invalid, the copy on the logger is taken to be corrupt: only the
+    valid frames are kept, and the file is not downloaded again until its
+    modification time on the logger changes.
+
+    Args:
+        host (str): Address of the datalogger.
+        name (str): File name on the datalogger.
+        size (int): Remote size in bytes.
+        mtime (float or None): Remote modification time.
+        dest (str): Local folder.
+        user (str): FTP user.
+        passwd (str): FTP password.
+        remote_dir (str): Folder on the datalogger.
+
+    Returns:
+        str or None: The local path if new data was received, otherwise None.
+    """
+    path = os.path.join(dest, name)
+    local_size = os.path.getsize(path) if os.path.exists(path) else 0
+    local_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+    if local_size == size and (mtime is None or local_mtime == mtime):
+        return None
+    if local_size < size and mtime is not None and local_mtime == mtime:
+        # the rest of this version of the file is corrupt, see below
+        return None
+    if local_size > size or (local_size == size and mtime is not None):
+        # rewritten on the logger, download it again
+        local_size = 0
+
+    total_valid, start = 0, local_size
+    with _connect(host, user, passwd) as ftp:
+        ftp.cwd(remote_dir)
+        ftp.voidcmd('TYPE I')
+        for attempt in range(2):
+            with open(path, 'ab' if start else 'wb') as f:
+                f.truncate(start)
+                ftp.retrbinary(f'RETR {name}', f.write, blocksize=1 << 16, rest=start or None)
+            good_end, n_valid, n_invalid = verify_tob3_tail(path, start)
+            total_valid += n_valid
+            if not n_invalid:
+                break
+            # fetch the invalid frames once more
+            start = good_end
+
+    if n_invalid:
+        print(f'{name}: {n_invalid} invalid frames after byte {good_end} on the logger, '
+              f'only the valid frames are kept')
+        with open(path, 'r+b') as f:
+            f.truncate(good_end)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+    print(f'Downloaded {name}: {os.path.getsize(path) - local_size} bytes ({total_valid} new frames)')
+    return path
+
+
+async def download_tables(host, dest, patterns=('*.dat',), workers=3,
+                          user='anonymous', passwd='', remote_dir='/', on_file=None):
+    """
+    Download datalogger files concurrently.
+
+    Transfers run in threads, at most workers at a time since the logger only
+    accepts a few FTP connections. Every file that received data is passed to
+    on_file as soon as its transfer is done, e.g. watch.Watcher.update_file,
+    so it is decoded while the other transfers go on. on_file runs in a
+    thread, for one file at a time.
+
+    Args:
+        host (str): Address of the datalogger.
+        dest (str): Local folder.
+        patterns (list): Glob patterns of the files to download.
+        workers (int): Maximum number of concurrent transfers.
+        user (str): FTP user.
+        passwd (str): FTP password.
+        remote_dir (str): Folder on the datalogger.
+        on_file (callable, optional): Called with the local path of every file
+            that received data.
+
+    Returns:
+        list: Local paths of the files that received data.
+    """
+    os.makedirs(dest, exist_ok=True)
+    remote = await asyncio.to_thread(list_remote, host, user, passwd, remote_dir)
+    names = sorted(name for name in remote if any(fnmatch.fnmatch(name, p) for p in patterns))
+
+    limit = asyncio.Semaphore(workers)
+    handing_on = asyncio.Lock()
+
+    async def fetch(name):
+        async with limit:
+            path = await asyncio.to_thread(fetch_file, host, name, *remote[name], dest,
+                                           user, passwd, remote_dir)
+        # the transfer slot is free again while the file is handed on
+        if path is not None and on_file is not None:
+            async with handing_on:
+                await asyncio.to_thread(on_file, path)
+        return path
+
+    paths = await asyncio.gather(*(fetch(name) for name in names))
+    return [path for path in paths if path is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download datalogger files.")
+    parser.add_argument('--host', type=str, default='63.46.27.48', help='datalogger address')
+    parser.add_argument('-d', '--dest', type=str, default='Download', help='local folder')
+    parser.add_argument('-p', '--pattern', type=str, action='append', default=None,
+                        help='glob pattern of files to download (repeatable, default *.dat)')
+    parser.add_argument('-w', '--workers', type=int, default=3, help='concurrent transfers')
+    parser.add_argument('--user', type=str, default='anonymous', help='FTP user')
+    parser.add_argument('--passwd', type=str, default='', help='FTP password')
+    args = parser.parse_args()
+
+    print(f"Download started at {datetime.now()}")
+    paths = asyncio.run(download_tables(args.host, args.dest, args.pattern or ['*.dat'],
+                                        workers=args.workers, user=args.user, passwd=args.passwd))
+    print(f"{len(paths)} files received new data")
+    print(f"Download finished at {datetime.now()}")
+
+
+if __name__ == "__main__":
+    main()
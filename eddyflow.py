@@ -0,0 +1,243 @@
+import os
+import csv
+import argparse
+from datetime import datetime
+
+import read_cs_files as cs
+from formats import FORMATS
+
+# The processing modules, pandas and numpy are imported by the commands that
+# use them, so that small jobs such as decoding files to text start quickly
+# (decode builds no DataFrame unless Parquet output is requested).
+
+
+def decode_text(filename, file_output, file_meta=None, start=None, end=None):
+    """
+    Decode a file to a text file without building a DataFrame.
+
+    The layout is that of ingest.write_frame: a row of quoted units, the column
+    names and the records, with timestamps to the millisecond.
+
+    Args:
+        filename (str): CS file to decode.
+        file_output (str): Text file to write.
+        file_meta (str, optional): EddyPro metadata for column selection and unit conversion.
+        start (str, optional): Only write records from this time on.
+        end (str, optional): Only write records before this time.
+
+    Returns:
+        int: Number of records written.
+    """
+    from manifest import atomic_write
+    from profiling import stage
+
+    with stage('decode', file=filename) as decoding:
+        if file_meta:
+            from column_plan import compile_column_plan, apply_column_plan, plan_columns
+            plan = compile_column_plan(file_meta)
+            full_meta = cs.read_cs_files(filename, metaonly=True)
+            data, meta, qc = cs.read_cs_files(filename, columns=plan_columns(plan, full_meta[2]), report=True)
+            if data:
+                data_by_name = dict(zip(meta[2], data))
+                data = [data_by_name.get(name) for name in full_meta[2]]
+            data, meta = apply_column_plan(plan, data, full_meta)
+        else:
+            data, meta, qc = cs.read_cs_files(filename, report=True)
+        if meta is False:
+            raise ValueError(f'{filename} is not a TOA5, TOB1, TOB3 or CSIXML file')
+        decoding.add(bytes=os.path.getsize(filename), records=len(data[0]) if data else 0,
+                     frames=qc.get('frames'), rejected_frames=qc.get('rejected_frames'))
+
+    n_records = len(data[0]) if data else 0
+    columns = [[''] * n_records if column is None else column for column in data]
+    rows = zip(*columns)
+    start = datetime.fromisoformat(start) if start else None
+    end = datetime.fromisoformat(end) if end else None
+    # TOA5 and CSIXML timestamps stay text and are compared with the bounds as
+    # text in the same format, which orders like the times
+    start_text = start.isoformat(sep=' ') if start else None
+    end_text = end.isoformat(sep=' ') if end else None
+
+    n_written = 0
+    with stage('write', file=file_output, format='text') as writing:
+        with atomic_write(file_output, 'w', encoding='utf-8', newline='') as f:
+            f.write(','.join('"{}"'.format(item) for item in meta[3]) + '\n')
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(meta[2])
+            for row in rows:
+                timestamp = row[0]
+                if isinstance(timestamp, datetime):
+                    if (start and timestamp < start) or (end and timestamp >= end):
+                        continue
+                    row = (timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],) + row[1:]
+                elif isinstance(timestamp, str) and (start or end):
+                    text = timestamp.replace('T', ' ', 1)
+                    if (start and text < start_text) or (end and text >= end_text):
+                        continue
+                writer.writerow(row)
+                n_written += 1
+        writing.add(records=n_written, bytes=os.path.getsize(file_output))
+    return n_written
+
+
+def run_decode(args):
+    # every input file to one output file of the same name
+    from glob import glob
+    from natsort import natsorted
+    files = natsorted({f for pattern in args.patterns for f in glob(os.path.join(args.src, pattern))})
+    os.makedirs(args.dst, exist_ok=True)
+    outputs = []
+    for f in files:
+        name = os.path.basename(f)
+        if os.path.splitext(name)[1] in cs.COMPRESSED_SUFFIXES:
+            name = os.path.splitext(name)[0]
+        outputs.append(os.path.join(args.dst, f'{os.path.splitext(name)[0]}.{args.format}'))
+
+    if args.format == 'parquet':
+        from column_plan import compile_column_plan
+        from ingest import decode_files, select_period, write_frame
+        plan = compile_column_plan(args.meta) if args.meta else None
+        decoded = decode_files(files, plan, args.workers, args.cache_dir, float64=args.float64)
+        for (filename, df, meta), file_output in zip(decoded, outputs):
+            df = select_period(df, args.start, args.end)
+            write_frame(df, file_output, args.format)
+            print(f'{filename} -> {file_output} ({len(df)} records)')
+        return
+
+    jobs = [(f, o, args.meta, args.start, args.end) for f, o in zip(files, outputs)]
+    if args.workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            counts = list(pool.map(decode_text, *zip(*jobs))) if jobs else []
+    else:
+        counts = [decode_text(*job) for job in jobs]
+    for filename, file_output, n_records in zip(files, outputs, counts):
+        print(f'{filename} -> {file_output} ({n_records} records)')
+
+
+def catalog_path(args):
+    # the raw file catalog is kept next to the outputs unless disabled
+    if args.no_catalog:
+        return None
+    return args.catalog or os.path.join(args.dst, 'catalog.sqlite')
+
+
+def run_split_days(args):
+    from process_ts import process_files_by_day
+    for table in args.tables:
+        dst_dir = os.path.join(args.dst, table)
+        os.makedirs(dst_dir, exist_ok=True)
+        process_files_by_day(table, args.src, dst_dir, args.meta, args.glob, args.workers,
+                             args.cache_dir, args.start, args.end, args.format, catalog_path(args),
+                             float64=args.float64)
+
+
+def run_monthly(args):
+    from process_metdata import process_monthly
+    for table in args.tables:
+        dst_dir = os.path.join(args.dst, table)
+        os.makedirs(dst_dir, exist_ok=True)
+        process_monthly(table, args.src, dst_dir, args.cutoff, args.glob, args.workers,
+                        args.cache_dir, args.start, args.end, args.format, catalog_path(args),
+                        float64=args.float64)
+
+
+def run_monitor(args):
+    from process_monitor import process_monitor
+    for table in args.tables:
+        dst_dir = os.path.join(args.dst, table)
+        os.makedirs(dst_dir, exist_ok=True)
+        process_monitor(table, args.src, dst_dir, args.freq, args.glob, args.workers,
+                        args.cache_dir, args.start, args.end, args.format, catalog_path(args),
+                        float64=args.float64)
+
+
+def run_flux(args):
+    import pandas as pd
+    from estimate_flux import estimate_month
+
+    # every month overlapping [start, end)
+    start = pd.Timestamp(args.start).to_period('M')
+    end = (pd.Timestamp(args.end) - pd.Timedelta(microseconds=1)).to_period('M') if args.end else start
+    for month in pd.period_range(start, end, freq='M'):
+        print(f'Flux estimation for {month}')
+        estimate_month(month.year, month.month, args.proj, args.input, args.meta, args.raw,
+                       args.out_path, shard=args.shard, workers=args.workers, eddypro=args.eddypro)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='eddyflow', description="Eddy covariance data processing.")
+    parser.add_argument('--profile', type=str, default=None,
+                        help='log the time, bytes, records and memory of every stage to this JSON lines file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # options shared by the commands reading datalogger files
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-s', '--src', type=str, default='../../DataLogger/CRD/', help='datalogger files')
+    common.add_argument('-d', '--dst', type=str, default='../../decoded_data', help='output root folder')
+    common.add_argument('--start', type=str, default=None, help='first time to process, e.g. 2025-09-01')
+    common.add_argument('--end', type=str, default=None, help='time to process up to (excluded)')
+    common.add_argument('-w', '--workers', type=int, default=1, help='number of decoding processes')
+    common.add_argument('--cache-dir', type=str, default=None, help='cache of decoded files')
+    common.add_argument('--float64', action='store_true',
+                        help='keep floating point columns in double precision (default float32)')
+
+    tables = argparse.ArgumentParser(add_help=False)
+    tables.add_argument('tables', nargs='+', help='table names, e.g. ts_data')
+    tables.add_argument('-g', '--glob', type=str, action='append', default=None,
+                        help='glob pattern of the input files (repeatable, default <table>*.dat)')
+    tables.add_argument('--catalog', type=str, default=None,
+                        help='SQLite catalog of the raw files (default <dst>/catalog.sqlite)')
+    tables.add_argument('--no-catalog', action='store_true', help='glob the source folder instead of the catalog')
+
+    sub = subparsers.add_parser('decode', parents=[common], help='decode files one to one')
+    sub.add_argument('patterns', nargs='+', help='glob patterns of the files, e.g. "ts_data*.dat"')
+    sub.add_argument('-m', '--meta', type=str, default=None,
+                     help='EddyPro metadata for column selection and unit conversion')
+    sub.add_argument('-f', '--format', choices=FORMATS, default='csv', help='output format')
+    sub.set_defaults(func=run_decode)
+
+    sub = subparsers.add_parser('split-days', parents=[common, tables], help='write day files for EddyPro')
+    sub.add_argument('-m', '--meta', type=str, default='EddyPro/setx.metadata',
+                     help='EddyPro metadata for column selection and unit conversion')
+    sub.add_argument('-f', '--format', choices=FORMATS, default='dat', help='output format')
+    sub.set_defaults(func=run_split_days)
+
+    sub = subparsers.add_parser('monthly', parents=[common, tables], help='write monthly files')
+    sub.add_argument('--cutoff', type=str, default=None, help='drop data before this time')
+    sub.add_argument('-f', '--format', choices=FORMATS, default='csv', help='output format')
+    sub.set_defaults(func=run_monthly)
+
+    sub = subparsers.add_parser('monitor', parents=[common, tables], help='average monitor tables')
+    sub.add_argument('--freq', type=str, default='30min', help='averaging interval')
+    sub.add_argument('-f', '--format', choices=FORMATS, default='csv', help='output format')
+    sub.set_defaults(func=run_monitor)
+
+    sub = subparsers.add_parser('flux', help='estimate fluxes with EddyPro, month by month')
+    sub.add_argument('--start', type=str, required=True, help='first month, e.g. 2025-09')
+    sub.add_argument('--end', type=str, default=None, help='end of the period (excluded), e.g. 2025-12')
+    sub.add_argument('-p', '--proj', type=str, required=True, help='Project folder')
+    sub.add_argument('-i', '--input', type=str, required=True, help='input filename')
+    sub.add_argument('-f', '--meta', type=str, required=True, help='meta filename')
+    sub.add_argument('-r', '--raw', type=str, required=True, help='folder for raw files')
+    sub.add_argument('-o', '--out_path', type=str, required=True, help='folder for outputs')
+    sub.add_argument('-s', '--shard', type=str, default='month', choices=['month', 'week', 'day'],
+                     help='length of the EddyPro runs a month is split into')
+    sub.add_argument('-w', '--workers', type=int, default=None, help='maximum number of concurrent EddyPro runs')
+    sub.add_argument('-e', '--eddypro', type=str, default='eddypro_rp', help='EddyPro executable')
+    sub.set_defaults(func=run_flux)
+
+    args = parser.parse_args()
+    if args.profile:
+        from profiling import enable
+        enable(args.profile)
+    print(f"eddyflow {args.command} started at {datetime.now()}")
+    args.func(args)
+    print(f"eddyflow {args.command} finished at {datetime.now()}")
+    if args.profile:
+        from profiling import print_summary
+        print_summary(args.profile)
+
+
+if __name__ == "__main__":
+    main()
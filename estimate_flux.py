@@ -1,38 +1,31 @@
 import os
+import re
+import glob
+import csv
 import argparse
 import configparser
 import calendar
-import numpy as np
-from datetime import datetime, timezone
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
+from profiling import stage
 
-def main():
-    parser = argparse.ArgumentParser(description="Find number of days in a month.")
 
-    # Add arguments for month and year
-    parser.add_argument('-m', '--month', type=int, required=True, help='Month number (1–12)')
-    parser.add_argument('-y', '--year', type=int, required=True, help='Year (e.g., 2025)')
-    parser.add_argument('-p', '--proj', type=str, required=True, help='Project folder')
-    parser.add_argument('-i', '--input', type=str, required=True, help='input filename')
-    parser.add_argument('-f', '--meta', type=str, required=True, help='meta filename')
-    parser.add_argument('-r', '--raw', type=str, required=True, help='folder for raw files')
-    parser.add_argument('-o', '--out_path', type=str, required=True, help='folder for outputs')
-    args = parser.parse_args()
+def month_window(year, month):
+    """
+    Return the processing window EddyPro uses for one month.
 
-    if not (1 <= args.month <= 12):
-        parser.error("Month must be between 1 and 12.")
+    The window starts at 23:30 on the last day of the previous month and
+    ends at 23:30 on the last day of the month.
 
-    # Compute days
-    proj_dir  = args.proj
-    file_eddypro = f'{proj_dir}/{args.input}'
-    file_meta = args.meta
-    dir_raw = args.raw
-    dir_outpath = args.out_path
-
-    year = args.year
-    month = args.month
+    Args:
+        year (int): Year of the month to process.
+        month (int): Month number (1-12).
 
+    Returns:
+        tuple: (start, end) as datetime objects.
+    """
     if month == 1:
         prev_month = 12
         prev_year = year - 1
@@ -43,16 +36,66 @@ def main():
     prev_num_days = calendar.monthrange(prev_year, prev_month)[1]
     num_days = calendar.monthrange(year, month)[1]
 
-    # Format to always be 2 digits
-    prev_month_str = f"{prev_month:02d}"
-    prev_num_days_str = f"{prev_num_days:02d}"
-    prev_year_str = f"{prev_year:04d}"
+    start = datetime(prev_year, prev_month, prev_num_days, 23, 30)
+    end = datetime(year, month, num_days, 23, 30)
+    return start, end
+
+
+def split_window(start, end, shard='month'):
+    """
+    Split a processing window into contiguous shards.
+
+    Args:
+        start (datetime): Start of the processing window.
+        end (datetime): End of the processing window.
+        shard (str): Shard length, one of 'month', 'week' or 'day'.
+
+    Returns:
+        list: List of (start, end) datetime tuples covering the window.
+    """
+    steps = {'month': None, 'week': timedelta(days=7), 'day': timedelta(days=1)}
+    if shard not in steps:
+        raise ValueError(f"Unknown shard length '{shard}', use one of {list(steps)}")
+
+    if steps[shard] is None:
+        return [(start, end)]
 
-    month_str = f"{month:02d}"
-    num_days_str = f"{num_days:02d}"
-    year_str = f"{year:04d}"
+    shards = []
+    shard_start = start
+    while shard_start < end:
+        shard_end = min(shard_start + steps[shard], end)
+        shards.append((shard_start, shard_end))
+        shard_start = shard_end
+    return shards
 
-    filename =  f'{proj_dir}/software/eddyflow/EddyPro/setx_{year_str}{month_str}{num_days_str}.eddypro'
+
+def write_project_file(file_eddypro, filename, start, end, proj_dir, file_meta,
+                       dir_raw, out_path, window=None, pf_file=None, to_file=None):
+    """
+    Write an EddyPro project file for one processing window from the template.
+
+    Args:
+        file_eddypro (str): Template .eddypro project file.
+        filename (str): Path of the project file to write.
+        start (datetime): Start of the processing window.
+        end (datetime): End of the processing window.
+        proj_dir (str): Project folder.
+        file_meta (str): Metadata filename, relative to the project folder.
+        dir_raw (str): Folder of raw files, relative to the project folder.
+        out_path (str): Output folder of this run.
+        window (tuple, optional): (start, end) of the full processing window used
+            for tilt correction and time lag optimisation. Defaults to (start, end).
+        pf_file (str, optional): Planar fit file of an earlier run (see step_files),
+            used instead of fitting again over the window.
+        to_file (str, optional): Time lag file of an earlier run, used instead of
+            optimising the time lags again over the window.
+
+    Returns:
+        str: The filename of the written project file.
+    """
+    if window is None:
+        window = (start, end)
+    win_start, win_end = window
 
     config = configparser.ConfigParser()
     config.read(file_eddypro)
@@ -61,38 +104,45 @@ def main():
     current_time = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
     config['Project']['creation_date'] = current_time
     config['Project']['last_change_date'] = current_time
-    config['Project']['pr_start_date'] = f'{prev_year_str}-{prev_month_str}-{prev_num_days_str}'
-    config['Project']['pr_end_date'] = f'{year_str}-{month_str}-{num_days_str}'
-    config['Project']['pr_start_time'] = '23:30'
-    config['Project']['pr_end_time'] = '23:30'
+    config['Project']['pr_start_date'] = start.strftime('%Y-%m-%d')
+    config['Project']['pr_end_date'] = end.strftime('%Y-%m-%d')
+    config['Project']['pr_start_time'] = start.strftime('%H:%M')
+    config['Project']['pr_end_time'] = end.strftime('%H:%M')
     config['Project']['file_name'] = filename
     config['Project']['proj_file'] = f'{proj_dir}/{file_meta}'
-    config['Project']['out_path'] = f'{proj_dir}/{dir_outpath}/{year_str}-{month_str}'
+    config['Project']['out_path'] = out_path
 
-    os.makedirs(f'{proj_dir}/{dir_outpath}/{year_str}-{month_str}', exist_ok=True)
+    os.makedirs(out_path, exist_ok=True)
 
     # FluxCorrection_SpectralAnalysis_General
-    config['FluxCorrection_SpectralAnalysis_General']['sa_start_date'] = f'{prev_year_str}-{prev_month_str}-{prev_num_days_str}'
-    config['FluxCorrection_SpectralAnalysis_General']['sa_start_time'] = '23:30'
-    config['FluxCorrection_SpectralAnalysis_General']['sa_end_date'] = f'{year_str}-{month_str}-{num_days_str}'
-    config['FluxCorrection_SpectralAnalysis_General']['sa_end_time'] = '23:30'
-    config['FluxCorrection_SpectralAnalysis_General']['ex_file'] = f'{proj_dir}/{dir_outpath}/{year_str}-{month_str}/eddypro_1_fluxnet_adv.csv'
+    config['FluxCorrection_SpectralAnalysis_General']['sa_start_date'] = start.strftime('%Y-%m-%d')
+    config['FluxCorrection_SpectralAnalysis_General']['sa_start_time'] = start.strftime('%H:%M')
+    config['FluxCorrection_SpectralAnalysis_General']['sa_end_date'] = end.strftime('%Y-%m-%d')
+    config['FluxCorrection_SpectralAnalysis_General']['sa_end_time'] = end.strftime('%H:%M')
+    config['FluxCorrection_SpectralAnalysis_General']['ex_file'] = f'{out_path}/eddypro_1_fluxnet_adv.csv'
 
     # RawProcess_General
     config['RawProcess_General']['data_path'] = f'{proj_dir}/{dir_raw}'
 
     # RawProcess_TiltCorrection_Settings
-    config['RawProcess_TiltCorrection_Settings']['pf_start_date'] = f'{year_str}-{month_str}-{num_days_str}'
-    config['RawProcess_TiltCorrection_Settings']['pf_start_time'] = '23:30'
-    config['RawProcess_TiltCorrection_Settings']['pf_end_date'] = f'{prev_year_str}-{prev_month_str}-{prev_num_days_str}'
-    config['RawProcess_TiltCorrection_Settings']['pf_end_time'] = '23:30'
+    config['RawProcess_TiltCorrection_Settings']['pf_start_date'] = win_end.strftime('%Y-%m-%d')
+    config['RawProcess_TiltCorrection_Settings']['pf_start_time'] = win_end.strftime('%H:%M')
+    config['RawProcess_TiltCorrection_Settings']['pf_end_date'] = win_start.strftime('%Y-%m-%d')
+    config['RawProcess_TiltCorrection_Settings']['pf_end_time'] = win_start.strftime('%H:%M')
 
     # RawProcess_TimelagOptimization_Settings
-    config['RawProcess_TimelagOptimization_Settings']['to_start_date'] = f'{year_str}-{month_str}-{num_days_str}'
-    config['RawProcess_TimelagOptimization_Settings']['to_start_time'] = '23:30'
-    config['RawProcess_TimelagOptimization_Settings']['to_end_date'] = f'{prev_year_str}-{prev_month_str}-{prev_num_days_str}'
-    config['RawProcess_TimelagOptimization_Settings']['to_end_time'] = '23:30'
+    config['RawProcess_TimelagOptimization_Settings']['to_start_date'] = win_end.strftime('%Y-%m-%d')
+    config['RawProcess_TimelagOptimization_Settings']['to_start_time'] = win_end.strftime('%H:%M')
+    config['RawProcess_TimelagOptimization_Settings']['to_end_date'] = win_start.strftime('%Y-%m-%d')
+    config['RawProcess_TimelagOptimization_Settings']['to_end_time'] = win_start.strftime('%H:%M')
 
+    # results of an earlier run are read instead of computed (mode 0)
+    if pf_file:
+        config['RawProcess_TiltCorrection_Settings']['pf_mode'] = '0'
+        config['RawProcess_TiltCorrection_Settings']['pf_file'] = pf_file
+    if to_file:
+        config['RawProcess_TimelagOptimization_Settings']['to_mode'] = '0'
+        config['RawProcess_TimelagOptimization_Settings']['to_file'] = to_file
 
     # Write to a file
     with open(filename, 'w') as configfile:
@@ -100,10 +150,233 @@ def main():
         config.write(configfile, space_around_delimiters=False)
 
     print(f'{filename} file has been written!')
+    return filename
+
+
+def step_files(out_path):
+    """
+    Planar fit and time lag files written by an EddyPro run.
+
+    Args:
+        out_path (str): Output folder of the run.
+
+    Returns:
+        tuple: (planar fit file, time lag file), None for a file the run did not
+               write (e.g. without planar fit tilt correction).
+    """
+    found = []
+    for step in ('planar_fit', 'timelag_opt'):
+        files = sorted(glob.glob(os.path.join(out_path, f'eddypro_*_{step}_*.txt')))
+        found.append(files[-1] if files else None)
+    return tuple(found)
+
+
+def run_eddypro(filename, log_file, eddypro='eddypro_rp', env_dir=None):
+    """
+    Run EddyPro on one project file, streaming its output to a log file.
+
+    Args:
+        filename (str): EddyPro project file to process.
+        log_file (str): File receiving stdout and stderr of the run.
+        eddypro (str): EddyPro executable.
+        env_dir (str, optional): Working environment folder passed with -e, so
+            concurrent runs do not share EddyPro's tmp folder.
+
+    Returns:
+        int: Return code of the EddyPro process.
+    """
+    cmd = [eddypro, '-s', 'linux']
+    if env_dir is not None:
+        os.makedirs(os.path.join(env_dir, 'ini'), exist_ok=True)
+        os.makedirs(os.path.join(env_dir, 'tmp'), exist_ok=True)
+        cmd += ['-e', env_dir]
+    cmd.append(filename)
+
+    with stage('eddypro', project=filename) as running, open(log_file, 'w') as log:
+        proc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT)
+        running.add(returncode=proc.returncode)
+    return proc.returncode
+
+
+def run_shards(projects, workers=None, eddypro='eddypro_rp'):
+    """
+    Run EddyPro on several project files concurrently.
+
+    Args:
+        projects (list): List of (project file, output folder) tuples.
+        workers (int, optional): Maximum number of concurrent EddyPro processes.
+            Defaults to the number of CPUs.
+        eddypro (str): EddyPro executable.
+
+    Raises:
+        RuntimeError: If any of the EddyPro runs failed.
+    """
+    workers = workers or os.cpu_count() or 1
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for filename, out_path in projects:
+            log_file = os.path.join(out_path, 'eddypro.log')
+            env_dir = os.path.join(out_path, 'env') if len(projects) > 1 else None
+            futures[pool.submit(run_eddypro, filename, log_file, eddypro, env_dir)] = (filename, log_file)
+
+        for future in as_completed(futures):
+            filename, log_file = futures[future]
+            returncode = future.result()
+            if returncode != 0:
+                failed.append(filename)
+                print(f'EddyPro failed on {filename} (exit code {returncode}), see {log_file}')
+            else:
+                print(f'EddyPro finished {filename}')
+
+    if failed:
+        raise RuntimeError(f'{len(failed)} of {len(projects)} EddyPro runs failed')
+
+
+def _fluxnet_run_time(fname):
+    # EddyPro names its outputs after the start of the run, e.g.
+    # eddypro_1_fluxnet_2025-10-01T000000_adv.csv; the modification time
+    # orders runs started in the same second
+    match = re.search(r'_fluxnet_(\d{4}-\d{2}-\d{2}T\d{6})', os.path.basename(fname))
+    return (match.group(1) if match else '', os.path.getmtime(fname))
+
+
+def _row_time(value):
+    # TIMESTAMP_START of the FLUXNET output (YYYYMMDDHHMM); rows whose first
+    # column is not a time are sorted after the others
+    for fmt in ('%Y%m%d%H%M', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return 0, datetime.strptime(value, fmt), value
+        except ValueError:
+            pass
+    return 1, datetime.min, value
+
+
+def merge_fluxnet_outputs(shard_dirs, merged_file):
+    """
+    Merge the eddypro_*_fluxnet_*adv.csv outputs of several shards into one file.
+
+    A shard folder holds one output per EddyPro run, so a shard that was run
+    again holds several. They are read from the oldest to the newest run,
+    and the shards in the given order, so a row repeated at a shard boundary
+    or by a later run is taken from the last file. Rows are sorted by the
+    time in their first column (TIMESTAMP_START).
+
+    Args:
+        shard_dirs (list): Output folders of the shards, in time order.
+        merged_file (str): Path of the merged output file.
+
+    Returns:
+        int: Number of data rows written.
+    """
+    header = None
+    rows = {}
+    for shard_dir in shard_dirs:
+        fnames = glob.glob(os.path.join(shard_dir, 'eddypro_*_fluxnet_*adv.csv'))
+        for fname in sorted(fnames, key=_fluxnet_run_time):
+            with open(fname, newline='') as f:
+                reader = csv.reader(f)
+                file_header = next(reader, None)
+                if file_header is None:
+                    continue
+                if header is None:
+                    header = file_header
+                elif file_header != header:
+                    print(f'Warning: {fname} has a different header, skipping it')
+                    continue
+                for row in reader:
+                    if row:
+                        rows[row[0]] = row
+
+    if header is None:
+        print('No EddyPro outputs found to merge')
+        return 0
+
+    with open(merged_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for key in sorted(rows, key=_row_time):
+            writer.writerow(rows[key])
+
+    print(f'Merged {len(rows)} rows into {merged_file}')
+    return len(rows)
+
+
+def estimate_month(year, month, proj_dir, input_file, file_meta, dir_raw, dir_outpath,
+                   shard='month', workers=None, eddypro='eddypro_rp'):
+    """
+    Estimate the fluxes of one month with EddyPro.
+
+    Args:
+        year (int): Year.
+        month (int): Month number (1-12).
+        proj_dir (str): Project folder.
+        input_file (str): Template .eddypro project file, relative to proj_dir.
+        file_meta (str): EddyPro metadata file.
+        dir_raw (str): Folder of the decoded day files, relative to proj_dir.
+        dir_outpath (str): Folder of the outputs, relative to proj_dir.
+        shard (str): Length of the EddyPro runs the month is split into.
+        workers (int, optional): Maximum number of concurrent EddyPro runs.
+        eddypro (str): EddyPro executable.
+    """
+    file_eddypro = f'{proj_dir}/{input_file}'
+    start, end = month_window(year, month)
+    month_dir = f'{proj_dir}/{dir_outpath}/{year:04d}-{month:02d}'
+
+    shards = split_window(start, end, shard)
+    projects = []
+    for shard_start, shard_end in shards:
+        if len(shards) == 1:
+            filename = f'{proj_dir}/software/eddyflow/EddyPro/setx_{end:%Y%m%d}.eddypro'
+            out_path = month_dir
+        else:
+            filename = f'{proj_dir}/software/eddyflow/EddyPro/setx_{end:%Y%m%d}_{shard_end:%Y%m%d%H%M}.eddypro'
+            out_path = f'{month_dir}/{shard_end:%Y%m%d%H%M}'
+        projects.append((filename, out_path))
+
+    # the first run fits the planar fit and time lags over the whole month,
+    # the other shards reuse its results and only process their own window
+    (filename, out_path), (shard_start, shard_end) = projects[0], shards[0]
+    write_project_file(file_eddypro, filename, shard_start, shard_end, proj_dir, file_meta,
+                       dir_raw, out_path, window=(start, end))
+    print(f'Running flux estimation in {len(projects)} shard(s)...')
+    run_shards(projects[:1], workers=workers, eddypro=eddypro)
+
+    if len(projects) > 1:
+        pf_file, to_file = step_files(out_path)
+        for (filename, out_path), (shard_start, shard_end) in zip(projects[1:], shards[1:]):
+            write_project_file(file_eddypro, filename, shard_start, shard_end, proj_dir, file_meta,
+                               dir_raw, out_path, window=(start, end), pf_file=pf_file, to_file=to_file)
+        run_shards(projects[1:], workers=workers, eddypro=eddypro)
+
+    if len(projects) > 1:
+        merge_fluxnet_outputs([out_path for _, out_path in projects],
+                              f'{month_dir}/eddypro_1_fluxnet_adv.csv')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find number of days in a month.")
+
+    # Add arguments for month and year
+    parser.add_argument('-m', '--month', type=int, required=True, help='Month number (1–12)')
+    parser.add_argument('-y', '--year', type=int, required=True, help='Year (e.g., 2025)')
+    parser.add_argument('-p', '--proj', type=str, required=True, help='Project folder')
+    parser.add_argument('-i', '--input', type=str, required=True, help='input filename')
+    parser.add_argument('-f', '--meta', type=str, required=True, help='meta filename')
+    parser.add_argument('-r', '--raw', type=str, required=True, help='folder for raw files')
+    parser.add_argument('-o', '--out_path', type=str, required=True, help='folder for outputs')
+    parser.add_argument('-s', '--shard', type=str, default='month', choices=['month', 'week', 'day'],
+                        help='length of the EddyPro runs the month is split into')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='maximum number of concurrent EddyPro runs (default: number of CPUs)')
+    parser.add_argument('-e', '--eddypro', type=str, default='eddypro_rp', help='EddyPro executable')
+    args = parser.parse_args()
+
+    if not (1 <= args.month <= 12):
+        parser.error("Month must be between 1 and 12.")
 
-    print('Running flux estimation...')
-    cmd = f'eddypro_rp -s linux {filename} > output.txt'
-    subprocess.run(cmd, shell=True, check=True, capture_output=True, text=True)
+    estimate_month(args.year, args.month, args.proj, args.input, args.meta, args.raw, args.out_path,
+                   shard=args.shard, workers=args.workers, eddypro=args.eddypro)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,4 @@
+# output formats of the processing commands: EddyPro text (dat), CSV and
+# Parquet (needs pyarrow). Kept apart from ingest, which imports pandas, so
+# that the eddyflow command line is built without it.
+FORMATS = ['dat', 'csv', 'parquet']
@@ -0,0 +1,321 @@
+import os
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import read_cs_files as cs
+from column_plan import apply_column_plan, plan_columns
+from formats import FORMATS
+from manifest import atomic_write, file_hash, write_file
+from pipeline import Step
+from profiling import stage
+from readahead import prefetch, warm_file
+from shared_frames import attach_frame, release_frame, share_frame
+
+
+def compact_column(values, dtype):
+    """
+    A decoded column in the dtype given by read_cs_files.read_cs_dtypes.
+
+    Columns converted by the column plan are already arrays and are kept in
+    double precision, so converted values are the same as with float64.
+    Bool8 fields, decoded to eight flags per record, are stored as the byte
+    they were logged in, and fixed-width byte strings as categoricals.
+
+    Args:
+        values (list or np.ndarray): Decoded values.
+        dtype (str or None): Target dtype, 'category' or None to leave the values as they are.
+
+    Returns:
+        list, np.ndarray or pd.Categorical: The column.
+    """
+    if isinstance(values, np.ndarray) and values.ndim == 2:
+        return np.packbits(values, axis=1)[:, 0]
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'S':
+        # fixed-width strings: the categories are the distinct values, decoded once
+        categories, codes = np.unique(values, return_inverse=True)
+        categories = cs.read_cs_strings(categories)
+        if len(set(categories)) == len(categories):
+            return pd.Categorical.from_codes(codes, categories)
+        values = categories[codes]
+    if dtype is None or (isinstance(values, np.ndarray) and dtype != 'category'):
+        return values
+    if dtype == 'category':
+        return pd.Categorical(values)
+    return np.asarray(values, dtype=dtype)
+
+
+def load_data(fname, plan=None, report=None, float64=False, **kwargs):
+    """
+    Load data from CS files and convert to pandas DataFrame.
+
+    Columns of binary files are stored compactly (see read_cs_files.read_cs_dtypes):
+    FP2 and IEEE4 as float32, integers as the smallest integer dtype of their
+    format and strings as categoricals.
+
+    Args:
+        fname (str): Filename or path to the CS file to load, or its content as
+            bytes or a binary stream (see read_cs_files.read_cs_source).
+        plan (list, optional): Column plan from column_plan.compile_column_plan.
+            Ignored columns are not decoded and left empty, and units are
+            converted as described in the EddyPro metadata.
+        report (dict, optional): Filled with the sequence report of the reader
+            (see read_cs_files.read_cs_files), e.g. the byte range read.
+        float64 (bool): Keep floating point columns in double precision.
+        **kwargs: Passed on to read_cs_files, e.g. byte_range.
+
+    Returns:
+        tuple: A tuple containing:
+            - df (pd.DataFrame): DataFrame with TIMESTAMP and data columns
+            - meta (list): Metadata from the CS file
+    """
+    if hasattr(fname, 'read') and not (hasattr(fname, 'seekable') and fname.seekable()):
+        # the file is read twice with a column plan
+        fname = fname.read()
+    label = fname if isinstance(fname, (str, os.PathLike)) else type(fname).__name__
+
+    with stage('decode', file=label) as decoding:
+        # string fields are made categoricals from their bytes, see compact_column
+        if plan is None:
+            bin_data, meta, qc = cs.read_cs_files(fname, report=True, strings='bytes', **kwargs)
+        else:
+            full_meta = cs.read_cs_files(fname, metaonly=True)
+            bin_data, meta, qc = cs.read_cs_files(fname, columns=plan_columns(plan, full_meta[2]),
+                                                  report=True, strings='bytes', **kwargs)
+        start, stop = qc.get('byte_range', (0, 0))
+        decoding.add(bytes=stop - start, records=qc.get('records'), frames=qc.get('frames'),
+                     rejected_frames=qc.get('rejected_frames'))
+
+    with stage('dataframe', file=label) as building:
+        if plan is not None:
+            # back to the full column layout the metadata column numbers refer to
+            if bin_data != []:
+                data_by_name = dict(zip(meta[2], bin_data))
+                bin_data = [data_by_name.get(name) for name in full_meta[2]]
+            bin_data, meta = apply_column_plan(plan, bin_data, full_meta)
+        df = pd.DataFrame(columns = meta[2], data=None)
+        if bin_data != []:
+            dtypes = cs.read_cs_dtypes(meta, float64)
+            df['TIMESTAMP'] = pd.to_datetime(bin_data[0])
+            for i, col in enumerate(meta[2][1:]):
+                if bin_data[i + 1] is not None:
+                    df[col] = compact_column(bin_data[i + 1], dtypes[i + 1])
+        building.add(records=len(df))
+    if report is not None:
+        report.update(qc)
+
+    if qc.get("duplicates") or qc.get("gaps") or qc.get("resets"):
+        missing = sum(gap[2] for gap in qc["gaps"])
+        print(f"{label}: {qc['duplicates']} duplicate records, {len(qc['gaps'])} gaps "
+              f"({missing} records missing), {len(qc['resets'])} logger resets")
+    return df, meta
+
+
+def load_cached(fname, plan=None, cache_dir=None, byte_range=None, float64=False):
+    """
+    load_data with the decoded data kept in a cache directory.
+
+    The cache entry of a file is keyed by the hash of its content and of the
+    column plan, so a file that grew or a changed plan is decoded again.
+
+    Args:
+        fname (str): CS file to load.
+        plan (list, optional): Column plan, see load_data.
+        cache_dir (str, optional): Cache directory; None decodes without caching.
+        byte_range (tuple, optional): Only read this part of the file, not cached.
+        float64 (bool): Floating point columns in double precision, see load_data.
+
+    Returns:
+        tuple: (df, meta) as from load_data.
+    """
+    if byte_range is not None:
+        return load_data(fname, plan, float64=float64, byte_range=byte_range)
+    if cache_dir is None:
+        return load_data(fname, plan, float64=float64)
+
+    key = hashlib.sha1((file_hash(fname) + json.dumps([plan, float64])).encode()).hexdigest()[:16]
+    cache_file = os.path.join(cache_dir, f"{os.path.basename(fname)}.{key}.pkl")
+    if os.path.exists(cache_file):
+        return pd.read_pickle(cache_file)
+
+    df, meta = load_data(fname, plan, float64=float64)
+    os.makedirs(cache_dir, exist_ok=True)
+    with atomic_write(cache_file, "wb") as f:
+        pd.to_pickle((df, meta), f)
+    return df, meta
+
+
+def warm_read(read):
+    """Read a planned (filename, byte_range) into the page cache, as a pipeline step; returns read."""
+    warm_file(*read)
+    return read
+
+
+def decode_read(read, plan=None, cache_dir=None, float64=False):
+    """
+    load_cached for one planned read, as a pipeline step (see pipeline.Step).
+
+    Args:
+        read (tuple): (filename, byte_range), byte_range None for the whole file.
+        plan, cache_dir, float64: See load_cached.
+
+    Returns:
+        tuple: (filename, df, meta).
+    """
+    filename, byte_range = read
+    return (filename,) + load_cached(filename, plan, cache_dir, byte_range, float64)
+
+
+def decode_shared(read, plan=None, cache_dir=None, float64=False):
+    """
+    decode_read in a decoding process, handing the columns back in shared memory.
+
+    Returns:
+        tuple: (filename, shared, meta), shared from shared_frames.share_frame;
+               attach_decoded turns it into (filename, df, meta) in the parent.
+    """
+    filename, df, meta = decode_read(read, plan, cache_dir, float64)
+    return filename, share_frame(df), meta
+
+
+def attach_decoded(decoded):
+    """(filename, df, meta) of a decode_shared result, see shared_frames.attach_frame."""
+    filename, shared, meta = decoded
+    return filename, attach_frame(shared), meta
+
+
+def release_decoded(decoded):
+    """Free the shared memory of a decode_shared result that is not used."""
+    release_frame(decoded[1])
+
+
+def decode_steps(plan=None, workers=1, pool=None, cache_dir=None, float64=False):
+    """
+    Pipeline steps reading ahead and decoding planned reads, see pipeline.run_pipeline.
+
+    The steps take (filename, byte_range) tuples, e.g. from catalog.plan_reads,
+    and give (filename, df, meta) as decode_files does. Decoded in a process
+    pool, the columns come back through shared memory (decode_shared).
+
+    Args:
+        plan (list, optional): Column plan, see load_data.
+        workers (int): Files decoded at a time.
+        pool (concurrent.futures.Executor, optional): Process pool to decode in;
+            without one the files are decoded in threads of this process.
+        cache_dir (str, optional): Cache directory, see load_cached.
+        float64 (bool): Floating point columns in double precision, see load_data.
+
+    Returns:
+        list: The read and decode steps.
+    """
+    if pool is None:
+        return [Step('read', warm_read),
+                Step('decode', partial(decode_read, plan=plan, cache_dir=cache_dir, float64=float64),
+                     workers)]
+    return [Step('read', warm_read),
+            Step('decode', partial(decode_shared, plan=plan, cache_dir=cache_dir, float64=float64),
+                 workers, pool, discard=release_decoded),
+            Step('attach', attach_decoded)]
+
+
+def decode_files(files, plan=None, workers=1, cache_dir=None, byte_ranges=None, pool=None,
+                 float64=False):
+    """
+    Decode files, in parallel processes if workers > 1 or a pool is given.
+
+    Decoding in this process, the next file is read ahead in a thread while
+    one is decoded (readahead.prefetch). In parallel, at most two files per
+    worker are decoded ahead of the consumer, so the decoded data of a long
+    file list is never all held in memory. Consumers sharing a pool each keep
+    that many files queued, so the pool interleaves their files instead of
+    finishing one consumer first. The decoded columns come back through shared
+    memory rather than pickled (see decode_shared).
+
+    Args:
+        files (list): CS files to decode.
+        plan (list, optional): Column plan, see load_data.
+        workers (int): Number of decoding processes.
+        cache_dir (str, optional): Cache directory, see load_cached.
+        byte_ranges (dict, optional): Filename -> byte range to read, see catalog.plan_reads.
+        pool (concurrent.futures.Executor, optional): Process pool shared with other
+            consumers (see batch.py); workers is then this consumer's share of it.
+        float64 (bool): Floating point columns in double precision, see load_data.
+
+    Yields:
+        tuple: (filename, df, meta) in the order of files.
+    """
+    byte_ranges = byte_ranges or {}
+    if pool is None and workers <= 1:
+        for filename in prefetch(files, byte_ranges):
+            yield (filename,) + load_cached(filename, plan, cache_dir, byte_ranges.get(filename), float64)
+        return
+
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from decode_files(files, plan, workers, cache_dir, byte_ranges, pool, float64)
+        return
+
+    queued = deque()
+    try:
+        for filename in files:
+            future = pool.submit(decode_shared, (filename, byte_ranges.get(filename)), plan, cache_dir, float64)
+            queued.append(future)
+            if len(queued) >= 2 * max(workers, 1):
+                yield attach_decoded(queued.popleft().result())
+        while queued:
+            yield attach_decoded(queued.popleft().result())
+    finally:
+        # the consumer stopped early: free the shared memory of the files decoded ahead
+        for future in queued:
+            if not future.cancel():
+                future.add_done_callback(
+                    lambda done: done.exception() is None and release_decoded(done.result()))
+
+
+def select_period(df, start=None, end=None):
+    """Records of df with start <= TIMESTAMP < end; either bound may be None."""
+    if start is not None:
+        df = df[df["TIMESTAMP"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["TIMESTAMP"] < pd.Timestamp(end)]
+    return df
+
+
+def write_frame(df, filename, fmt="dat", meta=None, index=False):
+    """
+    Write a DataFrame in one of the output formats.
+
+    Text formats ("dat" and "csv") hold a row of quoted units from meta[3],
+    if meta is given, followed by the column names and the data. "parquet"
+    needs pyarrow or fastparquet; the units are in meta.txt.
+
+    Args:
+        df (pd.DataFrame): Data to write.
+        filename (str): Output file.
+        fmt (str): One of formats.FORMATS.
+        meta (list, optional): Metadata of the data.
+        index (bool): Whether to write the index, e.g. the TIMESTAMP of means.
+    """
+    with stage('write', file=filename, format=fmt) as writing:
+        if fmt == "parquet":
+            data = df.to_parquet(index=index)
+        else:
+            data = df.to_csv(index=index, lineterminator="\n")
+            if meta is not None:
+                data = quoted_line(meta[3]) + data
+        writing.add(records=len(df), bytes=write_file(filename, data))
+
+
+def quoted_line(row):
+    """A header line of quoted items, as in the datalogger files."""
+    return ",".join('"{}"'.format(item) for item in row) + "\n"
+
+
+def write_meta_file(meta, dst_dir):
+    """Write the metadata of decoded data to dst_dir/meta.txt."""
+    write_file(os.path.join(dst_dir, "meta.txt"), "".join(quoted_line(row) for row in meta))
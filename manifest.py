@@ -0,0 +1,264 @@
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+
+from read_cs_files import COMPRESSED_SUFFIXES, read_cs_source
+
+
+def input_name(filename):
+    """Name of an input file in the manifest: its basename without a compression suffix."""
+    name, suffix = os.path.splitext(os.path.basename(filename))
+    return name if suffix in COMPRESSED_SUFFIXES else os.path.basename(filename)
+
+
+def file_hash(filename, chunk_size=1 << 20):
+    """
+    SHA-1 of the content of a file.
+
+    Compressed files (e.g. ts_data_1.dat.gz, see archive.py) are hashed
+    decompressed, so an archived input keeps the digest of the original.
+
+    Args:
+        filename (str): File to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    sha1 = hashlib.sha1()
+    compressed = input_name(filename) != os.path.basename(filename)
+    with read_cs_source(filename) if compressed else open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+@contextmanager
+def atomic_write(filename, mode="w", **kwargs):
+    """
+    Open a file for writing so that it only appears once it is complete.
+
+    The content is written to a temporary file in the same directory, which is
+    flushed to disk and renamed over the target when the block exits without an
+    error. A crash therefore never leaves a partially written output behind.
+
+    Args:
+        filename (str): Final path of the file.
+        mode (str): Open mode, "w" or "wb".
+        **kwargs: Passed on to open (e.g. encoding).
+
+    Yields:
+        file object: The temporary file to write to.
+    """
+    tmp_file = f"{filename}.tmp{os.getpid()}"
+    try:
+        with open(tmp_file, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def write_file(filename, data, encoding="utf-8"):
+    """
+    Write the complete content of a file with a single open, write and rename.
+
+    Like atomic_write, but the content is built in memory first (e.g. by
+    DataFrame.to_csv without a path), so the file costs one write call
+    instead of one per chunk of rows. On parallel filesystems the metadata
+    operations of small files cost more than their data.
+
+    Args:
+        filename (str): Final path of the file.
+        data (str or bytes): Content of the file.
+        encoding (str): Encoding of str content.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    with atomic_write(filename, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+class Manifest:
+    """
+    Append-only JSON lines record of processed input files and written outputs.
+
+    Every line is one entry, either an input file that has been completely
+    processed ("input", keyed by input_name, so ts_data_1.dat.gz is the
+    archived ts_data_1.dat) or an output that has been completely written
+    ("output"). Entries are appended and synced one by one, so after a crash the
+    manifest holds exactly the work that was finished; a torn last line is
+    ignored when the manifest is loaded. Within batch() the entries are held
+    and appended together, with one write and sync.
+
+    Args:
+        filename (str): Path of the manifest file (e.g. dst_dir/manifest.jsonl).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.inputs = {}
+        self.outputs = {}
+        self.held = None  # entries recorded in a batch, not written yet
+        self.hashed = {}  # input name -> (sha1, size, mtime) of the files hashed by digest
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._add(entry)
+
+    def _add(self, entry):
+        if entry["kind"] == "input":
+            self.inputs[entry["file"]] = entry
+        elif entry["kind"] == "output":
+            self.outputs[entry["key"]] = entry
+
+    def _append(self, entry):
+        entry["done"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        if self.held is not None:
+            self.held.append(entry)
+        else:
+            self._write([entry])
+        self._add(entry)
+
+    def _write(self, entries):
+        if not entries:
+            return
+        with open(self.filename, "a") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @contextmanager
+    def batch(self):
+        """
+        Hold the entries recorded in the block and append them in one write at its end.
+
+        The held entries count as recorded at once (input_done, output_done) and
+        are written also when the block exits with an error, since their work is
+        finished. After a crash within the block they are lost, and the next
+        run writes their outputs again. Nested batches join the outer one.
+
+        Yields:
+            Manifest: self.
+        """
+        if self.held is not None:
+            yield self
+            return
+        self.held = []
+        try:
+            yield self
+        finally:
+            held, self.held = self.held, None
+            self._write(held)
+
+    def input_done(self, filename, digest):
+        """Whether this input file, with this content, has been processed."""
+        entry = self.inputs.get(input_name(filename))
+        return entry is not None and entry["sha1"] == digest
+
+    def digest(self, filename):
+        """
+        Hash of an input file (file_hash), kept with its size and modification time.
+
+        record_input stores these with the digest, so check_input can skip
+        reading the file while they stay the same. They are taken before the
+        file is read: a file growing meanwhile is hashed again next time.
+        """
+        stat = os.stat(filename)
+        digest = file_hash(filename)
+        self.hashed[input_name(filename)] = (digest, stat.st_size, stat.st_mtime)
+        return digest
+
+    def check_input(self, filename):
+        """
+        Whether an input file has been processed, reading it only if it may have changed.
+
+        A file with the size and modification time recorded with its entry is
+        not read. Any other file is hashed (digest); a processed file whose
+        content is unchanged, e.g. one that was archived, is recorded again
+        with its new size and modification time.
+
+        Args:
+            filename (str): Input file.
+
+        Returns:
+            tuple: (done, digest); digest is the recorded one for unchanged files.
+        """
+        entry = self.inputs.get(input_name(filename))
+        stat = os.stat(filename)
+        if entry is not None and (entry.get("size"), entry.get("mtime")) == (stat.st_size, stat.st_mtime):
+            return True, entry["sha1"]
+        digest = self.digest(filename)
+        if entry is None or entry["sha1"] != digest:
+            return False, digest
+        self.record_input(filename, digest, entry.get("records"), entry.get("timestamps"), entry["outputs"])
+        return True, digest
+
+    def output_done(self, key):
+        """Whether the output with this key (e.g. "ts_data_2025-08-26") has been written."""
+        return key in self.outputs
+
+    def record_input(self, filename, digest, records=None, timestamps=None, outputs=()):
+        """
+        Record that an input file has been completely processed.
+
+        Args:
+            filename (str): Input file.
+            digest (str): Hash of its content, from digest; None to record the
+                file by its current size and modification time only, without
+                reading it (see process_ts.seed_manifest).
+            records (tuple, optional): First and last decoded record number.
+            timestamps (tuple, optional): First and last decoded timestamp.
+            outputs (list): Output files its data went into.
+        """
+        hashed = self.hashed.get(input_name(filename))
+        if digest is None:
+            stat = os.stat(filename)
+            size, mtime = stat.st_size, stat.st_mtime
+        else:
+            size, mtime = hashed[1:] if hashed is not None and hashed[0] == digest else (None, None)
+        self._append({
+            "kind": "input",
+            "file": input_name(filename),
+            "sha1": digest,
+            "size": size,
+            "mtime": mtime,
+            "records": [None if r is None else int(r) for r in records] if records else None,
+            "timestamps": [str(t) for t in timestamps] if timestamps else None,
+            "outputs": [os.path.basename(o) for o in outputs],
+        })
+
+    def record_output(self, key, filename, sources=(), stats=None):
+        """
+        Record that an output has been completely written.
+
+        Args:
+            key (str): Key of the output, e.g. "ts_data_2025-08-26".
+            filename (str): The written file.
+            sources (list): Input files the output was made from.
+            stats (dict, optional): Statistics of the output, e.g. its number of
+                records and data completeness.
+        """
+        entry = {
+            "kind": "output",
+            "key": key,
+            "file": os.path.basename(filename),
+            "sources": [os.path.basename(s) for s in sources],
+        }
+        if stats:
+            entry["stats"] = stats
+        self._append(entry)
@@ -0,0 +1,191 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# end of the items on a queue
+_DONE = object()
+
+
+class _Failed:
+    # an exception raised by a step, passed on to the consumer
+    def __init__(self, error):
+        self.error = error
+
+
+class Step:
+    """
+    A stage of a pipeline, see run_pipeline.
+
+    Args:
+        name (str): Name of the step, e.g. read, decode, split, write.
+        function (callable): function(item) -> result. Must be picklable to
+            run in a process pool, e.g. a module function or functools.partial.
+        workers (int): Items processed at a time. With one worker and no
+            executor the step runs in its own thread, one item after another,
+            so it may keep state (e.g. the days collected by a DayWriter).
+        executor (concurrent.futures.Executor, optional): Pool to run the
+            function in, e.g. a process pool for decoding; a thread pool of
+            workers threads by default.
+        discard (callable, optional): discard(result) frees a result that is
+            not passed on because the pipeline stopped, e.g. a shared memory block.
+    """
+
+    def __init__(self, name, function, workers=1, executor=None, discard=None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.discard = discard
+
+    def drop(self, result):
+        # a result that will not be passed on
+        if self.discard is not None and result is not _DONE and not isinstance(result, _Failed):
+            self.discard(result)
+
+    def drop_future(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.drop(future.result())
+
+
+def _put(q, item, stop):
+    # put that gives up once the pipeline is stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _feed(items, out, stop):
+    try:
+        for item in items:
+            if not _put(out, item, stop):
+                return
+    except BaseException as error:
+        _put(out, _Failed(error), stop)
+        return
+    _put(out, _DONE, stop)
+
+
+def _run_step(step, inbox, out, stop):
+    # results of the step in the order of the items, at most 2 * workers in flight
+    executor = step.executor
+    own = executor is None and step.workers > 1
+    if own:
+        executor = ThreadPoolExecutor(max_workers=step.workers, thread_name_prefix=step.name)
+    in_flight = deque()
+
+    def oldest():
+        try:
+            return in_flight.popleft().result()
+        except BaseException as error:
+            return _Failed(error)
+
+    def pass_on(result):
+        # False once the step has to stop
+        if not _put(out, result, stop):
+            step.drop(result)
+            return False
+        return not isinstance(result, _Failed)
+
+    try:
+        while True:
+            # finished results go on while the step waits for its next item
+            while in_flight and in_flight[0].done():
+                if not pass_on(oldest()):
+                    return
+            try:
+                item = inbox.get(timeout=0.05)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+
+            if item is _DONE or isinstance(item, _Failed):
+                while in_flight:
+                    if not pass_on(oldest()):
+                        return
+                _put(out, item, stop)
+                return
+            if executor is None:
+                try:
+                    result = step.function(item)
+                except BaseException as error:
+                    result = _Failed(error)
+                if not pass_on(result):
+                    return
+                continue
+            in_flight.append(executor.submit(step.function, item))
+            if len(in_flight) >= 2 * step.workers and not pass_on(oldest()):
+                return
+    finally:
+        for future in in_flight:
+            if not future.cancel():
+                future.add_done_callback(step.drop_future)
+        if own:
+            executor.shutdown(wait=True)
+
+
+def run_pipeline(items, steps, maxsize=2):
+    """
+    Run items through steps that work at the same time, connected by bounded queues.
+
+    Every step runs in its own thread and hands its results on in the order
+    of the items, so e.g. the next files are read and decoded while the days
+    of the current one are written. A step blocks once maxsize results wait
+    for the next step, which bounds the memory held to a few items per step
+    and keeps the throughput at the rate of the slowest step.
+
+        for filename, written in run_pipeline(files, [
+                Step('read', warm),
+                Step('decode', decode, workers, pool),
+                Step('write', write, 2)]):
+            ...
+
+    An exception raised by a step stops the pipeline and is raised by the
+    iteration; stopping the iteration early stops the steps.
+
+    Args:
+        items (iterable): Inputs of the first step.
+        steps (list): Step objects, in order.
+        maxsize (int): Results queued between two steps.
+
+    Yields:
+        Results of the last step, in the order of items.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize) for _ in range(len(steps) + 1)]
+    threads = [threading.Thread(target=_feed, args=(items, queues[0], stop), daemon=True)]
+    for i, step in enumerate(steps):
+        threads.append(threading.Thread(target=_run_step, args=(step, queues[i], queues[i + 1], stop),
+                                        name=step.name, daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            result = _get(queues[-1], stop)
+            if result is _DONE:
+                return
+            if isinstance(result, _Failed):
+                raise result.error
+            yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        # results left between the steps
+        for step, q in zip(steps, queues[1:]):
+            while not q.empty():
+                step.drop(q.get())
@@ -1,76 +1,136 @@
-import os, glob
-import csv
+import os
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import read_cs_files_validated as cs
-import subprocess
-from natsort import natsorted
-from datetime import datetime
+from catalog import plan_reads
+from ingest import decode_steps, select_period, write_frame, write_meta_file
+from manifest import Manifest
+from pipeline import Step, run_pipeline
 
-def load_data(fname):
-    bin_data, meta = cs.read_cs_files(fname)
-    df = pd.DataFrame(columns = meta[2], data=None)
+# threads writing monthly files at a time
+WRITERS = 2
 
-    if bin_data != []:
-        df['TIMESTAMP'] = pd.to_datetime(bin_data[0])
-        for i, col in enumerate(meta[2][1:]):
-            df[col] = bin_data[i + 1]
-    return df, meta
 
+def process_monthly(var, src_dir, dst_dir, cutoff=None, patterns=None, workers=1,
+                    cache_dir=None, start=None, end=None, fmt="csv", catalog=None,
+                    pool=None, float64=False):
+    """
+    Combine the files of a slow table (MetData, SondeData) into monthly files.
 
-def main():
-    var = 'MetData'
-    dst_dir = f'../../decoded_data/{var}'
-    src_dir = '../../DataLogger/CRD/'
-    cutoff = pd.Timestamp("2025-08-26 08:15:00")
-    os.makedirs(dst_dir, exist_ok=True)
-    full_filenames = natsorted(glob.glob(os.path.join(src_dir, f'{var}*.dat')))
+    Progress is kept in dst_dir/manifest.jsonl: completed months are not
+    rewritten and input files whose months are all written are not read again.
+    The last month is still being logged and is rewritten by every run.
 
-    # 1. Read all files and combine
-    df_all = pd.DataFrame()
+    The files are read ahead and decoded in a pipeline (see ingest.decode_steps)
+    while the decoded ones are combined, and WRITERS threads write the months.
+    The manifest entries are appended together once the months are written.
+
+    Args:
+        var (str): Table name.
+        src_dir (str): Source directory of the datalogger files.
+        dst_dir (str): Destination directory of the monthly files.
+        cutoff (str, optional): Data before this time is dropped (e.g. the installation).
+        patterns (list, optional): Glob patterns of the files, f"{var}*.dat" by default.
+        workers (int): Number of decoding processes.
+        cache_dir (str, optional): Cache of decoded files, see ingest.load_cached.
+        start (str, optional): Only write data from this time on.
+        end (str, optional): Only write data before this time. With start or end
+            set, input files are not recorded as processed.
+        fmt (str): "csv" (units row, then the data), "dat" (the same) or "parquet".
+        catalog (str, optional): SQLite catalog of the raw files, see catalog.plan_reads.
+        pool (concurrent.futures.Executor, optional): Process pool shared with other
+            tables, see ingest.decode_files.
+        float64 (bool): Keep floating point columns in double precision, see ingest.load_data.
+
+    Returns:
+        None
+    """
+    reads = plan_reads(src_dir, patterns or [f'{var}*.dat'], start, end, catalog)
+    full_filenames = [filename for filename, _ in reads]
+    byte_ranges = {filename: byte_range for filename, byte_range in reads if byte_range}
+    cutoff = pd.Timestamp(cutoff) if cutoff is not None else None
+    whole = start is None and end is None
+    ext = 'csv' if fmt == 'dat' else fmt
+
+    # Progress of earlier runs: completed months and the input files fully written
+    manifest = Manifest(os.path.join(dst_dir, "manifest.jsonl"))
+
+    # 1. Read the files not processed yet and combine
+    digests = {}
     for filename in full_filenames:
-        print("Reading:", filename)
-        df, meta = load_data(filename)
-        df_all = pd.concat([df_all, df], ignore_index=True)
+        done, digest = manifest.check_input(filename)
+        if not done:
+            digests[filename] = digest
+
+    frames, meta = [], None
+    sources = []
+    with ExitStack() as stack:
+        if pool is None and workers > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        reads = [(filename, byte_ranges.get(filename)) for filename in digests]
+        for filename, df, meta in run_pipeline(reads, decode_steps(None, workers, pool, cache_dir, float64)):
+            print("Reading:", filename)
+            df = select_period(df, start, end)
+            frames.append(df)
+            months = df.loc[df["TIMESTAMP"] >= cutoff, "TIMESTAMP"] if cutoff is not None else df["TIMESTAMP"]
+            months = months.dt.to_period("M")
+            sources.append((filename, digests[filename], sorted(set(str(ym) for ym in months))))
+    df_all = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     # 2. Apply cutoff (remove bad data during installation process)
-    df_all = df_all[df_all["TIMESTAMP"] >= cutoff]
+    if df_all.empty:
+        print("No new data. EXIT!!!")
+        return
+    if cutoff is not None:
+        df_all = df_all[df_all["TIMESTAMP"] >= cutoff]
     if df_all.empty:
         print("No data after cutoff. EXIT!!!")
-        exit()
+        return
 
     # 3. Add a year-month column
     df_all["year_month"] = df_all["TIMESTAMP"].dt.to_period("M")
+    last_month = df_all["year_month"].max()
 
-    # 4. Determine already processed months
-    processed_months = {
-        f.split("_")[-1].replace(".csv", "")
-        for f in os.listdir(dst_dir) if f.endswith(".csv")
-    }
+    # 4. Group by month and save
+    def write(month):
+        ym, group, outfile = month
+        print(f"Writing {outfile}")
+        write_frame(group.drop(columns="year_month"), outfile, fmt, meta)
+        return ym, outfile
 
-    # 5. Group by month and save
+    to_write = []
     for ym, group in df_all.groupby("year_month"):
         ym_str = str(ym)  # e.g., "2025-08"
-        outfile = os.path.join(dst_dir, f"{var}_{ym_str}.csv")
-
-        if ym_str in processed_months:
+        if manifest.output_done(f"{var}_{ym_str}"):
             print(f"Skipping {ym_str} (already processed)")
             continue
+        to_write.append((ym, group, os.path.join(dst_dir, f"{var}_{ym_str}.{ext}")))
 
-        print(f"Writing {outfile}")
-        # Write header from meta first
-        with open(outfile, "w", encoding="utf-8") as f:
-            quoted_row = ['"{}"'.format(item) for item in meta[3]]
-            f.write(",".join(quoted_row) + "\n")
+    with manifest.batch():
+        for ym, outfile in run_pipeline(to_write, [Step('write', write, WRITERS)]):
+            ym_str = str(ym)
+            # The last month is still being logged and is rewritten by the next run
+            if ym < last_month:
+                manifest.record_output(f"{var}_{ym_str}", outfile,
+                                       [s[0] for s in sources if ym_str in s[2]])
 
-        # Append month data
-        group.drop(columns="year_month").to_csv(outfile, mode="a", index=False)
+        # 5. Input files are done once all their months are written
+        for filename, digest, months in sources:
+            if whole and all(manifest.output_done(f"{var}_{ym_str}") for ym_str in months):
+                manifest.record_input(filename, digest,
+                                      outputs=[f"{var}_{ym_str}.{ext}" for ym_str in months])
 
     # 6. Write metadata file once
-    metafile = os.path.join(dst_dir, "meta.txt")
-    with open(metafile, "w") as f:
-        for row in meta:
-            quoted_row = ['"{}"'.format(item) for item in row]
-            f.write(",".join(quoted_row) + "\n")
+    write_meta_file(meta, dst_dir)
+
+
+def main():
+    var = 'MetData'
+    dst_dir = f'../../decoded_data/{var}'
+    src_dir = '../../DataLogger/CRD/'
+    cutoff = pd.Timestamp("2025-08-26 08:15:00")
+    os.makedirs(dst_dir, exist_ok=True)
+    process_monthly(var, src_dir, dst_dir, cutoff, catalog='../../decoded_data/catalog.sqlite')
 
 
 if __name__ == "__main__":
@@ -1,55 +1,73 @@
-import os, glob
-import csv
+import os
 import pandas as pd
-import read_cs_files as cs
-import subprocess
-from natsort import natsorted
-from datetime import datetime
+from catalog import plan_reads
+from ingest import decode_files, select_period, write_frame, write_meta_file
 
-def load_data(fname):
-    bin_data, meta = cs.read_cs_files(fname)
-    df = pd.DataFrame(columns = meta[2], data=None)
 
-    if bin_data != []:
-        df['TIMESTAMP'] = pd.to_datetime(bin_data[0])
-        for i, col in enumerate(meta[2][1:]):
-            df[col] = bin_data[i + 1]
-    return df, meta
+def process_monitor(var, src_dir, dst_dir, freq="30min", patterns=None, workers=1,
+                    cache_dir=None, start=None, end=None, fmt="csv", catalog=None,
+                    pool=None, float64=False):
+    """
+    Average monitor data (e.g. MonitorCSAT, every 5 min) to half-hourly means.
 
+    Args:
+        var (str): Table name.
+        src_dir (str): Source directory of the datalogger files.
+        dst_dir (str): Destination directory.
+        freq (str): Averaging interval.
+        patterns (list, optional): Glob patterns of the files, f"{var}*.dat" by default.
+        workers (int): Number of decoding processes.
+        cache_dir (str, optional): Cache of decoded files, see ingest.load_cached.
+        start (str, optional): Only use data from this time on.
+        end (str, optional): Only use data before this time.
+        fmt (str): Output format, see ingest.write_frame.
+        catalog (str, optional): SQLite catalog of the raw files, see catalog.plan_reads.
+        pool (concurrent.futures.Executor, optional): Process pool shared with other
+            tables, see ingest.decode_files.
+        float64 (bool): Keep floating point columns in double precision, see ingest.load_data.
 
-def main():
-    var = 'MonitorCSAT'
-    dst_dir = f'/Users/pvn/Library/CloudStorage/OneDrive-OakRidgeNationalLaboratory/Shared/Projects/SETx-FluxData/{var}'
-    src_dir = '/Users/pvn/Downloads/Download-2025-08-25'
-    # cutoff = pd.Timestamp("2025-08-26 08:15:00")
-
-    full_filenames = natsorted(glob.glob(os.path.join(src_dir, f'{var}*.dat')))
-    
-    df_all = pd.DataFrame()
-    for filename in full_filenames[0:]:
+    Returns:
+        str or None: The written file, None if there was no data.
+    """
+    reads = plan_reads(src_dir, patterns or [f'{var}*.dat'], start, end, catalog)
+    full_filenames = [filename for filename, _ in reads]
+    byte_ranges = {filename: byte_range for filename, byte_range in reads if byte_range}
+
+    frames, meta = [], None
+    for filename, df, meta in decode_files(full_filenames, workers=workers, cache_dir=cache_dir,
+                                           byte_ranges=byte_ranges, pool=pool,
+                                           float64=float64):
         print(filename)
-        df, meta = load_data(filename)
-        df_all = pd.concat([df_all, df], ignore_index=True)
+        frames.append(select_period(df, start, end))
+    df_all = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if df_all.empty:
+        print("No data. EXIT!!!")
+        return None
 
     first_date = df_all["TIMESTAMP"].dt.date.min()
     last_date = df_all["TIMESTAMP"].dt.date.max()
 
     # resample from 5min to 30min
     df_all['TIMESTAMP'] = pd.to_datetime(df_all['TIMESTAMP'])
-    df_all = df_all.set_index('TIMESTAMP')    
-    df_30min = df_all.resample("30T").mean()
+    df_all = df_all.set_index('TIMESTAMP')
+    df_30min = df_all.resample(freq).mean(numeric_only=True)
 
     # write meta file for details
-    metafile = os.path.join(dst_dir, 'meta.txt')
-    # print(meta)
-    with open(metafile, "w", encoding="utf-8") as f:
-        for row in meta:
-            quoted_row = ['"{}"'.format(item) for item in row]
-            f.write(','.join(quoted_row) + '\n')
+    write_meta_file(meta, dst_dir)
 
     # write data for csv file (variable names as headers)
-    file_output = os.path.join(dst_dir, f'{var}_{first_date}_{last_date}.csv')
-    df_30min.to_csv(os.path.join(dst_dir, file_output), index=True)
+    ext = 'csv' if fmt == 'dat' else fmt
+    file_output = os.path.join(dst_dir, f'{var}_{first_date}_{last_date}.{ext}')
+    write_frame(df_30min, file_output, fmt, index=True)
+    return file_output
+
+
+def main():
+    var = 'MonitorCSAT'
+    dst_dir = f'../../decoded_data/{var}'
+    src_dir = '../../DataLogger/CRD/'
+    os.makedirs(dst_dir, exist_ok=True)
+    process_monitor(var, src_dir, dst_dir, catalog='../../decoded_data/catalog.sqlite')
 
 
 if __name__ == "__main__":
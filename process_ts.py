@@ -1,11 +1,20 @@
 import os
-import glob
+import re
 import csv
+import glob
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import read_cs_files as cs
-from natsort import natsorted
-import logging
-from pathlib import Path
+from column_plan import compile_column_plan
+from catalog import plan_reads
+from ingest import load_data, decode_steps, quoted_line, select_period, write_frame, write_meta_file
+from manifest import Manifest, write_file
+from pipeline import Step, run_pipeline
+from profiling import stage
+from record_qc import completeness
+
+# threads writing day files at a time
+WRITERS = 2
 
 
 def format_value(x, is_timestamp=False):
@@ -30,41 +39,25 @@ def format_value(x, is_timestamp=False):
     return str(x)
 
 
-def load_data(fname):
-    """
-    Load data from CS files and convert to pandas DataFrame.
-
-    Args:
-        fname (str): Filename or path to the CS file to load.
-
-    Returns:
-        tuple: A tuple containing:
-            - df (pd.DataFrame): DataFrame with TIMESTAMP and data columns
-            - meta (list): Metadata from the CS file
-    """
-    bin_data, meta = cs.read_cs_files(fname)
-    df = pd.DataFrame(columns = meta[2], data=None)
-
-    if bin_data != []:
-        df['TIMESTAMP'] = pd.to_datetime(bin_data[0])
-        for i, col in enumerate(meta[2][1:]):
-            df[col] = bin_data[i + 1]
-    return df, meta
-
-
-def write_full_day_data(df_day, meta, day, dst_dir, var):
+def write_full_day_data(df_day, meta, day, dst_dir, var, fmt="dat"):
     """
     Write full day data to a file in a format compatible with Eddypro engine.
 
+    The file is formatted in memory and written to a temporary name in one
+    piece, then renamed, so an interrupted run never leaves a partial day
+    file behind.
+
     Args:
         df_day (pd.DataFrame): DataFrame containing the day's data.
         meta (list): Metadata, where meta[3] contains column headers.
         day (datetime.date or datetime.datetime): The day for which data is being written.
         dst_dir (str): Directory to write the output file.
         var (str): Variable name to include in the output filename.
+        fmt (str): "dat" for the EddyPro files, "csv" for the same layout with a
+            .csv extension or "parquet" (see ingest.write_frame).
 
     Returns:
-        None
+        str: The path of the written file.
     """
 
      # Extract the earliest timestamp for hour and minute
@@ -78,169 +71,352 @@ def write_full_day_data(df_day, meta, day, dst_dir, var):
 
     # Set the file name in specified format for Eddypro engine
     day_str = day.strftime("%Y-%m-%d")
-    file_output = os.path.join(dst_dir, f"{var}_{day_str}_{hour_str}{minute_str}.dat")
+    file_output = os.path.join(dst_dir, f"{var}_{day_str}_{hour_str}{minute_str}.{fmt}")
 
-     # Write header row with quoted column names
-    with open(file_output, "w", encoding="utf-8") as f:
-        quoted_row = ['"{}"'.format(item) for item in meta[3]]
-        f.write(",".join(quoted_row) + "\n")
+    if fmt == "parquet":
+        write_frame(df_day, file_output, fmt)
+        print(f"Saved: {file_output}")
+        return file_output
 
     # Prepare data for writing
-    formatted = df_day.copy(deep=False)
-    for col in df_day.columns:
-        formatted[col] = df_day[col].apply(
-            lambda x: format_value(x, is_timestamp=(col == "TIMESTAMP"))
-        )
+    with stage('format_day', file=file_output, records=len(df_day)):
+        formatted = df_day.copy(deep=False)
+        types = dict(zip(meta[2], meta[-1]))
+        for col in df_day.columns:
+            values = df_day[col]
+            if values.dtype == "float32":
+                # as if decoded to float64: FP2 values by their decimals (799.9,
+                # not 799.900024) and IEEE4 values by their exact expansion
+                if types.get(col) == "FP2":
+                    values = values.astype(str)
+                values = values.astype(float)
+            formatted[col] = values.apply(
+                lambda x: format_value(x, is_timestamp=(col == "TIMESTAMP"))
+            )
+
+    with stage('write_day', file=file_output, records=len(df_day)) as writing:
+        # Header row with quoted column names, then the data (no quoting, as
+        # header is already quoted), written in one piece
+        text = quoted_line(meta[3]) + formatted.to_csv(index=False, quoting=csv.QUOTE_NONE,
+                                                       lineterminator="\n")
+        writing.add(bytes=write_file(file_output, text))
 
-     # Append data to file (no quoting, as header is already quoted)
-    formatted.to_csv( file_output, index=False, quoting=csv.QUOTE_NONE, mode="a")
-
-    # Log the last processed file name for next processing
-    save_last_processed_file(dst_dir, file_output)
     print(f"Saved: {file_output}")
+    return file_output
 
 
-def save_last_processed_file(dst_dir, filename):
+def seed_manifest(manifest, src_dir, dst_dir, var):
     """
-    Log the last processed input filename to the log file.
+    Seed an empty manifest from the progress kept before there was a manifest.
 
-    Args:
-        dst_dir (str): Destination directory where the log file will be stored.
-        filename (str): Name of the last processed file to log.
-
-    Raises:
-        OSError: If there's an issue writing to the log file.
-    """
-    log_file_path = os.path.join(dst_dir, "log_ts.txt")
-
-    with open(log_file_path, "w") as log_file:
-        log_file.write(f"{filename}\n")
-
-    print(f"Logged last processed file: {filename}")
-
-
-def load_last_logged_file(dst_dir):
-    """
-    Read the last processed file from log_ts.txt.
+    Earlier versions kept the name of the last input file whose data
+    completed a day in dst_dir/log_ts.txt, and later runs only read the
+    files numbered higher. The day files already written are recorded, so
+    they are not written again, and the files up to the logged one are
+    recorded as processed by their size and modification time, without
+    reading them. Nothing is done without log_ts.txt.
 
     Args:
-        dst_dir (str or Path): Destination directory containing the log file.
+        manifest (Manifest): Empty manifest of dst_dir.
+        src_dir (str): Source directory containing input files.
+        dst_dir (str): Destination directory of the day files and log_ts.txt.
+        var (str): Variable name, the prefix of the input and day files.
 
     Returns:
-        str or None: The filename of the last processed file, or None if
-                     no log file exists, file is empty, or contains only whitespace.
-
-    Raises:
-        OSError: If there's an issue reading the log file.
+        tuple: Number of input files and day files recorded.
     """
     log_file_path = os.path.join(dst_dir, "log_ts.txt")
-
     if not os.path.exists(log_file_path):
-        return None  # No log file, so process all files
-
+        return 0, 0
     with open(log_file_path, "r") as log_file:
         last_logged_file = log_file.readline().strip()
 
-    if last_logged_file:
-        print(f"Last processed file from log: {last_logged_file}")
-
-    return last_logged_file
-
-
-def filter_files_starting_from(last_logged_file, src_dir, var):
-    """Filter files to include only those after the last logged file."""
-    all_files = natsorted(glob.glob(os.path.join(src_dir, f"{var}*.dat")))
-
-    if not last_logged_file:
-        # No log file: return all files
-        return all_files
-
-    # Extract the last processed file number, e.g., '742' from 'ts_data742.dat'
-    last_file_number = int(''.join(filter(str.isdigit, last_logged_file)))
-
-    # Filter files with numbers greater than the last processed file number
-    filtered_files = [
-        f for f in all_files
-        if int(''.join(filter(str.isdigit, os.path.basename(f)))) > last_file_number
-    ]
-    return filtered_files
-
-
-def process_files_by_day(var, src_dir, dst_dir):
+    def number(filename):
+        # e.g. 742 from ts_data742.dat, as the log was read
+        return int(''.join(filter(str.isdigit, os.path.basename(filename))) or -1)
+
+    inputs = [f for f in glob.glob(os.path.join(src_dir, f"{var}*.dat"))
+              if last_logged_file and number(f) <= number(last_logged_file)]
+    day_file = re.compile(rf"{re.escape(var)}_(\d{{4}}-\d{{2}}-\d{{2}})_\d{{4}}\.dat$")
+    days = [(m.group(1), f) for f in sorted(glob.glob(os.path.join(dst_dir, f"{var}_*.dat")))
+            for m in [day_file.search(os.path.basename(f))] if m]
+    with manifest.batch():
+        for day, file_output in days:
+            manifest.record_output(f"{var}_{day}", file_output)
+        for filename in inputs:
+            manifest.record_input(filename, None)
+    print(f"Manifest seeded from {log_file_path}: {len(inputs)} input files, {len(days)} day files")
+    return len(inputs), len(days)
+
+
+def list_new_files(manifest, src_dir, var, patterns=None, start=None, end=None, catalog=None):
     """
-    Process input files by day, adjusting units, writing full-day data, and logging progress.
+    List the input files whose current content has not been processed yet.
+
+    Only files whose size or modification time changed since they were
+    recorded are read, see Manifest.check_input.
 
     Args:
-        var (str): Variable name to filter and process files.
+        manifest (Manifest): Manifest of the destination directory.
         src_dir (str): Source directory containing input files.
-        dst_dir (str): Destination directory for output and logs.
+        var (str): Variable name to filter files.
+        patterns (list, optional): Glob patterns of the files, f"{var}*.dat" by default.
+        start (str, optional): Only files with records from this time on.
+        end (str, optional): Only files with records before this time.
+        catalog (str, optional): SQLite catalog of the raw files, see catalog.plan_reads.
 
     Returns:
-        None
+        list: (filename, sha1, byte_range) tuples of the files to process, in
+              time order with a catalog and in natural order otherwise.
     """
-    # Load the last processed file from the log
-    last_logged_file = load_last_logged_file(dst_dir)
-
-    # Filter files to process based on the log information
-    full_filenames = filter_files_starting_from(last_logged_file, src_dir, var)
-
-    temp_df = pd.DataFrame()  # Temporary DataFrame to accumulate until full-day data
-    meta = None
-    last_saved_file = None  # Variable to track the last input file processed
+    new_files = []
+    reads = plan_reads(src_dir, patterns or [f"{var}*.dat"], start, end, catalog)
+    for filename, byte_range in reads:
+        done, digest = manifest.check_input(filename)
+        if not done:
+            new_files.append((filename, digest, byte_range))
+    return new_files
 
-    for filename in full_filenames:
-        print(f"Processing: {filename}")
 
-        # Load data
-        df, file_meta = load_data(filename)
+class DayWriter:
+    """
+    Collect decoded data of one table and write every day as soon as it is complete.
 
-        # Adjust units for CO2 and H2O
-        if file_meta[3][7] == "umol/mol":
-            df["CO2"] = df["CO2"] / 44
-            file_meta[3][7] = "mmol/m^3"
-        elif file_meta[3][7] == "umol/m^3":
-            file_meta[3][7] = "mmol/m^3"
+    Progress is kept in dst_dir/manifest.jsonl: a day is recorded once its file
+    has been written and an input file once all days it has data for are
+    written. Recorded days are never rewritten. Data can be added file by file
+    (process_files_by_day) or as the new frames of growing files (watch.py).
 
-        if file_meta[3][8] == "mmol/mol":
-            df["H2O"] = df["H2O"] / 0.018
-            file_meta[3][8] = "mmol/m^3"
+    Args:
+        var (str): Variable name, the prefix of the day files.
+        dst_dir (str): Destination directory of the day files and the manifest.
+        fmt (str): Format of the day files, see write_full_day_data.
+    """
 
-        # Append data to temporary DataFrame
-        temp_df = pd.concat([temp_df, df], ignore_index=True)
+    def __init__(self, var, dst_dir, fmt="dat"):
+        self.var = var
+        self.dst_dir = dst_dir
+        self.fmt = fmt
+        self.manifest = Manifest(os.path.join(dst_dir, "manifest.jsonl"))
+        self.temp_df = pd.DataFrame()  # accumulated data of days that are not complete yet
+        self.meta = None
+        self.pending = {}  # input files with days not yet written: filename -> (sha1, records, timestamps, days)
+        self.taken = set()  # days handed out by complete_days
+        self.meta_written = None  # metadata in dst_dir/meta.txt
+
+    def add(self, filename, df, data_meta, digest=None):
+        """
+        Add decoded data of an input file and write the days it completes.
+
+        Args:
+            filename (str): Input file the data was decoded from.
+            df (pd.DataFrame): Decoded data, from load_data.
+            data_meta (list): Metadata of the decoded data.
+            digest (str, optional): Hash of the input file, if already known.
+
+        Returns:
+            list: Paths of the day files written.
+        """
+        written = []
+        for day, df_day, meta, sources in self.complete_days(filename, df, data_meta, digest):
+            file_output, stats = self.write_day(day, df_day, meta)
+            self.record_day(day, file_output, sources, stats)
+            written.append(file_output)
+        return written
+
+    def complete_days(self, filename, df, data_meta, digest=None):
+        """
+        Add decoded data of an input file and take the days it completes.
+
+        A day is taken once: later data of a taken or recorded day is dropped.
+        The days are written by write_day and recorded by record_day, which
+        process_files_by_day runs in other threads than this method.
+
+        Args:
+            filename (str): Input file the data was decoded from.
+            df (pd.DataFrame): Decoded data, from load_data.
+            data_meta (list): Metadata of the decoded data.
+            digest (str, optional): Hash of the input file, if already known.
+
+        Returns:
+            list: (day, df_day, meta, sources) of the days to write, sources
+                  being the input files with data of the day.
+        """
+        if df.empty:
+            return []
+
+        records = (df["RECORD"].min(), df["RECORD"].max())
+        timestamps = (df["TIMESTAMP"].min(), df["TIMESTAMP"].max())
+        days = set(df["TIMESTAMP"].dt.date.unique())
+        if filename in self.pending:
+            # more data of a file added before, e.g. the new frames of a growing file
+            _, old_records, old_timestamps, old_days = self.pending[filename]
+            records = (min(records[0], old_records[0]), max(records[1], old_records[1]))
+            timestamps = (min(timestamps[0], old_timestamps[0]), max(timestamps[1], old_timestamps[1]))
+            days |= old_days
+        self.pending[filename] = (digest, records, timestamps, days)
+
+        # Append data to temporary DataFrame, records repeated by overlapping files are kept once
+        temp_df = pd.concat([self.temp_df, df], ignore_index=True)
+        temp_df = temp_df.drop_duplicates(subset=["TIMESTAMP", "RECORD"], ignore_index=True)
 
         # Add 'date' column for day grouping
         temp_df["date"] = temp_df["TIMESTAMP"].dt.date
 
         # Check completeness of days in accumulated data
+        complete = []
         for day in temp_df["date"].unique():
             df_day = temp_df[temp_df["date"] == day]
 
             # Check if the current day's data is complete (includes last timestamp)
             last_ts = df_day["TIMESTAMP"].max()
             if last_ts.time() >= pd.to_datetime("23:59:59.900").time():
-                # Write full-day data to file
-                write_full_day_data(df_day, file_meta, day, dst_dir, var)
-
-                # Update the last saved filename
-                last_saved_file = os.path.basename(filename)  # Use only the file name
+                key = f"{self.var}_{day}"
+                if key in self.taken or self.manifest.output_done(key):
+                    print(f"Skipping {day} (already written)")
+                else:
+                    self.taken.add(key)
+                    sources = [name for name, entry in list(self.pending.items()) if day in entry[3]]
+                    complete.append((day, df_day, data_meta, sources))
 
                 # Remove processed day's data from the temporary DataFrame
                 temp_df = temp_df[temp_df["date"] != day]
 
+        self.temp_df = temp_df
+
         # Update meta for potential metadata file writing later
-        meta = file_meta if meta is None else meta
+        self.meta = data_meta if self.meta is None else self.meta
+        return complete
+
+    def write_day(self, day, df_day, meta):
+        """
+        Write the file of a complete day, see complete_days.
+
+        Returns:
+            tuple: Path of the day file and the statistics recorded with it.
+        """
+        file_output = write_full_day_data(df_day, meta, day, self.dst_dir, self.var, self.fmt)
+        stats = {"records": len(df_day),
+                 "completeness": round(completeness(df_day["TIMESTAMP"].to_numpy()), 4)}
+        return file_output, stats
+
+    def record_day(self, day, file_output, sources, stats):
+        """Record a written day file in the manifest."""
+        self.manifest.record_output(f"{self.var}_{day}", file_output, sources, stats)
+
+    def finished_inputs(self):
+        """Input files added so far all of whose days have been written."""
+        return [name for name, entry in list(self.pending.items())
+                if all(self.manifest.output_done(f"{self.var}_{day}") for day in entry[3])]
+
+    def record_input(self, filename, digest=None):
+        """
+        Record an input file as completely processed.
+
+        Args:
+            filename (str): Input file.
+            digest (str, optional): Hash of its content; defaults to the one given to add.
+        """
+        sha1, records, timestamps, days = self.pending.pop(filename, (None, None, None, ()))
+        keys = [f"{self.var}_{day}" for day in sorted(days)]
+        outputs = [self.manifest.outputs[key]["file"] for key in keys]
+        self.manifest.record_input(filename, digest or sha1, records, timestamps, outputs)
+
+    def write_meta(self):
+        """Write the metadata of the decoded data to dst_dir/meta.txt."""
+        # this logic assumes metadata remains the same; it is written once per run
+        if self.meta and self.meta != self.meta_written:
+            write_meta_file(self.meta, self.dst_dir)
+            self.meta_written = self.meta
+
+
+def process_files_by_day(var, src_dir, dst_dir, file_meta=None, patterns=None, workers=1,
+                         cache_dir=None, start=None, end=None, fmt="dat", catalog=None,
+                         pool=None, float64=False):
+    """
+    Process input files by day, adjusting units, writing full-day data, and logging progress.
 
-    # After processing all files, log the last saved filename
-    if last_saved_file:
-        save_last_processed_file(dst_dir, last_saved_file)
+    Reruns skip input files recorded in dst_dir/manifest.jsonl and never rewrite
+    recorded days (see DayWriter), so a run interrupted at any point can simply
+    be started again.
 
-    # Write any remaining metadata file - this logic assumes metadata remains the same
-    if meta:
-        metafile = os.path.join(dst_dir, "meta.txt")
-        with open(metafile, "w") as f:
-            for row in meta:
-                quoted_row = ['"{}"'.format(item) for item in row]
-                f.write(",".join(quoted_row) + "\n")
+    Files are read, decoded, split into days and written in a pipeline
+    (pipeline.run_pipeline): the next files are read ahead and decoded in the
+    process pool while WRITERS threads write the days of the current one.
+    The manifest entries of the run are appended together at its end
+    (Manifest.batch).
+
+    Args:
+        var (str): Variable name to filter and process files.
+        src_dir (str): Source directory containing input files.
+        dst_dir (str): Destination directory for output and logs.
+        file_meta (str, optional): EddyPro metadata file describing the columns;
+            used for column selection and unit conversion.
+        patterns (list, optional): Glob patterns of the input files, f"{var}*.dat" by default.
+        workers (int): Number of processes decoding files ahead.
+        cache_dir (str, optional): Cache of decoded files, see ingest.load_cached.
+        start (str, optional): Only write data from this time on.
+        end (str, optional): Only write data before this time. With start or end
+            set, input files are not recorded as processed, since data outside
+            the period has been left out.
+        fmt (str): Format of the day files, see write_full_day_data.
+        catalog (str, optional): SQLite catalog of the raw files; with a period
+            only the frames holding it are decoded (see catalog.plan_reads).
+        pool (concurrent.futures.Executor, optional): Process pool shared with other
+            tables, see ingest.decode_files.
+        float64 (bool): Keep floating point columns in double precision, see ingest.load_data.
+
+    Returns:
+        None
+    """
+    writer = DayWriter(var, dst_dir, fmt)
+    if not writer.manifest.inputs and not writer.manifest.outputs:
+        # first run after log_ts.txt was replaced by the manifest
+        seed_manifest(writer.manifest, src_dir, dst_dir, var)
+
+    # Files whose content has been processed completely are skipped
+    new_files = list_new_files(writer.manifest, src_dir, var, patterns, start, end, catalog)
+    full_filenames = {filename: digest for filename, digest, _ in new_files}
+    reads = [(filename, byte_range) for filename, _, byte_range in new_files]
+
+    # Compile the column plan once for all files
+    plan = compile_column_plan(file_meta) if file_meta else None
+    whole = start is None and end is None
+
+    def split(decoded):
+        filename, df, data_meta = decoded
+        print(f"Processing: {filename}")
+        df = select_period(df, start, end)
+        return filename, df.empty, writer.complete_days(filename, df, data_meta, full_filenames[filename])
+
+    def write(split_days):
+        filename, empty, days = split_days
+        return filename, empty, [(day, sources) + writer.write_day(day, df_day, meta)
+                                 for day, df_day, meta, sources in days]
+
+    # The next files are read and decoded while the days of the current one are written
+    with ExitStack() as stack:
+        if pool is None and workers > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        stack.enter_context(writer.manifest.batch())
+        steps = decode_steps(plan, workers, pool, cache_dir, float64) + [
+            Step('split', split),
+            Step('write', write, WRITERS)]
+        for filename, empty, written in run_pipeline(reads, steps):
+            if empty:
+                if whole:
+                    writer.manifest.record_input(filename, full_filenames[filename])
+                continue
+            for day, sources, file_output, stats in written:
+                writer.record_day(day, file_output, sources, stats)
+
+            # Input files are done once all their days are written
+            if whole:
+                for name in writer.finished_inputs():
+                    writer.record_input(name)
+
+    # Write any remaining metadata file
+    writer.write_meta()
 
 
 def main():
@@ -254,8 +430,11 @@ def main():
     src_dir = '../../DataLogger/CRD/'
     os.makedirs(dst_dir, exist_ok=True)
 
+    # EddyPro metadata describing the columns of the decoded files
+    file_meta = 'EddyPro/setx.metadata'
+
     # Run the processing function
-    process_files_by_day(var, src_dir, dst_dir)
+    process_files_by_day(var, src_dir, dst_dir, file_meta, catalog='../../decoded_data/catalog.sqlite')
 
 
 if __name__ == "__main__":
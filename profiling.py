@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# JSON lines log of the stages; set in the environment so worker processes log too
+LOG_ENV = 'EDDYFLOW_PROFILE'
+
+# counters summed over the stages in the summary
+COUNTERS = ['bytes', 'records', 'frames', 'rejected_frames']
+
+
+def enable(filename):
+    """Log the stages of this process and the processes it starts to filename."""
+    filename = os.path.abspath(filename)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    os.environ[LOG_ENV] = filename
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB."""
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return max(own, children) / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+class Stage:
+    """Counters of a running stage, see stage."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.fields[key] = self.fields.get(key, 0) + (value or 0)
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a processing stage and append it to the profiling log.
+
+    Does nothing unless profiling is enabled (see enable). The log entry holds
+    the stage name, process id, start time, wall and CPU seconds, peak RSS and
+    the given fields; counters (bytes, records, frames, rejected_frames) can
+    also be added while the stage runs:
+
+        with stage('decode', file=filename) as s:
+            ...
+            s.add(records=n)
+
+    Args:
+        name (str): Stage name, e.g. decode, write_day, eddypro.
+        **fields: Values logged with the stage, e.g. file.
+
+    Yields:
+        Stage: Counters of the stage.
+    """
+    log = os.environ.get(LOG_ENV)
+    current = Stage(dict(fields))
+    if not log:
+        yield current
+        return
+
+    started = datetime.now()
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        entry = {'stage': name, 'pid': os.getpid(), 'start': started.isoformat(),
+                 'seconds': round(time.perf_counter() - t0, 6),
+                 'cpu_seconds': round(time.process_time() - cpu0, 6),
+                 'peak_rss_mb': peak_rss_mb()}
+        entry.update(current.fields)
+        if error is not None:
+            entry['error'] = error
+        # one write per line, so the lines of concurrent processes do not mix
+        with open(log, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+
+def summarize(filename):
+    """
+    Sum a profiling log by stage.
+
+    Args:
+        filename (str): Profiling log.
+
+    Returns:
+        dict: Stage -> dict with 'count', 'seconds', 'cpu_seconds', the
+              COUNTERS and the largest 'peak_rss_mb', in order of first appearance.
+    """
+    summary = {}
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            total = summary.setdefault(entry['stage'], dict(
+                {'count': 0, 'seconds': 0., 'cpu_seconds': 0., 'peak_rss_mb': 0.},
+                **{key: 0 for key in COUNTERS}))
+            total['count'] += 1
+            for key in ['seconds', 'cpu_seconds'] + COUNTERS:
+                total[key] += entry.get(key) or 0
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], entry.get('peak_rss_mb') or 0)
+    return summary
+
+
+def print_summary(filename):
+    """Print the summary of a profiling log, one line per stage."""
+    print(f"{'stage':12s} {'count':>6s} {'wall s':>9s} {'cpu s':>9s} {'MB':>9s} {'MB/s':>7s} "
+          f"{'records':>11s} {'rejected':>8s} {'peak MB':>8s}")
+    for name, total in summarize(filename).items():
+        mb = total['bytes'] / 1e6
+        rate = mb / total['seconds'] if total['seconds'] else 0.
+        print(f"{name:12s} {total['count']:6d} {total['seconds']:9.2f} {total['cpu_seconds']:9.2f} "
+              f"{mb:9.1f} {rate:7.1f} {total['records']:11d} {total['rejected_frames']:8d} "
+              f"{total['peak_rss_mb']:8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a profiling log by stage.")
+    parser.add_argument('log', type=str, help='profiling log (JSON lines)')
+    args = parser.parse_args()
+    print_summary(args.log)
+
+
+if __name__ == "__main__":
+    main()
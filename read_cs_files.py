@@ -1,10 +1,32 @@
+import io
 import struct
-import os
 import datetime as _dt
-from operator import itemgetter
+from contextlib import contextmanager
 
 __author__ = 'spirro00'
 
+# fields that are always read when only some columns are requested,
+# since the timestamp and record number are needed to order the data
+ALWAYS_READ = ['TIMESTAMP', 'RECORD', 'SECONDS', 'NANOSECONDS']
+
+# header line holding the field names, per filetype
+NAME_LINE = {'TOA5': 1, 'TOB1': 1, 'TOB3': 2, 'CSIXML': 1}
+
+# numpy dtypes of the decoded binary fields: IEEE4 is single precision and
+# FP2 has at most four significant digits, so float32 holds both exactly
+COMPACT_DTYPES = {'FP2': 'float32', 'IEEE4': 'float32', 'IEEE4B': 'float32',
+                  'UINT2': 'uint16', 'INT4': 'int32', 'UINT4': 'uint32', 'ULONG': 'uint32',
+                  'LONG': 'int32', 'Boolean': 'bool', 'Bool8': 'uint8', 'NSec': 'datetime64[ns]',
+                  'DATETIME': 'datetime64[ns]'}
+
+# suffixes of compressed files, read by read_cs_open: gzip, xz, zstd and block archives (archive.py)
+COMPRESSED_SUFFIXES = ['.gz', '.xz', '.zst', '.blk']
+
+# time units of TOB3 table intervals and frame time resolutions: (seconds, per)
+TIME_UNITS = {'NSEC': (1, 10 ** 9), 'USEC': (1, 10 ** 6), 'MSEC': (1, 10 ** 3), 'SEC': (1, 1),
+              'MIN': (60, 1), 'HR': (3600, 1)}
+
+
 def fp22float(fp2integer):
     inf, neginf, nan = 0x1fff, 0x9fff, 0x9ffe
 
@@ -22,11 +44,93 @@ def fp22float(fp2integer):
     return floatvalue
 
 
+def tob3_to_datetime(qword):
+    # Campbell TOB3 timestamps: seconds since 1990-01-01 in upper 32 bits,
+    # fractional seconds in lower 32 bits
+    seconds = (qword >> 32) & 0xFFFFFFFF
+    fraction = qword & 0xFFFFFFFF
+    frac_sec = fraction / 2**32  # convert fractional part to seconds
+    epoch = _dt.datetime(1990, 1, 1)
+    return epoch + _dt.timedelta(seconds=seconds + frac_sec)
+
+
+def read_cs_nsec(raw):
+    """
+    NSec fields of all records at once, as tob3_to_datetime but with integer operations.
+
+    Args:
+        raw (np.ndarray): (records, 8) bytes of the fields, big-endian seconds
+            since 1990 in the upper and the fraction of a second in the lower 32 bits.
+
+    Returns:
+        np.ndarray: datetime64[ns] values.
+    """
+    import numpy as np
+    qword = raw.view('>u8')[:, 0].astype(np.uint64)
+    seconds = (qword >> 32).astype(np.int64)
+    nanoseconds = ((qword & 0xFFFFFFFF) * 10 ** 9 >> 32).astype(np.int64)
+    return np.datetime64('1990-01-01', 'ns') + (seconds * 10 ** 9 + nanoseconds).astype('timedelta64[ns]')
+
+
+def read_cs_bool8(raw):
+    """
+    Bool8 fields of all records at once.
+
+    Args:
+        raw (np.ndarray): (records, 1) bytes of the fields, eight flags each.
+
+    Returns:
+        np.ndarray: (records, 8) booleans, the most significant bit first.
+    """
+    import numpy as np
+    return np.unpackbits(raw, axis=1).view(bool)
+
+
+def read_cs_ascii(raw):
+    """
+    ASCII(n) fields of all records at once, as fixed-width bytes.
+
+    A string ends at its first NUL byte; the bytes after it are left out.
+    The values can be compared as they are (e.g. values == b'OK') or
+    decoded by read_cs_strings.
+
+    Args:
+        raw (np.ndarray): (records, n) bytes of the fields.
+
+    Returns:
+        np.ndarray: Values of dtype S{n}.
+    """
+    import numpy as np
+    raw[np.logical_or.accumulate(raw == 0, axis=1)] = 0
+    return np.ascontiguousarray(raw).view(f'S{raw.shape[1]}')[:, 0]
+
+
+def read_cs_strings(values):
+    """
+    Fixed-width byte strings (see read_cs_ascii) as str, every distinct value decoded once.
+
+    Returns:
+        np.ndarray: Object array of str.
+    """
+    import numpy as np
+    uniques, codes = np.unique(values, return_inverse=True)
+    decoded = np.array([value.decode('unicode_escape') for value in uniques.tolist()], dtype=object)
+    return decoded[codes]
+
+
+# fields decoded for all records at once instead of record by record:
+# format -> function of the (records, size) bytes of the fields
+BULK_DECODERS = {'NSec': read_cs_nsec, 'Bool8': read_cs_bool8, 'ASCII': read_cs_ascii,
+                 'String': read_cs_ascii}
+
+
 def read_cs_formats(csformat):
     pyformat = []
+    # UINT2 is big-endian like FP2, but written '!H' so that the FP2
+    # conversion (converters keyed by '>H') is not applied to it
     knownformats = {'FP2': '>H', 'IEEE4': 'f', 'IEEE4B': '>f',
-                    'UINT2': '>H', 'INT4': '>i', 'UINT4': '>L', 'NSec': '>Q',
-                    'String': 's', 'Boolean': '?', 'Bool8': '8?',
+                    'UINT2': '!H', 'INT4': '>i', 'UINT4': '>L', 'NSec': '>Q',
+                    'String': 's', 'Boolean': '?', 'Bool8': 'B',
                     'LONG': 'l', 'ULONG': '>L'}
     for _ in csformat:
         if _.startswith('ASCII'):
@@ -54,9 +158,264 @@ def read_cs_formats(csformat):
     return pyformat
 
 
+def read_cs_dtypes(meta, float64=False):
+    """
+    Storage dtype of every column of decoded TOB1 or TOB3 data.
+
+    Floating point fields are float32 (float64 with float64=True), integers
+    the smallest dtype holding their format and strings 'category'. The dtype
+    is None for fields without a policy and for TOA5 and CSIXML files, whose
+    values are parsed from text.
+
+    Args:
+        meta (list): Metadata returned with the data, the types in the last line.
+        float64 (bool): Keep floating point fields in double precision.
+
+    Returns:
+        list: numpy dtype names (or 'category' or None), one per column of meta[2].
+    """
+    if meta[0][0] not in ['TOB1', 'TOB3']:
+        return [None] * len(meta[NAME_LINE.get(meta[0][0], 1)])
+    dtypes = []
+    for csformat in meta[-1]:
+        if csformat.startswith('ASCII') or csformat == 'String':
+            dtypes.append('category')
+            continue
+        dtype = COMPACT_DTYPES.get(csformat)
+        if float64 and dtype == 'float32':
+            dtype = 'float64'
+        dtypes.append(dtype)
+    return dtypes
+
+
+def read_cs_layout(pyformat, keep=None, converters=None):
+    # byte offset of every field within a record, so that only the
+    # fields in keep are unpacked and all others are skipped
+    converters = converters or {}
+    layout, offset = [], 0
+    for i, fmt in enumerate(pyformat):
+        unpacker = struct.Struct(fmt)
+        if keep is None or i in keep:
+            convert = converters.get('s' if fmt[-1] == 's' else fmt)
+            layout.append((unpacker, offset, convert))
+        offset += unpacker.size
+    return layout, offset
+
+
+def read_cs_bulk(buf, recstart, pyformat, csformat, keep=None, strings='str'):
+    """
+    Split the kept fields into those decoded record by record and those decoded in bulk.
+
+    Fields with a decoder in BULK_DECODERS are decoded for all records at
+    once from their bytes at recstart. String fields are decoded to str, or
+    with strings='bytes' kept as fixed-width bytes (see read_cs_ascii).
+
+    Args:
+        buf (bytes): Data holding the records.
+        recstart (np.ndarray): Start of every record in buf, in file order.
+        pyformat (list): struct formats of the fields, from read_cs_formats.
+        csformat (list): Campbell formats of the fields (the last line of the meta).
+        keep (list, optional): Indices of the fields to read, all by default.
+        strings (str): 'str' or 'bytes'.
+
+    Returns:
+        tuple: A tuple containing:
+            - keep (list): Indices of the fields to unpack record by record.
+            - bulk (dict): Position among the kept fields -> decoded array, in file order.
+    """
+    import numpy as np
+    kept = [i for i in range(len(pyformat)) if keep is None or i in keep]
+    bulk, offsets, offset = {}, {}, 0
+    for i, fmt in enumerate(pyformat):
+        offsets[i] = offset
+        offset += struct.calcsize(fmt)
+    data = np.frombuffer(buf, dtype=np.uint8)
+    for pos, i in enumerate(kept):
+        decode = BULK_DECODERS.get('ASCII' if csformat[i].startswith('ASCII') else csformat[i])
+        if decode is None:
+            continue
+        size = struct.calcsize(pyformat[i])
+        # the bytes of the field in every record, gathered from a view of
+        # the data with a row starting at every byte
+        values = decode(np.lib.stride_tricks.sliding_window_view(data, size)[recstart + offsets[i]])
+        if strings == 'str' and values.dtype.kind == 'S':
+            values = read_cs_strings(values)
+        bulk[pos] = values
+    return [i for pos, i in enumerate(kept) if pos not in bulk], bulk
+
+
+def read_cs_merge(rows, bulk, order, shift=0, bycol=True):
+    # put the fields decoded in bulk into the records (or columns), which hold
+    # the records of the given file order; shift counts the fields before the
+    # kept ones (the TOB3 TIMESTAMP and RECORD) less fields merged into one
+    if not rows:
+        return []
+    if bycol:
+        data = list(map(list, zip(*rows)))
+        for pos, values in sorted(bulk.items()):
+            data.insert(pos + shift, values[order])
+        return data
+    for pos, values in sorted(bulk.items()):
+        for row, value in zip(rows, values[order]):
+            row.insert(pos + shift, value)
+    return rows
+
+
+def read_cs_unpack(recbytes, layout, base=0):
+    # the record starts at byte base of recbytes
+    values = []
+    for unpacker, offset, convert in layout:
+        value = unpacker.unpack_from(recbytes, base + offset)[0]
+        if convert is not None:
+            value = convert(value)
+        values.append(value)
+    return values
+
+
+def read_cs_select(meta, filetype, columns, quiet=True):
+    # indices of the requested columns within the header lines
+    names = meta[NAME_LINE[filetype]]
+    missing = [i for i in columns if i not in names and i not in ALWAYS_READ]
+    if missing:
+        print(f'Warning: the columns {missing} are not in the file and are skipped')
+    keep = [i for i, name in enumerate(names) if name in columns or name in ALWAYS_READ]
+    if not quiet:
+        print(f'Reading {len(keep)} of {len(names)} columns')
+    return keep
+
+
+def read_cs_reduce_meta(meta, filetype, keep):
+    # reduce the header lines to the kept columns, in place
+    for line in range(NAME_LINE[filetype], len(meta)):
+        meta[line] = [meta[line][i] for i in keep if i < len(meta[line])]
+    return meta
+
+
+def read_cs_tob3_meta(meta):
+    # have to insert the timestamp and recordnumber into the meta
+    meta[2].insert(0, 'RECORD'), meta[2].insert(0, 'TIMESTAMP')
+
+    # units
+    meta[3].insert(0, 'RN'), meta[3].insert(0, 'TS')
+
+    # sampled as what
+    meta[4].insert(0, ' '), meta[4].insert(0, ' ')
+
+    # corresponding units
+    meta[5].insert(0, 'ULONG'), meta[5].insert(0, 'DATETIME')
+    return meta
+
+
+def read_cs_open(filename):
+    """
+    Open a CS file for reading, decompressing it if it is compressed.
+
+    The compression is recognized from the first bytes of the file, so the
+    name does not matter. gzip and xz files are decompressed as they are read
+    and seeking backwards decompresses them again from the start; zstd files
+    (which need the zstandard package) are decompressed into memory. Block
+    archives (see archive.write_block_archive) decompress only the blocks
+    that are read, so reading a byte range of a large file stays cheap.
+    Uncompressed files are read in large aligned blocks, see
+    readahead.ReadAheadFile.
+
+    Args:
+        filename (str): Path of the file.
+
+    Returns:
+        file object: Binary, seekable file object of the uncompressed data.
+    """
+    from readahead import open_sequential
+    file_obj = open_sequential(filename)
+    magic = file_obj.read(8)
+    file_obj.seek(0)
+    if magic.startswith((b'\x1f\x8b', b'\xfd7zXZ\x00', b'\x28\xb5\x2f\xfd', b'CSBLOCK1')):
+        file_obj.close()
+    if magic.startswith(b'\x1f\x8b'):
+        import gzip
+        return gzip.open(filename, 'rb')
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        import lzma
+        return lzma.open(filename, 'rb')
+    if magic.startswith(b'\x28\xb5\x2f\xfd'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f'{filename} is zstd compressed, reading it needs the zstandard package') from None
+        with open(filename, mode = 'rb') as file_obj:
+            return io.BytesIO(zstandard.ZstdDecompressor().stream_reader(file_obj).read())
+    if magic == b'CSBLOCK1':
+        from archive import open_block_archive
+        return open_block_archive(filename)
+    return file_obj
+
+
+@contextmanager
+def read_cs_source(source):
+    """
+    Binary, seekable file object of a CS file.
+
+    Args:
+        source: Path of the file, its content as bytes, bytearray or
+            memoryview, or a binary stream. Seekable streams are read from
+            their current position, and are left open at that position so
+            they can be read again; other streams (e.g. a socket) are read
+            into memory first. Compressed files are decompressed, see
+            read_cs_open.
+
+    Yields:
+        file object: The data of the file.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    elif hasattr(source, 'read'):
+        seekable = getattr(source, 'seekable', None)
+        if seekable is None or not seekable():
+            yield io.BytesIO(source.read())
+            return
+        start = source.tell()
+        try:
+            yield source
+        finally:
+            source.seek(start)
+    else:
+        with read_cs_open(source) as file_obj:
+            yield file_obj
+
+
 def read_cs_files(filename, forcedatetime=False,
-                  bycol=True, quiet=True, metaonly=False,**kwargs):
-    with open(filename, mode = 'rb') as file_obj:
+                  bycol=True, quiet=True, metaonly=False, columns=None, report=False, **kwargs):
+    """
+    Read a Campbell Scientific TOA5, TOB1, TOB3 or CSIXML file.
+
+    filename is the path of the file, or its content as bytes or a binary
+    stream (see read_cs_source), e.g. a gzip stream or a downloaded buffer,
+    so data can be decoded without being written to disk first.
+
+    columns is an optional list of column names to read, all other columns are
+    skipped while decoding. TIMESTAMP and RECORD are always returned. The meta
+    only describes the returned columns; with metaonly the meta is returned in
+    the same layout as with the data.
+
+    With report=True a third value is returned, a dict describing the record
+    sequence of TOB3 files (see record_qc.analyse_records): number of records,
+    dropped duplicates, gaps and logger resets. It is empty for other files.
+
+    byte_range=(start, stop) limits a TOB3 file to the frames starting within
+    these byte positions (stop None for the end of the file), so a growing
+    file can be read incrementally; the report then holds the 'byte_range' of
+    the frames actually read, its end being the start for the next read. The
+    report of a TOB3 file also counts the 'frames' read and the
+    'rejected_frames' failing validation, and lists the byte ranges 'skipped'
+    because they hold no valid frame (see read_cs_tob3_frames).
+
+    String fields of TOB1 and TOB3 files end at their first NUL byte. With
+    strings='bytes' they are returned as fixed-width bytes arrays (dtype
+    S{n}, see read_cs_ascii) instead of str, which is enough to compare
+    values such as status codes and is decoded later if at all.
+    """
+    qc = {} if report else None
+    with read_cs_source(filename) as file_obj:
         firstline = file_obj.readline().rstrip().decode().split(sep = ',')
         firstline = [i.replace('"', '') for i in firstline]
         filetype = firstline[0]
@@ -69,7 +428,7 @@ def read_cs_files(filename, forcedatetime=False,
             if csixml[0] != 'csixml':
                 if not quiet:
                     print('Filecontent indicated XML but apparently it\'s not a csixml file')
-                return False, False
+                return (False, False, qc) if report else (False, False)
             else:
                 csixmlversion = float(csixml[1].split('=')[-1])
                 if csixmlversion > 1.0:
@@ -85,7 +444,14 @@ def read_cs_files(filename, forcedatetime=False,
             print('reading header and determening filetype')
 
         meta = read_cs_meta(file_obj, filetype)
+        keep = None
+        if columns is not None and filetype in NAME_LINE:
+            keep = read_cs_select(meta, filetype, columns, quiet = quiet)
         if metaonly:
+            if keep is not None:
+                read_cs_reduce_meta(meta, filetype, keep)
+            if filetype == 'TOB3':
+                read_cs_tob3_meta(meta)
             return meta
         if not quiet:
             print(f'Reading the file {filename}')
@@ -95,29 +461,28 @@ def read_cs_files(filename, forcedatetime=False,
                 print(f'{filename} is a {filetype}-File')
             if filetype == 'TOA5':
                 data = read_cs_toa5(file_obj,
-                                    bycol = bycol, forcedatetime = forcedatetime, **kwargs)
+                                    bycol = bycol, forcedatetime = forcedatetime,
+                                    keep = keep, **kwargs)
 
             if filetype == 'TOB1':
-                data = read_cs_tob1(file_obj, meta, **kwargs)
+                data = read_cs_tob1(file_obj, meta, keep = keep, **kwargs)
 
             if filetype == 'TOB3':
-                data = read_cs_tob3(file_obj, meta, quiet = quiet, **kwargs)
-                # have to insert the timestamp and recordnumber into the meta
-                meta[2].insert(0, 'RECORD'), meta[2].insert(0, 'TIMESTAMP')
-
-                # units
-                meta[3].insert(0, 'RN'), meta[3].insert(0, 'TS')
-
-                # sampled as what
-                meta[4].insert(0, ' '), meta[4].insert(0, ' ')
-
-                # corresponding units
-                meta[5].insert(0, 'ULONG'), meta[5].insert(0, 'DATETIME')
+                data = read_cs_tob3(file_obj, meta, quiet = quiet, keep = keep, report = qc, **kwargs)
 
             if filetype == 'CSIXML':
                 data = read_cs_csixml(file_obj, bycol=bycol,
-                                      forcedatetime = forcedatetime,**kwargs)
+                                      forcedatetime = forcedatetime, keep = keep, **kwargs)
 
+            if keep is not None:
+                read_cs_reduce_meta(meta, filetype, keep)
+            if filetype == 'TOB3':
+                read_cs_tob3_meta(meta)
+
+            if report:
+                # other files are read as a whole
+                qc.setdefault('byte_range', (0, file_obj.tell()))
+                return data, meta, qc
             return data, meta
 
 
@@ -125,7 +490,7 @@ def read_cs_files(filename, forcedatetime=False,
         else:
             if not quiet:
                 print('Neither TOA5,TOB1, TOB3 not CSIXML-File')
-            return False, False
+            return (False, False, qc) if report else (False, False)
 
 
 def read_cs_meta(file_obj, filetype):
@@ -145,17 +510,18 @@ def read_cs_meta(file_obj, filetype):
         import xml.etree.ElementTree as ET
 
         # there needs to be a opening statement like <head>
-        tree = ET.parse(file_obj.name)
+        file_obj.seek(0)
+        tree = ET.parse(file_obj)
         root = tree.getroot()
 
         # we will need a nested list
-        meta = [[i.text for i in root.getchildren()[0][0]]]
+        meta = [[i.text for i in root[0][0]]]
 
         # these are by default process name type, but we'd like them as name process type..
-        metakeys = sorted(root.getchildren()[0][1][0].keys())
+        metakeys = sorted(root[0][1][0].keys())
 
         meta.extend(
-            [i.attrib[metakeys[line]] for i in root.getchildren()[0][1]]
+            [i.attrib[metakeys[line]] for i in root[0][1]]
             for line in range(len(metakeys))
         )
 
@@ -192,21 +558,26 @@ def read_cs_convert_tob1_daterec(daterec):
     return date
 
 
-def read_cs_csixml(file_obj, bycol=True, forcedatetime=False, guesstype=False):
+def read_cs_csixml(file_obj, bycol=True, forcedatetime=False, guesstype=False, keep=None,
+                   **kwargs):
     import xml.etree.ElementTree as ET
     # there needs to be a opening statement like <head>
-    tree = ET.parse(file_obj.name)
+    file_obj.seek(0)
+    tree = ET.parse(file_obj)
     root = tree.getroot()
     # we will need a nested list for the data
     # [1] contains the data
     data = []
-    for record in root.getchildren()[1]:
+    for record in root[1]:
 
         # the timestamp and recordnumber are in the xml tags
         entry = [record.attrib['time'], int(record.attrib['no']), ]
 
         # but the "float" numbers are in the text tag
-        entry += [rec.text for rec in record]
+        if keep is None:
+            entry += [rec.text for rec in record]
+        else:
+            entry += [record[i - 2].text for i in keep[2:]]
 
         data.append(entry)
 
@@ -238,8 +609,11 @@ def read_cs_toa5(file_obj,
                  forcedatetime=False,
                  bycol=True,
                  guesstype=False,
+                 keep=None,
                  **kwargs):
     data = [i.rstrip().decode().replace('"', '').split(sep = ',') for i in file_obj]
+    if keep is not None:
+        data = [[line[i] for i in keep] for line in data]
 
     if bycol:
         data = list(map(list, zip(*data)))
@@ -268,39 +642,218 @@ def read_cs_toa5(file_obj,
 
 def read_cs_tob1(file_obj, meta,
                  bycol=True,
+                 keep=None,
+                 strings='str',
                  **kwargs):
+    import numpy as np
+
     csformat = meta[-1]
     pyformat = read_cs_formats(csformat)
     #    print(csformat)
-    subrecsizes = sum(struct.Struct(i).size for i in pyformat)
-    recbegin = file_obj.tell()
-    n_rec_total = (os.path.getsize(file_obj.name) - recbegin) / subrecsizes
-    data = []
-    for _ in range(int(n_rec_total)):
-        tempdata = []
-        for ii in pyformat:
-            nbyte = struct.Struct(ii).size
-            if ii == 'L':
-                ii = '>L'
-            tdata = struct.unpack_from(ii, file_obj.read(nbyte))[0]
-            if ii == '>H':
-                tdata = fp22float(tdata)
-            tempdata.append(tdata)
-        data.append(list(tempdata))
-    for i, ii in enumerate(data):
-        data[i] = read_cs_convert_tob1_daterec(ii)
-    if bycol:
-        data = list(map(list, zip(*data)))
-    return data
+    _, subrecsizes = read_cs_layout(pyformat)
+    buf = file_obj.read()
+    # a record cut short at the end of the file is left out
+    recstart = np.arange(len(buf) // subrecsizes, dtype=np.int64) * subrecsizes
+    unpacked, bulk = read_cs_bulk(buf, recstart, pyformat, csformat, keep, strings)
+    layout, _ = read_cs_layout(pyformat, unpacked, {'>H': fp22float})
+    data = [read_cs_convert_tob1_daterec(read_cs_unpack(buf, layout, start)) for start in recstart.tolist()]
+    # SECONDS and NANOSECONDS are merged into the timestamp
+    return read_cs_merge(data, bulk, slice(None), -1, bycol)
+
+
+def read_cs_tob3_frames(buf, framesize, validation, timing=None):
+    """
+    Find the valid frames in the data of a TOB3 file.
+
+    The footers of all frames are checked against the validation stamps at
+    once. After a frame failing validation, e.g. bytes lost or repeated by an
+    interrupted download, the frames are searched again at every byte (see
+    read_cs_tob3_resync), so decoding continues with every good frame.
+
+    Args:
+        buf (bytes): Data of the file, starting at a frame.
+        framesize (int): Size of a frame in bytes.
+        validation (list): Validation stamp and its complement.
+        timing (tuple, optional): Records per frame, seconds per record and
+            seconds per subsecond unit of the frame headers, to check the
+            headers of resynchronised frames (see read_cs_tob3_resync).
+
+    Returns:
+        tuple: A tuple containing:
+            - offsets (list): Start of every valid frame in buf.
+            - skipped (list): (start, stop) byte ranges of buf that were not decoded.
+            - rejected (int): Number of frames failing validation.
+    """
+    import numpy as np
+
+    size = len(buf)
+    offsets, skipped, rejected = [], [], 0
+    pos = 0
+    while size - pos >= framesize:
+        # validation stamps of the frames from pos on
+        count = (size - pos) // framesize
+        data = np.frombuffer(buf, dtype=np.uint8, count=count * framesize, offset=pos)
+        footers = data.reshape(count, framesize)[:, -2:].copy().view('<u2')[:, 0]
+        bad = np.flatnonzero(~np.isin(footers, validation))
+        good = int(bad[0]) if bad.size else count
+        offsets.extend(range(pos, pos + good * framesize, framesize))
+        pos += good * framesize
+        if good == count:
+            break
+
+        previous = offsets[-1] if offsets else None
+        resync = read_cs_tob3_resync(buf, pos + 1, framesize, validation, timing, previous)
+        stop = size if resync is None else resync
+        # frames lost in the skipped bytes, at least the one failing validation
+        rejected += max(1, (stop - pos) // framesize)
+        skipped.append((pos, stop))
+        pos = stop
+    if pos < size:
+        # a frame cut short, e.g. at the end of a truncated file
+        skipped.append((pos, size))
+    return offsets, skipped, rejected
+
+
+def read_cs_tob3_frame_header(buf, start, subsecond):
+    # record number and time in seconds of the frame starting at start
+    seconds, subseconds, record = struct.unpack_from('<LLL', buf, start)
+    return record, seconds + subseconds * subsecond
+
+
+def read_cs_tob3_resync(buf, start, framesize, validation, timing=None, previous=None,
+                        window=1 << 20):
+    """
+    Start of the next frame in buf at or after start.
+
+    A frame is taken to start at a byte whose frame footer holds a validation
+    stamp, if the following frame does too or the data ends before it. With
+    timing, the header of the candidate must also agree with the header of
+    the following frame: its record number is higher by at most the records
+    of a frame and its time later by the time of these records, within one
+    record. At the end of the data the candidate must instead follow the
+    previous valid frame, with a higher record number and a later time. Bytes
+    that happen to hold validation stamps, e.g. in a frame with inserted or
+    lost bytes, are skipped that way instead of being decoded as frames.
+
+    Args:
+        buf (bytes): Data of the file.
+        start (int): First byte a frame may start at.
+        framesize (int): Size of a frame in bytes.
+        validation (list): Validation stamp and its complement.
+        timing (tuple, optional): Records per frame, seconds per record and
+            seconds per subsecond unit of the frame headers.
+        previous (int, optional): Start of the last valid frame before start.
+
+    Returns:
+        int or None: Start of the frame, None if there is none.
+    """
+    import numpy as np
+
+    def agrees(candidate, following):
+        if timing is None:
+            return True
+        n_rec_frame, step, subsecond = timing
+        record, time = read_cs_tob3_frame_header(buf, candidate, subsecond)
+        if following + framesize <= len(buf):
+            next_record, next_time = read_cs_tob3_frame_header(buf, following, subsecond)
+            records = next_record - record
+            return 0 < records <= n_rec_frame and abs(next_time - time - records * step) <= step
+        if previous is None:
+            return True
+        last_record, last_time = read_cs_tob3_frame_header(buf, previous, subsecond)
+        return record > last_record and time > last_time
+
+    data = np.frombuffer(buf, dtype=np.uint8)
+    stamps = np.asarray(validation, dtype=np.uint16)
+    lo = start + framesize - 2  # footer stamp of a frame starting at start
+    while lo + 2 <= data.size:
+        hi = min(lo + window, data.size - 1)
+        chunk = data[lo:hi + 1].astype(np.uint16)
+        # little-endian word at every byte of the window
+        words = chunk[:-1] | (chunk[1:] << 8)
+        for k in np.flatnonzero(np.isin(words, stamps)):
+            candidate = lo + int(k) - framesize + 2
+            following = candidate + 2 * framesize
+            if following > data.size or \
+                    (int(data[following - 2]) | int(data[following - 1]) << 8) in validation:
+                if agrees(candidate, candidate + framesize):
+                    return candidate
+        lo = hi
+    return None
+
+
+def read_cs_tob3_interval(text):
+    # seconds between the records of a TOB3 table, "100 MSEC" -> 0.1
+    value, unit = text.split(' ')
+    seconds, per = TIME_UNITS[unit.upper()]
+    return int(value) * seconds / per
+
+
+def read_cs_tob3_resolution(text):
+    # seconds per subsecond unit of the TOB3 frame headers, "Sec100Usec" -> 1e-4
+    text = text.upper()[3:]
+    digits = text.rstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    seconds, per = TIME_UNITS[text[len(digits):]]
+    return int(digits or 1) * seconds / per
+
+
+def read_cs_tob3_headers(buf, offsets, n_rec_frame, recsize, validation):
+    """
+    Frame headers and numbers of records of the frames of a TOB3 file.
+
+    A frame with flags in its footer is a minor frame: its records are
+    followed by a footer with a validation stamp, whose low 12 bits give the
+    size of the minor frame. The footers after every record of all minor
+    frames are decoded at once with bit masks.
+
+    Args:
+        buf (bytes): Data of the file.
+        offsets (list): Start of every valid frame in buf (see read_cs_tob3_frames).
+        n_rec_frame (int): Number of records of a full frame.
+        recsize (int): Size of a record in bytes.
+        validation (list): Validation stamp and its complement.
+
+    Returns:
+        tuple: A tuple containing:
+            - headers (np.ndarray): Seconds, subseconds and record number of every frame.
+            - counts (np.ndarray): Number of records of every frame.
+    """
+    import numpy as np
+
+    hdrsize, footsize = 12, 4
+    data = np.frombuffer(buf, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    def words(pos):
+        # little-endian 16 bit words at the positions
+        return data[pos].astype(np.int64) | data[pos + 1].astype(np.int64) << 8
+
+    headers = data[offsets[:, None] + np.arange(hdrsize)].view('<u4').astype(np.int64)
+    counts = np.full(offsets.size, n_rec_frame, dtype=np.int64)
+    minor = np.flatnonzero(words(offsets + hdrsize + n_rec_frame * recsize) != 0)
+    if minor.size:
+        # footer after the first, second, ... record of every minor frame
+        n = np.arange(1, n_rec_frame + 1)
+        footer = offsets[minor, None] + hdrsize + n * recsize
+        size = (words(footer) & 0x0fff) - footsize - hdrsize
+        end = np.isin(words(footer + 2), validation) & (size // recsize == n)
+        counts[minor] = np.where(end.any(axis=1), end.argmax(axis=1) + 1, 0)
+    return headers, counts
 
 
 def read_cs_tob3(file_obj, meta,
                  quiet=True,
                  bycol=True,
+                 keep=None,
+                 report=None,
+                 byte_range=None,
+                 strings='str',
                  **kwargs
                  ):
     csformat = meta[-1]
     pyformat = read_cs_formats(csformat)
+    converters = {'>H': fp22float}
+    _, subrecsizes = read_cs_layout(pyformat)
     # account for system (since the hdr is of longs of size)
     fhdrformats = ['L', 'l', 'i', 'I']
     for _ in fhdrformats:
@@ -321,164 +874,62 @@ def read_cs_tob3(file_obj, meta,
     # extend validation stamp, IMPORTANT
     validation.append(2 ** 16 - 1 - validation[0])
 
-    frametimeresolution = meta[1][5]
     # since only the whole frame has a timestamp, this is the delta time for subrecs
-    frameresolution = int(meta[1][1].split(sep = ' ')[0])
-    multiplier = meta[1][1].split(sep = ' ')[1]
-
-    # len > 3 gives us a scaling factor for the rest of the string
-    if multiplier[0].isalpha():
-        if multiplier.__len__() > 3:
-            multiplier_scale_dict = {'U': 10 ** 6, 'M': 10 ** 3}
-            if multiplier[0] in multiplier_scale_dict:
-                prescale = multiplier_scale_dict[multiplier[0]]
-                multiplier = multiplier[1:]
-            else:
-                print('warning, length indicates a multiplier_scale (',
-                      multiplier[0],
-                      '), but none found',
-                      )
-                prescale = 1. ** 0
-        else:
-            if not quiet:
-                print('No multiplier_scale found')
-                print('Abbreviation is only 3 letters long')
-            prescale = 1. ** 0
-
-        # should be expanded for the corrsponding amount of seconds in the mulitpliert
-        time_abbr_dict = {'MIN': 60., 'SEC': 1.}
-        if multiplier in time_abbr_dict:
-            multiplier = prescale / time_abbr_dict[multiplier]
-        else:
-            multiplier = prescale / time_abbr_dict['SEC']
-            print('warning, time abbreviation could not be found')
-            print('Defaulting to seconds')
-    else:
-        print('warning, multiplier may not be correctly parsed and is set to 1')
-        multiplier = 1 ** 0
-
-    subrec_step = frameresolution / multiplier
-    scale = frametimeresolution[3:].rstrip('sec')
-
-    nscale = int(scale[:-1])
-    if scale[-1].isalpha():
-        if scale[-1] == 'U': scalefac = 10 ** 6
-        if scale[-1] == 'M': scalefac = 10 ** 3
-    else:
-        scalefac = 1 ** 0
-    subrec_scale = nscale / scalefac
+    subrec_step = read_cs_tob3_interval(meta[1][1])
+    subrec_scale = read_cs_tob3_resolution(meta[1][5])
 
-    subrecsizes = sum(struct.Struct(i).size for i in pyformat)
     n_rec_frame = (int(framesize) - struct.Struct(fhdr + ffoot).size) // subrecsizes
     basestruct = struct.Struct(fhdr + ffoot).size + subrecsizes * n_rec_frame
     recbegin = file_obj.tell()
-    filesize = os.path.getsize(file_obj.name)
-    n_rec_total = (filesize - recbegin) / basestruct
-
-    seconds, millisecs, recordnumber = [], [], []
-    rec, recfoot, rechdr, timerec = [], [], [], []
-    framecnt = 0
-
-    while file_obj.tell() != filesize-fhdrsize-subrecsizes * n_rec_frame-ffootsize:
-
-
-        binary_fhdr = file_obj.read(fhdrsize)
-
-        if not binary_fhdr or len(binary_fhdr) < fhdrsize:
-            # end of file reached (file_obj.read returns an emptry string)
-            # the footer below should be unneeded but we leave it in case
-            # the  TOB3 is strange (which it is)
-            print(binary_fhdr,fhdrsize,len(binary_fhdr))
-            break
-
-        rechdr.append(struct.unpack_from(fhdr, binary_fhdr))
-        inpos = file_obj.tell()
-        outpos = file_obj.seek(inpos + subrecsizes * n_rec_frame)
-        binary_footer = file_obj.read(ffootsize)
-
-        if not binary_footer or len(binary_footer) < ffootsize:
-            # end of file reached (file_obj.read returns an emptry string)
-            break
-
-        x = struct.unpack_from(ffoot, binary_footer)
-
-        framecnt += 1
-        if x[1] in validation:
-            file_obj.seek(inpos)
-            if x[0] != 0:
-                # this is a minor frame
-
-                temprec = []
-                for ii in range(n_rec_frame):
-
-                    minrec = []
-
-                    for iii in pyformat:
-                        recsize = struct.Struct(iii).size
-                        one_record = struct.unpack_from(iii, file_obj.read(recsize))[0]
-
-                        if iii == '>H':
-                            one_record = fp22float(one_record)
-                        if iii[-1] == 's':
-                            one_record = one_record.decode('unicode_escape')
-                        minrec.append(one_record)
-
-                    y = struct.unpack_from(ffoot, file_obj.read(ffootsize))
-
-                    if y[1] in validation:
-                        if y[0] == 0:
-                            minor_rec = 0
-                        else:
-                            offset = (bin(y[0]))
-                            sizeoffset = offset[6:]  # 4+2 for the 0b
-                            minor_rec = (int(sizeoffset, 2) - ffootsize - fhdrsize)
-                        n_minor_rec = minor_rec // subrecsizes
-                        # compare to ii+1 because the n_minor_rec is the full number
-                        # whereas the ii is from the range and starts at 0
-                        if n_minor_rec == (ii+1):
-                            rec.extend(temprec)
-                            recordnumber.extend(range(rechdr[-1][2], rechdr[-1][2] + n_minor_rec))
-                            seconds.extend(
-                                rechdr[-1][0] + (i * subrec_step + subrec_scale * rechdr[-1][1]) for i in
-                                range(n_minor_rec))
-                            file_obj.seek(outpos + ffootsize)
-                            # this breaks the for loop
-                            break
-                    else:
-                        temprec.append(minrec)
-                        # +1 on ii because at the end of this loopiteration
-                        # the ii is not yet increased but we read the record
-                        # and need to move on further
-                        file_obj.seek(inpos + (ii+1) * subrecsizes)
-            else:
-                # this is a major frame, easy
-                for _ in range(n_rec_frame):
-                    temprec = []
-                    for iii in pyformat:
-                        one_record = struct.unpack_from(iii, file_obj.read(struct.Struct(iii).size))[0]
-                        if iii[-1] == 's':
-                            one_record = one_record.decode('unicode_escape')
-                        if iii == '>H':
-                            one_record = fp22float(one_record)
-                        temprec.append(one_record)
-
-                    rec.append(temprec)
-                recordnumber.extend(range(rechdr[-1][2], rechdr[-1][2] + n_rec_frame))
-                seconds.extend(
-                    rechdr[-1][0] + (i * subrec_step + subrec_scale * rechdr[-1][1]) for i in
-                    range(n_rec_frame))
-                file_obj.seek(outpos + ffootsize)
-    timestamp = [
-        read_cs_convert_tob3_daterec(seconds[ii])
-        for ii, i in enumerate(seconds)
-    ]
-
-    for i, ii in enumerate(rec):
-        rec[i].insert(0, recordnumber[i])
-        rec[i].insert(0, timestamp[i])
-
-    rec.sort(key = itemgetter(1))
-    if bycol:
-        rec = list(map(list, zip(*rec)))
-
-    return rec
+    lastbyte = None
+
+    if byte_range is not None:
+        # only the frames starting within [start, stop), e.g. the frames
+        # appended to a growing file since it was last read
+        start, stop = byte_range
+        if start > recbegin:
+            file_obj.seek(recbegin + (start - recbegin) // basestruct * basestruct)
+        if stop is not None:
+            lastbyte = recbegin + -(-(stop - recbegin) // basestruct) * basestruct
+    firstframe = file_obj.tell()
+
+    # all frames are read at once and validated together; frames failing
+    # validation and bytes out of step with the frames are skipped
+    buf = file_obj.read() if lastbyte is None else file_obj.read(max(0, lastbyte - firstframe))
+    offsets, skipped, rejected = read_cs_tob3_frames(buf, basestruct, validation,
+                                                     (n_rec_frame, subrec_step, subrec_scale))
+
+    # header and number of records of every frame, minor frames hold fewer records
+    import numpy as np
+    rechdr, counts = read_cs_tob3_headers(buf, offsets, n_rec_frame, subrecsizes, validation)
+
+    # frame and position within the frame of every record
+    frame = np.repeat(np.arange(len(offsets)), counts)
+    within = np.arange(frame.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    recstart = np.asarray(offsets, dtype=np.int64)[frame] + fhdrsize + within * subrecsizes
+
+    recordnumber = (rechdr[frame, 2] + within).tolist()
+    seconds = (rechdr[frame, 0] + (within * subrec_step + subrec_scale * rechdr[frame, 1])).tolist()
+    # NSec, Bool8 and string fields are decoded for all records at once, the others record by record
+    unpacked, bulk = read_cs_bulk(buf, recstart, pyformat, csformat, keep, strings)
+    layout, _ = read_cs_layout(pyformat, unpacked, converters)
+    rec = [read_cs_unpack(buf, layout, start) for start in recstart.tolist()]
+
+    # order by record number, drop repeated records and find gaps and resets;
+    # imported here so that reading headers only needs the standard library
+    from record_qc import analyse_records
+    order, sequence = analyse_records(recordnumber, seconds)
+    if report is not None:
+        report.update(sequence)
+        # the next read starts after the last valid frame, so a frame still
+        # being written to a growing file is read again
+        lastread = firstframe + (offsets[-1] + basestruct if offsets else 0)
+        report['byte_range'] = (firstframe, lastread)
+        report['frames'] = len(offsets) + rejected
+        report['rejected_frames'] = rejected
+        report['skipped'] = [(firstframe + a, firstframe + b) for a, b in skipped]
+        if skipped and not quiet:
+            print(f'Skipped {sum(b - a for a, b in skipped)} bytes in {len(skipped)} ranges')
+
+    rec = [[read_cs_convert_tob3_daterec(seconds[i]), recordnumber[i]] + rec[i] for i in order]
+    return read_cs_merge(rec, bulk, order, 2, bycol)
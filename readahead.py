@@ -0,0 +1,199 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# smallest and largest reads of ReadAheadFile; reads are aligned to their size
+MIN_BLOCK = 1 << 16
+MAX_BLOCK = 4 << 20
+
+
+def advise_sequential(file_obj):
+    """Hint the kernel that file_obj is read sequentially (posix_fadvise), where supported."""
+    try:
+        os.posix_fadvise(file_obj.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+
+
+class ReadAheadFile(io.RawIOBase):
+    """
+    Raw file object reading in large aligned blocks.
+
+    Small reads (a TOB1 record, a header line, a TOB3 frame) are served from
+    the current block. The block size doubles from MIN_BLOCK to MAX_BLOCK
+    while the file is read sequentially and drops back to MIN_BLOCK after a
+    seek elsewhere, so a whole-file read issues few large requests and a
+    binary search over frames does not read megabytes per probe. Network
+    filesystems (Lustre, NFS) handle few large reads much better than many
+    small ones.
+
+    Args:
+        raw (io.RawIOBase): Unbuffered binary file, e.g. open(path, 'rb', buffering=0).
+        max_block (int): Largest read, in bytes.
+    """
+
+    def __init__(self, raw, max_block=MAX_BLOCK):
+        super().__init__()
+        self.raw = raw
+        self.max_block = max_block
+        self.block_size = MIN_BLOCK
+        self.pos = 0
+        self.block_start = 0
+        self.block = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            self.pos = max(0, offset)
+        elif whence == os.SEEK_CUR:
+            self.pos = max(0, self.pos + offset)
+        else:
+            self.pos = self.raw.seek(offset, whence)
+        return self.pos
+
+    def _fill(self):
+        # read the aligned block holding pos, larger while the reads are sequential
+        if self.pos == self.block_start + len(self.block) and self.block:
+            # the next block; doubled where the larger block stays aligned
+            if 2 * self.block_size <= self.max_block and self.pos % (2 * self.block_size) == 0:
+                self.block_size *= 2
+            self.block_start = self.pos
+        else:
+            self.block_size = MIN_BLOCK
+            self.block_start = self.pos // MIN_BLOCK * MIN_BLOCK
+        self.raw.seek(self.block_start)
+        self.block = _read_full(self.raw, self.block_size)
+
+    def readinto(self, buffer):
+        within = self.pos - self.block_start
+        if not 0 <= within < len(self.block):
+            if len(buffer) >= self.max_block:
+                # large reads go straight into the caller's buffer
+                self.raw.seek(self.pos)
+                n = self.raw.readinto(buffer) or 0
+                self.pos += n
+                return n
+            self._fill()
+            within = self.pos - self.block_start
+        n = max(0, min(len(buffer), len(self.block) - within))
+        buffer[:n] = self.block[within:within + n]
+        self.pos += n
+        return n
+
+    def readall(self):
+        # the rest of the file in one piece: the current block, then one large read
+        head = self.block[max(0, self.pos - self.block_start):] \
+            if self.block_start <= self.pos < self.block_start + len(self.block) else b''
+        self.pos += len(head)
+        self.raw.seek(self.pos)
+        rest = self.raw.readall()
+        self.pos += len(rest)
+        return bytes(head) + rest if head else rest
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
+
+
+def _read_full(raw, size):
+    # size bytes from raw, fewer only at the end of the file
+    buffer = bytearray(size)
+    with memoryview(buffer) as view:
+        n = 0
+        while n < size:
+            got = raw.readinto(view[n:])
+            if not got:
+                break
+            n += got
+    return bytes(buffer[:n])
+
+
+def open_sequential(filename, max_block=MAX_BLOCK, raw=None):
+    """
+    Open a file for reading through ReadAheadFile, with a sequential access hint.
+
+    Args:
+        filename (str): File to open.
+        max_block (int): Largest read, in bytes.
+        raw (io.RawIOBase, optional): Unbuffered file object to read instead
+            of opening filename, e.g. a throttled stand-in in benchmarks.
+
+    Returns:
+        io.BufferedReader: Binary, seekable file object.
+    """
+    raw = open(filename, 'rb', buffering=0) if raw is None else raw
+    advise_sequential(raw)
+    return io.BufferedReader(ReadAheadFile(raw, max_block), buffer_size=MIN_BLOCK)
+
+
+def warm_file(filename, byte_range=None, max_block=MAX_BLOCK):
+    """
+    Read a file, or its header and a byte range of it, so that it is in the page cache.
+
+    Returns:
+        int: Number of bytes read.
+    """
+    spans = [(0, None)] if byte_range is None else [(0, MIN_BLOCK), tuple(byte_range)]
+    buffer = memoryview(bytearray(max_block))
+    total = 0
+    with open(filename, 'rb', buffering=0) as raw:
+        advise_sequential(raw)
+        for start, stop in spans:
+            raw.seek(start)
+            pos = start
+            while stop is None or pos < stop:
+                got = raw.readinto(buffer if stop is None else buffer[:min(max_block, stop - pos)])
+                if not got:
+                    break
+                pos += got
+            total += pos - start
+    return total
+
+
+def prefetch(files, byte_ranges=None, depth=1, warm=warm_file):
+    """
+    Iterate over files while the next ones are read into the page cache in a thread.
+
+    Each file is yielded once it has been read ahead, so the consumer decodes
+    one file while the following depth files are read from disk.
+
+    Args:
+        files (list): Files in the order they are consumed.
+        byte_ranges (dict, optional): Filename -> byte range to read ahead instead
+            of the whole file, see catalog.plan_reads.
+        depth (int): Number of files read ahead.
+        warm (callable): warm(filename, byte_range), warm_file by default.
+
+    Yields:
+        str: The files, in order.
+    """
+    byte_ranges = byte_ranges or {}
+    files = list(files)
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        queued = [reader.submit(warm, f, byte_ranges.get(f)) for f in files[:depth + 1]]
+        try:
+            for i, filename in enumerate(files):
+                try:
+                    queued[i].result()
+                except OSError:
+                    pass  # the decoder reports the error
+                if i + depth + 1 < len(files):
+                    following = files[i + depth + 1]
+                    queued.append(reader.submit(warm, following, byte_ranges.get(following)))
+                yield filename
+        finally:
+            # the consumer stopped early, the files queued are not needed
+            for future in queued:
+                future.cancel()
@@ -0,0 +1,87 @@
+import numpy as np
+
+# TOB3 timestamps count seconds from this date
+TOB3_EPOCH = np.datetime64('1990-01-01T00:00:00', 'ns')
+
+
+def seconds_to_datetime64(seconds):
+    # seconds since 1990-01-01 as datetime64[ns], rounded to microseconds like the datetimes
+    micros = np.round(np.asarray(seconds, dtype=np.float64) * 1e6).astype(np.int64)
+    return TOB3_EPOCH + (micros * 1000).astype('timedelta64[ns]')
+
+
+def analyse_records(records, seconds):
+    """
+    Order, deduplicate and check the record sequence of decoded data.
+
+    Records are ordered by record number within each logger run. A logger reset
+    (record number going back while the time moves on) starts a new run, whereas
+    a drop of both record number and time is the ring buffer wrapping around and
+    is simply sorted out. Repeated records, e.g. from overlapping downloads, are
+    kept once.
+
+    Args:
+        records (array-like): Record numbers in file order.
+        seconds (array-like): Timestamps in file order, seconds since 1990-01-01.
+
+    Returns:
+        tuple: A tuple containing:
+            - order (np.ndarray): Indices that sort the records and drop duplicates.
+            - report (dict): 'duplicates' (number of dropped records), 'gaps' (list of
+              (last record, next record, missing records, last time, next time)),
+              'resets' (list of (record before, record after, time)) and 'records'
+              (number of records kept).
+    """
+    records = np.asarray(records, dtype=np.int64)
+    seconds = np.asarray(seconds, dtype=np.float64)
+    if records.size == 0:
+        return np.empty(0, dtype=np.int64), {'records': 0, 'duplicates': 0, 'gaps': [], 'resets': []}
+
+    # a new logger run starts where the record number drops but the time does not
+    reset = np.zeros(records.size, dtype=bool)
+    reset[1:] = (np.diff(records) < 0) & (np.diff(seconds) >= 0)
+    run = np.cumsum(reset)
+
+    order = np.lexsort((records, run))
+    sorted_records, sorted_run = records[order], run[order]
+
+    # duplicates follow each other once sorted
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = (np.diff(sorted_records) != 0) | (np.diff(sorted_run) != 0)
+    order = order[first]
+    sorted_records, sorted_run = sorted_records[first], sorted_run[first]
+
+    step = np.diff(sorted_records)
+    at = np.flatnonzero((step > 1) & (np.diff(sorted_run) == 0))
+    times = seconds_to_datetime64(seconds[order])
+    gaps = [(int(sorted_records[i]), int(sorted_records[i + 1]), int(step[i] - 1), times[i], times[i + 1])
+            for i in at]
+
+    at = np.flatnonzero(reset)
+    resets = [(int(records[i - 1]), int(records[i]), seconds_to_datetime64(seconds[i])) for i in at]
+
+    report = {'records': int(order.size), 'duplicates': int((~first).sum()),
+              'gaps': gaps, 'resets': resets}
+    return order, report
+
+
+def completeness(timestamps, interval=None, period=np.timedelta64(1, 'D')):
+    """
+    Fraction of the expected records present in a period of data.
+
+    Args:
+        timestamps (array-like): Timestamps of the records of one period.
+        interval (np.timedelta64, optional): Logging interval. Defaults to the
+            most common spacing of the timestamps.
+        period (np.timedelta64): Length of the period, one day by default.
+
+    Returns:
+        float: Number of distinct timestamps over the number expected in the period.
+    """
+    timestamps = np.unique(np.asarray(timestamps, dtype='datetime64[ns]'))
+    if timestamps.size < 2:
+        return float(timestamps.size > 0)
+    if interval is None:
+        steps, counts = np.unique(np.diff(timestamps), return_counts=True)
+        interval = steps[np.argmax(counts)]
+    return float(timestamps.size / (period / np.timedelta64(interval, 'ns')))
@@ -0,0 +1,268 @@
+import os
+import glob
+import struct
+import fnmatch
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import read_cs_files as cs
+
+# TOB3 frame header (seconds, subseconds, record) and footer (flags and offset, validation)
+FRAME_HEADER = struct.Struct('<LLL')
+FRAME_FOOTER = struct.Struct('<HH')
+
+
+def with_compressed(patterns):
+    """Glob patterns plus those of the compressed files (e.g. *.dat -> *.dat.gz), see cs.COMPRESSED_SUFFIXES."""
+    return list(patterns) + [pattern + suffix for pattern in patterns for suffix in cs.COMPRESSED_SUFFIXES]
+
+
+def match_files(src_dir, patterns):
+    """
+    Files of a directory matching glob patterns, as they are or compressed.
+
+    A compressed file is left out while the uncompressed file is still
+    there (e.g. during archive.py without --delete), so no data is read twice.
+
+    Args:
+        src_dir (str): Directory of the datalogger files.
+        patterns (list): Glob patterns of the uncompressed files, e.g. ['ts_data*.dat'].
+
+    Returns:
+        set: File names.
+    """
+    files = {f for pattern in with_compressed(patterns) for f in glob.glob(os.path.join(src_dir, pattern))}
+    return {f for f in files if os.path.splitext(f)[1] not in cs.COMPRESSED_SUFFIXES
+            or os.path.splitext(f)[0] not in files}
+
+
+def matches(filename, patterns):
+    """Whether the name of a file matches one of the glob patterns, as it is or compressed."""
+    return any(fnmatch.fnmatch(os.path.basename(filename), p) for p in with_compressed(patterns))
+
+
+def _signature(meta, filetype):
+    # column names and data types; files with the same signature share a layout
+    names = meta[cs.NAME_LINE[filetype]]
+    types = meta[-1]
+    return hashlib.sha1((','.join(names) + '|' + ','.join(types)).encode()).hexdigest()[:12]
+
+
+def ring_wrap(time_at, n_frames):
+    """
+    Index of the oldest frame of a ring buffer TOB3 file that has wrapped, 0 otherwise.
+
+    Once a ring buffer file is full the logger overwrites its oldest frames
+    from the start, so the frames form two runs ordered by time: the newest
+    from the start of the file and the oldest from the wrap point to the end.
+
+    Args:
+        time_at (callable): Frame index -> time of its first record, None for an invalid frame.
+        n_frames (int): Number of frames of the file.
+
+    Returns:
+        int: Index of the first frame after the wrap point.
+    """
+    first = next((t for t in map(time_at, range(n_frames)) if t is not None), None)
+    last = next((t for t in map(time_at, range(n_frames - 1, -1, -1)) if t is not None), None)
+    if first is None or last >= first:
+        return 0
+    # the frames after the wrap point are older than the first frame
+    lo, hi = 0, n_frames
+    while lo < hi:
+        mid = (lo + hi) // 2
+        probe = mid
+        t = time_at(probe)
+        while t is None and probe + 1 < hi:
+            # skip invalid frames to the next valid one
+            probe += 1
+            t = time_at(probe)
+        if t is None or t < first:
+            hi = mid
+        else:
+            lo = probe + 1
+    return lo
+
+
+def scan_tob3(f, meta, filesize):
+    framesize = int(meta[1][2])
+    stamps = (int(meta[1][4]), 2 ** 16 - 1 - int(meta[1][4]))
+    step, subsecond = cs.read_cs_tob3_interval(meta[1][1]), cs.read_cs_tob3_resolution(meta[1][5])
+    recsize = sum(struct.calcsize(fmt) for fmt in cs.read_cs_formats(meta[5]))
+    n_rec_frame = (framesize - FRAME_HEADER.size - FRAME_FOOTER.size) // recsize
+    data_start = f.tell()
+    n_frames = (filesize - data_start) // framesize
+
+    def frame_at(i):
+        f.seek(data_start + i * framesize)
+        frame = f.read(framesize)
+        if FRAME_FOOTER.unpack_from(frame, framesize - FRAME_FOOTER.size)[1] not in stamps:
+            return None
+        # minor frames hold fewer records
+        headers, counts = cs.read_cs_tob3_headers(frame, [0], n_rec_frame, recsize, stamps)
+        if counts[0] == 0:
+            return None
+        seconds, subseconds, record = headers[0].tolist()
+        return seconds + subseconds * subsecond, record, int(counts[0])
+
+    # the first and last valid frames, a ring buffer file may hold invalid frames
+    # and, once it has wrapped, starts with its newest frames
+    wrap = ring_wrap(lambda i: (frame_at(i) or (None,))[0], n_frames)
+    order = list(range(wrap, n_frames)) + list(range(wrap))
+    first = next((frame for frame in map(frame_at, order) if frame), None)
+    last = next((frame for frame in map(frame_at, reversed(order)) if frame), None)
+    info = {'frame_size': framesize, 'n_frames': n_frames, 'interval': step}
+    if first is None:
+        return info
+    info.update({
+        'start': cs.read_cs_convert_tob3_daterec(first[0]),
+        'end': cs.read_cs_convert_tob3_daterec(last[0] + (last[2] - 1) * step),
+        'first_record': first[1],
+        'last_record': last[1] + last[2] - 1,
+    })
+    return info
+
+
+def scan_toa5(f, meta, filesize):
+    first = f.readline()
+    if not first.strip():
+        return {}
+    # the last line is within the last few kB
+    f.seek(max(f.tell(), filesize - 8192))
+    last = f.read().rstrip().split(b'\n')[-1]
+    info = {}
+    for key, line in [('start', first), ('end', last)]:
+        fields = line.rstrip().decode().replace('"', '').split(',')
+        info[key] = datetime.fromisoformat(fields[0])
+        info['first_record' if key == 'start' else 'last_record'] = int(fields[1])
+    return info
+
+
+def scan_tob1(f, meta, filesize):
+    pyformat = cs.read_cs_formats(meta[4])
+    recsize = sum(struct.calcsize(fmt) for fmt in pyformat)
+    if meta[1][:3] != ['SECONDS', 'NANOSECONDS', 'RECORD']:
+        return {}
+    data_start = f.tell()
+    n_records = (filesize - data_start) // recsize
+    if n_records == 0:
+        return {}
+    layout, _ = cs.read_cs_layout(pyformat, keep=[0, 1, 2])
+    info = {}
+    for key, i in [('start', 0), ('end', n_records - 1)]:
+        f.seek(data_start + i * recsize)
+        date, record = cs.read_cs_convert_tob1_daterec(cs.read_cs_unpack(f.read(recsize), layout))
+        info[key] = date
+        info['first_record' if key == 'start' else 'last_record'] = record
+    return info
+
+
+def scan_file(filename):
+    """
+    Describe a datalogger file from its header and first and last records.
+
+    Only the header lines and a few frames or lines at both ends are read,
+    the data in between is never decoded. Compressed files are read through
+    cs.read_cs_open; for gzip, xz and zstd files this decompresses the file.
+
+    Args:
+        filename (str): TOA5, TOB1 or TOB3 file.
+
+    Returns:
+        dict: 'file', 'size' (on disk), 'mtime', 'filetype', 'table', 'created' (TOB3
+        creation time), 'signature' (hash of the column names and types),
+        'start' and 'end' (first and last record time), 'first_record' and
+        'last_record', and for TOB3 'frame_size', 'n_frames' and 'interval'
+        (seconds). Values that do not apply or cannot be read are None.
+    """
+    info = {'file': filename, 'size': os.path.getsize(filename), 'mtime': os.path.getmtime(filename),
+            'filetype': None, 'table': None, 'created': None, 'signature': None,
+            'start': None, 'end': None, 'first_record': None, 'last_record': None,
+            'frame_size': None, 'n_frames': None, 'interval': None}
+    with cs.read_cs_open(filename) as f:
+        datasize = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        filetype = f.readline().split(b',')[0].decode(errors='replace').replace('"', '')
+        f.seek(0)
+        if filetype not in ['TOA5', 'TOB1', 'TOB3']:
+            return info
+        meta = cs.read_cs_meta(f, filetype)
+        info['filetype'] = filetype
+        info['signature'] = _signature(meta, filetype)
+        if filetype == 'TOB3':
+            info['table'] = meta[1][0]
+            info['created'] = datetime.fromisoformat(meta[0][-1])
+            info.update(scan_tob3(f, meta, datasize))
+        elif filetype == 'TOA5':
+            info['table'] = meta[0][-1]
+            info.update(scan_toa5(f, meta, datasize))
+        else:
+            info['table'] = meta[0][-1]
+            info.update(scan_tob1(f, meta, datasize))
+    return info
+
+
+def scan_directory(src_dir, patterns=('*.dat',), workers=8):
+    """
+    Scan all datalogger files of a directory in parallel.
+
+    Args:
+        src_dir (str): Directory of the datalogger files.
+        patterns (list): Glob patterns of the files, see match_files.
+        workers (int): Number of files read at a time.
+
+    Returns:
+        list: scan_file results ordered by table and start time.
+    """
+    files = sorted(match_files(src_dir, patterns))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        catalog = list(pool.map(scan_file, files))
+    return sorted(catalog, key=lambda info: (info['table'] or '', info['start'] or datetime.min, info['file']))
+
+
+def files_covering(catalog, start=None, end=None, table=None):
+    """
+    Files of a catalog holding records within [start, end).
+
+    Files whose time span could not be read are always included.
+
+    Args:
+        catalog (list): Result of scan_directory.
+        start (datetime or str, optional): Start of the period.
+        end (datetime or str, optional): End of the period (excluded).
+        table (str, optional): Only files of this table.
+
+    Returns:
+        list: File names, in the order of the catalog.
+    """
+    start = datetime.fromisoformat(start) if isinstance(start, str) else start
+    end = datetime.fromisoformat(end) if isinstance(end, str) else end
+    files = []
+    for info in catalog:
+        if table is not None and info['table'] != table:
+            continue
+        if info['start'] is not None:
+            if (end is not None and info['start'] >= end) or (start is not None and info['end'] < start):
+                continue
+        files.append(info['file'])
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the tables and time spans of datalogger files.")
+    parser.add_argument('src', type=str, help='folder of the datalogger files')
+    parser.add_argument('-p', '--pattern', type=str, action='append', default=None,
+                        help='glob pattern of the files (repeatable, default *.dat)')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='files read at a time')
+    args = parser.parse_args()
+
+    for info in scan_directory(args.src, args.pattern or ['*.dat'], args.workers):
+        print(f"{os.path.basename(info['file'])},{info['filetype']},{info['table']},"
+              f"{info['start']},{info['end']},{info['first_record']},{info['last_record']},"
+              f"{info['frame_size']},{info['signature']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+import time
+import argparse
+
+# repository root, the modules are imported from there
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import read_cs_files as cs
+from readahead import MAX_BLOCK, open_sequential, prefetch
+
+
+class ThrottledFile(io.FileIO):
+    """
+    Local file standing in for a network filesystem.
+
+    Every read request costs a fixed latency plus its size at the given
+    bandwidth, unless the file is in the cache of the disk (see Disk).
+    """
+
+    def __init__(self, filename, disk):
+        super().__init__(filename, 'rb')
+        self.disk = disk
+        self.cached = filename in disk.cached
+
+    def _charge(self, n):
+        if not self.cached:
+            self.disk.requests += 1
+            self.disk.bytes += n
+            time.sleep(self.disk.latency + n / self.disk.bandwidth)
+
+    def readinto(self, buffer):
+        n = super().readinto(buffer)
+        self._charge(n or 0)
+        return n
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self._charge(len(data))
+        return data
+
+    def readall(self):
+        data = super().readall()
+        self._charge(len(data))
+        return data
+
+
+class Disk:
+    """Latency, bandwidth and page cache of the stand-in filesystem, and the requests it served."""
+
+    def __init__(self, latency, bandwidth):
+        self.latency, self.bandwidth = latency, bandwidth
+        self.cached = set()
+        self.requests = self.bytes = 0
+
+    def open(self, filename):
+        return ThrottledFile(filename, self)
+
+    def warm(self, filename, byte_range=None):
+        # read ahead the way readahead.warm_file does, then the file is cached
+        with self.open(filename) as f:
+            while f.read(MAX_BLOCK):
+                pass
+        self.cached.add(filename)
+
+
+def decode_all(files, disk, layer, ahead=False):
+    """
+    Decode files from the stand-in disk.
+
+    Args:
+        files (list): CS files.
+        disk (Disk): Stand-in filesystem.
+        layer (str): 'buffered' (default 8 kB buffering) or 'readahead' (readahead.open_sequential).
+        ahead (bool): Read the next file ahead in a thread (readahead.prefetch).
+
+    Returns:
+        tuple: Seconds and number of records decoded.
+    """
+    t0, records = time.perf_counter(), 0
+    for filename in (prefetch(files, warm=disk.warm) if ahead else files):
+        raw = disk.open(filename)
+        f = open_sequential(filename, raw=raw) if layer == 'readahead' else io.BufferedReader(raw)
+        with f:
+            data, meta = cs.read_cs_files(f)
+        records += len(data[0]) if data else 0
+    return time.perf_counter() - t0, records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the I/O layers of the readers on a throttled stand-in for a network filesystem.")
+    parser.add_argument('files', nargs='+', help='raw datalogger files to decode')
+    parser.add_argument('--latency-ms', type=float, default=2., help='cost of every read request')
+    parser.add_argument('--mbps', type=float, default=200., help='bandwidth in MB/s')
+    args = parser.parse_args()
+
+    cases = [('buffered', False), ('readahead', False), ('readahead', True)]
+    print(f"{'layer':10s} {'prefetch':>8s} {'seconds':>8s} {'requests':>9s} {'MB read':>8s} {'records':>9s}")
+    for layer, ahead in cases:
+        disk = Disk(args.latency_ms / 1e3, args.mbps * 1e6)
+        seconds, records = decode_all(args.files, disk, layer, ahead)
+        print(f"{layer:10s} {str(ahead):>8s} {seconds:8.2f} {disk.requests:9d} "
+              f"{disk.bytes / 1e6:8.1f} {records:9d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# repository root, the modules are imported from there
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> modules it must not import when loaded
+TARGETS = {
+    'read_cs_files': ['numpy', 'pandas', 'natsort', 'pyarrow'],
+    'download': ['pandas', 'natsort', 'pyarrow'],
+    'eddyflow': ['pandas', 'numpy', 'pyarrow'],
+}
+
+PROBE = '''
+import sys, time
+t0 = time.perf_counter()
+import {module}
+print(time.perf_counter() - t0)
+print(','.join(m for m in {forbidden!r} if m in sys.modules))
+'''
+
+
+def time_import(module, forbidden, repeat=5):
+    """
+    Import a module in fresh interpreters and check what it pulls in.
+
+    Args:
+        module (str): Module to import.
+        forbidden (list): Modules it must not import.
+        repeat (int): Number of interpreters started.
+
+    Returns:
+        tuple: A tuple containing:
+            - seconds (list): Import time of each run.
+            - loaded (list): Forbidden modules that were imported.
+    """
+    seconds, loaded = [], []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, forbidden=forbidden)],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stdout.split('\n')
+        seconds.append(float(out[0]))
+        loaded = [m for m in out[1].split(',') if m]
+    return seconds, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import time and dependencies of the reader and CLIs.")
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='interpreters started per module')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if the median import time of a module exceeds this')
+    args = parser.parse_args()
+
+    failed = False
+    for module, forbidden in TARGETS.items():
+        seconds, loaded = time_import(module, forbidden, args.repeat)
+        median_ms = statistics.median(seconds) * 1e3
+        print(f'{module:15s} median {median_ms:7.1f} ms, min {min(seconds) * 1e3:7.1f} ms'
+              + (f', imports {", ".join(loaded)}' if loaded else ''))
+        if loaded or (args.max_ms is not None and median_ms > args.max_ms):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 import os, glob
+import argparse
 import csv
 import pandas as pd
-import read_cs_files as cs
+from scan import scan_directory
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from natsort import natsorted
 from datetime import datetime
+from manifest import write_file
+from process_ts import WRITERS
 
 def format_timestamp(ts):
     # Format with microseconds, then strip trailing zeros
@@ -18,36 +22,40 @@ def split_30min(var, filename, dst_dir):
         meta_lines = [next(f) for _ in range(4)]  # header lines
         # data_lines = f.readlines()  # all remaining rows
 
-    # --- Step 2: Load data skipping meta ---
-    df = pd.read_csv(filename, skiprows=4, header=None)
+    # List of columns to skip
+    cols_to_delete = ["SonicDiag", "irga(3)", "irga_diag", "Diag77", "RSSI"]
+
+    # --- Step 2: Load data skipping meta and the unused columns ---
     columns =  meta_lines[1].strip().split(',')
     columns = [c.strip('"') for c in columns]
-    df.columns = columns
-
-    # List of columns to delete
-    cols_to_delete = ["SonicDiag", "irga(3)", "irga_diag", "Diag77", "RSSI"]
-    df = df.drop(columns=cols_to_delete)
+    usecols = [i for i, c in enumerate(columns) if c not in cols_to_delete]
+    df = pd.read_csv(filename, skiprows=4, header=None, usecols=usecols)
+    df.columns = [columns[i] for i in usecols]
 
     df["TIMESTAMP"] = pd.to_datetime(df["TIMESTAMP"])
     file_date = df["TIMESTAMP"].dt.date.iloc[0]
 
-    for slot in range(48):
-        start = pd.Timestamp(file_date) + pd.Timedelta(minutes=30 * slot)
-        end = start + pd.Timedelta(minutes=30)
-
-        # Filter rows: include start, exclude end
-        chunk = df[(df["TIMESTAMP"] > start) & (df["TIMESTAMP"] <= end)]
-        chunk["TIMESTAMP"] = chunk["TIMESTAMP"].apply(format_timestamp)
-
-        if not chunk.empty:
-            # Build filename
-            outfile = os.path.join(
-                dst_dir, f"{var}_{start.strftime('%Y-%m-%d_%H%M')}.dat"
-            )
-            # Write header + data (even if empty, so always 48 files)
-            with open(outfile, "w", encoding="utf-8") as f:
-                # f.writelines(meta_lines)
-                chunk.to_csv(f, index=False, header=True, sep=',', quoting=csv.QUOTE_NONNUMERIC)
+    # the half-hour files are formatted here and written by WRITERS threads,
+    # each in one piece with manifest.write_file, as the day files are
+    with ThreadPoolExecutor(max_workers=WRITERS) as pool:
+        futures = []
+        for slot in range(48):
+            start = pd.Timestamp(file_date) + pd.Timedelta(minutes=30 * slot)
+            end = start + pd.Timedelta(minutes=30)
+
+            # Filter rows: include start, exclude end
+            chunk = df[(df["TIMESTAMP"] > start) & (df["TIMESTAMP"] <= end)]
+            chunk = chunk.assign(TIMESTAMP=chunk["TIMESTAMP"].apply(format_timestamp))
+
+            if not chunk.empty:
+                # Build filename
+                outfile = os.path.join(
+                    dst_dir, f"{var}_{start.strftime('%Y-%m-%d_%H%M')}.dat"
+                )
+                text = chunk.to_csv(index=False, header=True, sep=',', quoting=csv.QUOTE_NONNUMERIC)
+                futures.append(pool.submit(write_file, outfile, text))
+        for future in futures:
+            future.result()
 
 
 def merge_two_ascii(file1, file2, header_lines=4):
@@ -75,16 +83,23 @@ def merge_two_ascii(file1, file2, header_lines=4):
     print(f"Merged {file1} into {file2}")
 
 def main():
-    var = 'MetData'
-    dst_dir = f'/Users/pvn/research/data/EddyFlux/SETx/TOA5/'
-    src_dir = '/Users/pvn/Downloads/Download-2025-08-25'
-    full_filenames = natsorted(glob.glob(os.path.join(src_dir, f'{var}*.dat')))
-
-    for filename in full_filenames[56:]:
+    parser = argparse.ArgumentParser(description="Convert TOB3 files to TOA5 day files with camp2ascii.")
+    parser.add_argument('-t', '--table', type=str, default='MetData', help='table name')
+    parser.add_argument('-s', '--src', type=str, required=True, help='folder of the TOB3 files')
+    parser.add_argument('-d', '--dst', type=str, required=True, help='folder of the TOA5 files')
+    parser.add_argument('--first', type=int, default=0, help='index of the first file to convert')
+    args = parser.parse_args()
+
+    var = args.table
+    dst_dir = args.dst
+    src_dir = args.src
+    # creation times from the file headers, the data is not decoded
+    catalog = {info['file']: info for info in scan_directory(src_dir, [f'{var}*.dat'])}
+    full_filenames = natsorted(catalog)
+
+    for filename in full_filenames[args.first:]:
         print(filename)
-        # _, fn = os.path.split(filename)
-        _, meta = cs.read_cs_files(filename)
-        dt = datetime.strptime(meta[0][-1], '%Y-%m-%d %H:%M:%S')
+        dt = catalog[filename]['created']
         yyyy = dt.year
         mm = dt.month
         dd = dt.day
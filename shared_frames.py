@@ -0,0 +1,110 @@
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+# frames with less column data are pickled, a shared memory block would cost more than it saves
+MIN_SHARED_BYTES = 1 << 20
+
+# columns start at multiples of this many bytes in the block
+ALIGN = 64
+
+
+def _open_block(**kwargs):
+    # blocks are created in one process and unlinked in another, so they must
+    # not be tracked by the resource tracker of the creating process
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(track=False, **kwargs)
+    block = shared_memory.SharedMemory(**kwargs)
+    if kwargs.get('create'):
+        # before Python 3.13 every block created is registered, and the tracker
+        # unlinks it when the decoding process exits, before the parent has
+        # mapped it (bpo-39959); it is registered under its internal name
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+def _shareable(values):
+    # numeric, boolean and datetime columns are plain arrays that can be mapped
+    return isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufcmM'
+
+
+def share_frame(df):
+    """
+    Move the numeric columns of a DataFrame into a shared memory block.
+
+    Called in a decoding process: the result is sent to the parent instead of
+    the DataFrame, and attach_frame maps the columns there without copying,
+    so only a small description of the block and the other columns (e.g.
+    categoricals) are pickled. Frames with less than MIN_SHARED_BYTES of such
+    columns, and all frames where shared memory is not POSIX, are returned as
+    they are.
+
+    Args:
+        df (pd.DataFrame): Decoded data, e.g. from ingest.load_data.
+
+    Returns:
+        dict or pd.DataFrame: 'shared_memory' (name of the block), 'columns'
+        ((name, dtype, offset, length) of the mapped columns), 'rest' (DataFrame
+        of the other columns) and 'order' (column order); or df.
+    """
+    if os.name != 'posix':
+        return df
+    arrays = {col: np.ascontiguousarray(df[col].to_numpy()) for col in df.columns if _shareable(df[col])}
+    sizes = [-(-values.nbytes // ALIGN) * ALIGN for values in arrays.values()]
+    if sum(sizes) < MIN_SHARED_BYTES:
+        return df
+
+    # the parent unlinks the block once mapped, it must outlive this process
+    block = _open_block(create=True, size=sum(sizes))
+    columns, offset = [], 0
+    for (col, values), size in zip(arrays.items(), sizes):
+        np.ndarray(values.shape, values.dtype, buffer=block.buf, offset=offset)[...] = values
+        columns.append((col, values.dtype.str, offset, len(values)))
+        offset += size
+    block.close()
+    return {'shared_memory': block.name, 'columns': columns,
+            'rest': df.drop(columns=list(arrays)), 'order': list(df.columns)}
+
+
+def attach_frame(shared):
+    """
+    DataFrame of a frame moved to shared memory by share_frame.
+
+    The numeric columns are views of the shared block, which is unlinked here
+    and unmapped once the last of them is gone. A DataFrame is returned as it is.
+
+    Args:
+        shared (dict or pd.DataFrame): Result of share_frame.
+
+    Returns:
+        pd.DataFrame: The frame.
+    """
+    if not isinstance(shared, dict):
+        return shared
+    block = _open_block(name=shared['shared_memory'])
+    block.unlink()
+    # the columns keep the mapping alive. SharedMemory has no public way to
+    # hand its mapping on: close() (also called when the block is garbage
+    # collected) unmaps it and fails while views of block.buf exist, so the
+    # mmap is taken over and the block is closed without it
+    mapping = block._mmap
+    block._buf.release()
+    block._buf, block._mmap = None, None
+    block.close()
+
+    mapped = {name: np.frombuffer(mapping, dtype, length, offset)
+              for name, dtype, offset, length in shared['columns']}
+    rest = shared['rest']
+    data = {col: mapped[col] if col in mapped else rest[col] for col in shared['order']}
+    return pd.DataFrame(data, index=rest.index, copy=False)
+
+
+def release_frame(shared):
+    """Free the shared block of a share_frame result that will not be attached."""
+    if isinstance(shared, dict):
+        block = _open_block(name=shared['shared_memory'])
+        block.unlink()
+        block.close()
@@ -0,0 +1,49 @@
+import os
+import sys
+import struct
+
+import pytest
+
+# repository root, the modules are imported from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TOB3Files:
+    """Small TOB3 files with frames of four 4-byte records."""
+
+    framesize = 12 + 4 * 4 + 4
+    stamp = 4660
+
+    def _file(self, table, interval, fields, frames):
+        header = ['"TOB3","SETX","CR6","1234","CR6.Std","CPU:x.CR6","999","2025-03-01 00:00:00"',
+                  f'"{table}","{interval}","{self.framesize}","1000000","{self.stamp}","Sec100Usec","0","0","0"']
+        header += [','.join(f'"{value}"' for value in line) for line in zip(*fields)]
+        data = bytearray(('\r\n'.join(header) + '\r\n').encode())
+        for seconds, record, records, stamp in frames:
+            data += struct.pack('<LLL', seconds, 0, record) + records + struct.pack('<HH', 0, stamp)
+        return bytes(data)
+
+    def __call__(self, n_frames, corrupt=(), interval='100 MSEC'):
+        """
+        A ts_data file of n_frames frames of four IEEE4 records; frames in corrupt fail validation.
+
+        The frames start a second apart, so only an interval of 250 MSEC lets
+        the records of consecutive frames follow each other in time.
+        """
+        return self._file('ts_data', interval, [('Ux', 'm/s', 'Smp', 'IEEE4')],
+                          [(1109635200 + i, 4 * i, struct.pack('<4f', *range(4)),
+                            0 if i in corrupt else self.stamp) for i in range(n_frames)])
+
+    def fp2_uint2(self, n_frames):
+        """A MonitorCSAT file of n_frames frames of four records of an FP2 and a UINT2 field."""
+        # FP2 1.5 (decimal point one digit left) and diagnostic words above 0x8000
+        return self._file('MonitorCSAT', '5 MIN', [('Ux', 'm/s', 'Smp', 'FP2'), ('diag_csat', '', 'Smp', 'UINT2')],
+                          [(1109635200 + 1200 * i, 4 * i,
+                            b''.join(struct.pack('>HH', 0x2000 | 15, 0x8000 + 4 * i + j) for j in range(4)),
+                            self.stamp) for i in range(n_frames)])
+
+
+@pytest.fixture
+def tob3():
+    """TOB3Files: tob3(n_frames) builds a ts_data file, tob3.fp2_uint2(n_frames) a MonitorCSAT file."""
+    return TOB3Files()
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from archive import compress_file, open_block_archive, write_block_archive
+from read_cs_files import read_cs_files
+
+
+def test_block_archive_round_trip(tmp_path, tob3):
+    data = tob3(100)
+    archive = str(tmp_path / 'ts_data_1.dat.blk')
+    index = write_block_archive(data, archive, block_size=10 * tob3.framesize)
+
+    # the header is a block of its own, the other blocks hold whole frames
+    data_start = len(data) - 100 * tob3.framesize
+    assert [block[0] for block in index['blocks']] == [0] + list(range(data_start, len(data), 10 * tob3.framesize))
+
+    with open_block_archive(archive) as f:
+        assert f.read() == data
+        # a read within the data only decompresses the blocks holding it
+        f.seek(data_start + 25 * tob3.framesize)
+        assert f.read(3 * tob3.framesize) == data[data_start + 25 * tob3.framesize:data_start + 28 * tob3.framesize]
+        assert f.raw.cached[0] == 3
+
+
+@pytest.mark.parametrize('fmt', ['blk', 'gz', 'xz'])
+def test_compressed_file_is_read_like_the_original(tmp_path, tob3, fmt):
+    raw = tmp_path / 'ts_data_1.dat'
+    raw.write_bytes(tob3(20))
+    os.utime(raw, (1, 1))
+    expected = read_cs_files(str(raw))[0]
+
+    compressed = compress_file(str(raw), fmt, delete=True)
+    assert not raw.exists()
+    assert os.path.getmtime(compressed) == 1
+    assert read_cs_files(compressed)[0] == expected
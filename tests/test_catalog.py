@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from catalog import Catalog, plan_reads
+from read_cs_files import read_cs_files
+from scan import scan_file
+
+BASE = datetime(1990, 1, 1) + timedelta(seconds=1109635200)
+
+
+def ring_buffer(tob3, n_frames, wrap):
+    """tob3(n_frames) as a wrapped ring buffer: frames wrap.. first, then 0..wrap."""
+    data = tob3(n_frames)
+    data_start = len(data) - n_frames * tob3.framesize
+    frames = data[data_start:]
+    cut = wrap * tob3.framesize
+    return data[:data_start] + frames[cut:] + frames[:cut], data_start
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (3, 6, (10, 14)),    # within the older run, at the end of the file
+    (14, 17, (1, 5)),    # within the newer run, at the start of the file
+    (11, 13, (0, 20)),   # the last frames of the older run and the first of the newer one
+    (30, 40, (7, 8)),    # after the newest frame, which may hold records of the period
+    (-9, -5, None),
+])
+def test_byte_range_of_wrapped_file(tmp_path, tob3, start, end, expected):
+    # frames 12..19 were written over the oldest ones, the file holds 12..19, 0..11
+    data, data_start = ring_buffer(tob3, 20, 12)
+    (tmp_path / "ts_data_1.dat").write_bytes(data)
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    catalog.update(str(tmp_path), ["ts_data*.dat"])
+    entry, = catalog.files("ts_data")
+    assert (entry["start"], entry["end"]) == (str(BASE), str(BASE + timedelta(seconds=19.3)))
+
+    byte_range = catalog.byte_range(entry, BASE + timedelta(seconds=start), BASE + timedelta(seconds=end))
+    if expected is None:
+        assert byte_range is None
+    else:
+        assert byte_range == tuple(data_start + i * tob3.framesize for i in expected)
+
+
+def test_minor_frame_at_the_end(tmp_path, tob3):
+    # the last frame holds two records, followed by the footer of a minor frame
+    data = bytearray(tob3(3))
+    last = len(data) - tob3.framesize
+    minor_size = 12 + 2 * 4 + 4
+    struct.pack_into("<HH", data, last + 12 + 2 * 4, 0x8000 | minor_size, tob3.stamp)
+    struct.pack_into("<HH", data, len(data) - 4, 0x8000, tob3.stamp)
+    (tmp_path / "ts_data_1.dat").write_bytes(data)
+
+    info = scan_file(str(tmp_path / "ts_data_1.dat"))
+    assert (info["end"], info["last_record"]) == (BASE + timedelta(seconds=2.1), 9)
+    records = read_cs_files(bytes(data))[0]
+    assert records[1] == list(range(10))
+
+
+def test_tables_update_one_catalog_from_parallel_threads(tmp_path, tob3):
+    tables = [f"table{i}" for i in range(4)]
+    for table in tables:
+        for n in range(3):
+            (tmp_path / f"{table}_{n}.dat").write_bytes(tob3(2))
+    path = str(tmp_path / "catalog.sqlite")
+
+    with ThreadPoolExecutor(max_workers=len(tables)) as pool:
+        reads = list(pool.map(lambda table: plan_reads(str(tmp_path), [f"{table}*.dat"], catalog=path), tables))
+    assert [len(r) for r in reads] == [3] * len(tables)
+    catalog = Catalog(path)
+    assert len(catalog.files()) == 3 * len(tables)
+    assert catalog.update(str(tmp_path), ["*.dat"]) == (0, 0)
@@ -0,0 +1,138 @@
+import os
+import asyncio
+import threading
+
+import pytest
+
+import download
+
+MTIME = 1740787200  # 2025-03-01 00:00:00 UTC
+
+
+class FakeLogger:
+    """Stand-in for the FTP server of a datalogger, recording every transfer."""
+
+    def __init__(self, files):
+        self.files = dict(files)
+        self.transfers = []  # (name, rest)
+
+    def connect(self, host, user, passwd):
+        return FakeFTP(self)
+
+
+class FakeFTP:
+    def __init__(self, logger):
+        self.logger = logger
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cwd(self, path):
+        pass
+
+    def voidcmd(self, cmd):
+        pass
+
+    def mlsd(self, facts=None):
+        for name, data in self.logger.files.items():
+            yield name, {'type': 'file', 'size': str(len(data)), 'modify': '20250301000000'}
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        name = cmd.split()[1]
+        self.logger.transfers.append((name, rest))
+        data = self.logger.files[name][rest or 0:]
+        for i in range(0, len(data), blocksize):
+            callback(data[i:i + blocksize])
+
+
+@pytest.fixture
+def logger(monkeypatch):
+    logger = FakeLogger({})
+    monkeypatch.setattr(download, '_connect', logger.connect)
+    return logger
+
+
+def fetch(logger, name, dest, mtime=MTIME):
+    return download.fetch_file('logger', name, len(logger.files[name]), mtime, str(dest))
+
+
+def test_grown_file_transfers_only_new_bytes(logger, tmp_path, tob3):
+    logger.files['ts_data.dat'] = tob3(3)
+    path = fetch(logger, 'ts_data.dat', tmp_path)
+    assert open(path, 'rb').read() == logger.files['ts_data.dat']
+    assert fetch(logger, 'ts_data.dat', tmp_path) is None
+
+    old_size = len(logger.files['ts_data.dat'])
+    logger.files['ts_data.dat'] = tob3(5)
+    assert fetch(logger, 'ts_data.dat', tmp_path, MTIME + 60) == path
+    assert logger.transfers == [('ts_data.dat', None), ('ts_data.dat', old_size)]
+    assert open(path, 'rb').read() == logger.files['ts_data.dat']
+    assert os.path.getmtime(path) == MTIME + 60
+
+
+def test_corrupt_frame_is_fetched_once_more_then_given_up(logger, tmp_path, tob3):
+    logger.files['ts_data.dat'] = tob3(5, corrupt=[3])
+    valid_end = len(tob3(3))
+    path = fetch(logger, 'ts_data.dat', tmp_path)
+    assert open(path, 'rb').read() == tob3(3)
+    assert logger.transfers == [('ts_data.dat', None), ('ts_data.dat', valid_end)]
+
+    # the same version of the file is not fetched again
+    assert fetch(logger, 'ts_data.dat', tmp_path) is None
+    assert len(logger.transfers) == 2
+
+    # once the logger wrote more, the rest is tried again from the valid frames
+    logger.files['ts_data.dat'] = tob3(6)
+    assert fetch(logger, 'ts_data.dat', tmp_path, MTIME + 60) == path
+    assert logger.transfers[-1] == ('ts_data.dat', valid_end)
+    assert open(path, 'rb').read() == tob3(6)
+
+
+def test_frame_cut_off_while_written_is_completed_by_the_retry(logger, tmp_path, monkeypatch, tob3):
+    complete = tob3(4)
+    logger.files['ts_data.dat'] = complete[:-10]
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        # the logger finishes the last frame during the first transfer
+        logger.transfers.append((cmd.split()[1], rest))
+        callback(logger.files['ts_data.dat'][rest or 0:])
+        logger.files['ts_data.dat'] = complete
+
+    monkeypatch.setattr(FakeFTP, 'retrbinary', retrbinary)
+    path = fetch(logger, 'ts_data.dat', tmp_path)
+    assert open(path, 'rb').read() == complete
+    assert len(logger.transfers) == 2
+
+
+def test_download_tables_fetches_matching_files(logger, tmp_path, tob3):
+    logger.files.update({'ts_data.dat': tob3(2), 'MetData.dat': tob3(1), 'notes.txt': b'x'})
+    paths = asyncio.run(download.download_tables('logger', str(tmp_path), ['*.dat'], workers=2))
+    assert sorted(os.path.basename(p) for p in paths) == ['MetData.dat', 'ts_data.dat']
+    assert not (tmp_path / 'notes.txt').exists()
+    assert asyncio.run(download.download_tables('logger', str(tmp_path), ['*.dat'])) == []
+
+
+def test_files_are_handed_on_while_other_transfers_run(logger, tmp_path, monkeypatch, tob3):
+    logger.files.update({'MetData.dat': tob3(1), 'ts_data.dat': tob3(2)})
+    events = []
+    decoded = threading.Event()
+    retrbinary = FakeFTP.retrbinary
+
+    def slow_retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        retrbinary(self, cmd, callback, blocksize, rest)
+        if cmd.endswith('ts_data.dat'):
+            # the large transfer lasts until the small file has been decoded
+            decoded.wait(timeout=5)
+        events.append(('transferred', cmd.split()[1]))
+
+    def on_file(path):
+        events.append(('decoded', os.path.basename(path)))
+        decoded.set()
+
+    monkeypatch.setattr(FakeFTP, 'retrbinary', slow_retrbinary)
+    asyncio.run(download.download_tables('logger', str(tmp_path), ['*.dat'], workers=2, on_file=on_file))
+    assert events == [('transferred', 'MetData.dat'), ('decoded', 'MetData.dat'),
+                      ('transferred', 'ts_data.dat'), ('decoded', 'ts_data.dat')]
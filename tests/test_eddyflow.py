@@ -0,0 +1,15 @@
+from eddyflow import decode_text
+
+TOA5 = ('"TOA5","SETX","CR6","1234","CR6.Std","CPU:x.CR6","999","MetData"\r\n'
+        '"TIMESTAMP","RECORD","T"\r\n"TS","RN","C"\r\n"","","Avg"\r\n'
+        '"2025-09-01 00:00:00",0,1.5\r\n"2025-09-01 00:30:00",1,2.5\r\n'
+        '"2025-09-01 01:00:00",2,3.5\r\n"2025-09-01 01:30:00",3,4.5\r\n')
+
+
+def test_decode_text_period_of_toa5(tmp_path):
+    src = tmp_path / "MetData_1.dat"
+    src.write_text(TOA5, newline="")
+    dst = tmp_path / "MetData_1.csv"
+    assert decode_text(str(src), str(dst), start="2025-09-01 00:30", end="2025-09-01 01:30") == 2
+    rows = dst.read_text().splitlines()[2:]
+    assert [row.split(",")[0] for row in rows] == ["2025-09-01 00:30:00", "2025-09-01 01:00:00"]
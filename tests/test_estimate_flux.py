@@ -0,0 +1,75 @@
+import os
+import sys
+import csv
+import configparser
+
+import estimate_flux
+
+# stand-in for eddypro_rp: logs the steps it was asked to compute and writes
+# a planar fit, a time lag and a fluxnet file as EddyPro does
+STUB = '''#!{python}
+import os, sys, configparser
+config = configparser.ConfigParser()
+config.read(sys.argv[-1])
+out_path = config['Project']['out_path']
+pf = config['RawProcess_TiltCorrection_Settings']
+to = config['RawProcess_TimelagOptimization_Settings']
+with open({log!r}, 'a') as log:
+    log.write(','.join([config['Project']['pr_start_date'], pf['pf_mode'], pf['pf_file'],
+                        to['to_mode'], to['to_file']]) + '\\n')
+if pf['pf_mode'] == '1':
+    open(os.path.join(out_path, 'eddypro_1_planar_fit_2025-10-01T000000_adv.txt'), 'w').close()
+if to['to_mode'] == '1':
+    open(os.path.join(out_path, 'eddypro_1_timelag_opt_2025-10-01T000000_adv.txt'), 'w').close()
+with open(os.path.join(out_path, 'eddypro_1_fluxnet_2025-10-01T000000_adv.csv'), 'w') as f:
+    f.write('TIMESTAMP_START,FC\\n' + config['Project']['pr_start_date'] + ',1\\n')
+'''
+
+
+def test_shards_reuse_monthly_steps(tmp_path):
+    proj_dir = str(tmp_path)
+    os.makedirs(os.path.join(proj_dir, 'software', 'eddyflow', 'EddyPro'))
+    log = os.path.join(proj_dir, 'runs.log')
+    stub = os.path.join(proj_dir, 'eddypro_rp')
+    with open(stub, 'w') as f:
+        f.write(STUB.format(python=sys.executable, log=log))
+    os.chmod(stub, 0o755)
+    template = os.path.join(os.path.dirname(estimate_flux.__file__), 'EddyPro', 'templates', 'setx.eddypro')
+
+    estimate_flux.estimate_month(2025, 9, proj_dir, os.path.relpath(template, proj_dir), 'setx.metadata',
+                                 'raw', 'out', shard='week', workers=2, eddypro=stub)
+
+    with open(log) as f:
+        runs = sorted(csv.reader(f))
+    assert [run[0] for run in runs] == ['2025-08-31', '2025-09-07', '2025-09-14', '2025-09-21', '2025-09-28']
+    # only the first shard fits over the month, the others read its results
+    first_dir = os.path.join(proj_dir, 'out', '2025-09', '202509072330')
+    assert runs[0][1:] == ['1', '', '1', '']
+    for run in runs[1:]:
+        assert run[1:] == ['0', os.path.join(first_dir, 'eddypro_1_planar_fit_2025-10-01T000000_adv.txt'),
+                           '0', os.path.join(first_dir, 'eddypro_1_timelag_opt_2025-10-01T000000_adv.txt')]
+
+    first = configparser.ConfigParser()
+    first.read(os.path.join(proj_dir, 'software', 'eddyflow', 'EddyPro', 'setx_20250930_202509072330.eddypro'))
+    assert first['RawProcess_TiltCorrection_Settings']['pf_end_date'] == '2025-08-31'
+    assert first['RawProcess_TiltCorrection_Settings']['pf_start_date'] == '2025-09-30'
+
+    with open(os.path.join(proj_dir, 'out', '2025-09', 'eddypro_1_fluxnet_adv.csv')) as f:
+        assert len(f.read().splitlines()) == 1 + 5
+
+
+def test_merge_takes_rows_of_the_latest_run_in_time_order(tmp_path):
+    def write(shard, run, rows):
+        os.makedirs(tmp_path / shard, exist_ok=True)
+        with open(tmp_path / shard / f'eddypro_1_fluxnet_{run}_adv.csv', 'w') as f:
+            f.write('TIMESTAMP_START,FC\n' + ''.join(f'{t},{fc}\n' for t, fc in rows))
+
+    write('a', '2025-10-01T000000', [('202509302330', 'old'), ('202510010000', 'old')])
+    write('a', '2025-10-02T120000', [('202509302330', 'new'), ('202510010000', 'new')])
+    write('b', '2025-10-01T000000', [('202510010000', 'b'), ('202510010030', 'b')])
+
+    merged = tmp_path / 'merged.csv'
+    assert estimate_flux.merge_fluxnet_outputs([str(tmp_path / 'a'), str(tmp_path / 'b')], str(merged)) == 3
+    with open(merged) as f:
+        assert list(csv.reader(f))[1:] == [['202509302330', 'new'], ['202510010000', 'b'],
+                                           ['202510010030', 'b']]
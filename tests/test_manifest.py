@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import manifest as manifest_module
+from archive import compress_file
+from manifest import Manifest, file_hash
+
+
+@pytest.mark.parametrize("fmt", ["gz", "xz", "blk"])
+def test_archived_input_is_done(tmp_path, fmt, tob3):
+    raw = tmp_path / "ts_data_1.dat"
+    raw.write_bytes(tob3(50))
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    manifest.record_input(str(raw), file_hash(str(raw)))
+
+    archived = compress_file(str(raw), fmt, delete=True)
+    assert file_hash(archived) == manifest.inputs["ts_data_1.dat"]["sha1"]
+    assert Manifest(manifest.filename).input_done(archived, file_hash(archived))
+
+
+def test_unchanged_inputs_are_not_read(tmp_path, monkeypatch, tob3):
+    raw = tmp_path / "ts_data_1.dat"
+    raw.write_bytes(tob3(5))
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    assert manifest.check_input(str(raw))[0] is False
+    manifest.record_input(str(raw), manifest.digest(str(raw)))
+
+    read = []
+    monkeypatch.setattr(manifest_module, "file_hash", lambda filename: read.append(filename) or "x")
+    manifest = Manifest(manifest.filename)
+    assert manifest.check_input(str(raw))[0] is True
+    assert read == []
+
+    # a grown file is read again
+    raw.write_bytes(tob3(6))
+    assert manifest.check_input(str(raw)) == (False, "x")
+    assert read == [str(raw)]
+
+
+def test_archived_input_is_recorded_with_its_new_size(tmp_path, tob3):
+    raw = tmp_path / "ts_data_1.dat"
+    raw.write_bytes(tob3(50))
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    manifest.record_input(str(raw), manifest.digest(str(raw)), outputs=["ts_data_2005-03-01_0000.dat"])
+
+    archived = compress_file(str(raw), "gz", delete=True)
+    assert manifest.check_input(archived)[0] is True
+    entry = Manifest(manifest.filename).inputs["ts_data_1.dat"]
+    assert entry["size"] == os.path.getsize(archived)
+    assert entry["outputs"] == ["ts_data_2005-03-01_0000.dat"]
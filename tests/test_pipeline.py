@@ -0,0 +1,68 @@
+import time
+import random
+import threading
+
+import pytest
+
+from pipeline import Step, run_pipeline
+
+
+def counted(n, taken):
+    # items 0..n-1, counting the items the pipeline took
+    for i in range(n):
+        taken.append(i)
+        yield i
+
+
+def test_results_keep_the_order_of_the_items():
+    def slow_square(i):
+        time.sleep(random.random() / 100)
+        return i * i
+
+    results = list(run_pipeline(range(30), [Step('square', slow_square, workers=4),
+                                            Step('add', lambda i: i + 1)]))
+    assert results == [i * i + 1 for i in range(30)]
+
+
+def test_slow_consumer_holds_back_the_steps():
+    taken = []
+    results = run_pipeline(counted(100, taken), [Step('a', lambda i: i), Step('b', lambda i: i, workers=2)],
+                           maxsize=1)
+    assert next(results) == 0
+    time.sleep(0.3)
+    # only a few items wait in the bounded queues and steps
+    assert len(taken) < 15
+    assert list(results) == list(range(1, 100))
+
+
+def test_error_of_a_step_is_raised_and_stops_the_pipeline():
+    taken, discarded = [], []
+    lock = threading.Lock()
+
+    def fail_at_5(i):
+        if i == 5:
+            raise ValueError('bad item 5')
+        return i
+
+    def discard(result):
+        with lock:
+            discarded.append(result)
+
+    results = []
+    with pytest.raises(ValueError, match='bad item 5'):
+        for result in run_pipeline(counted(100, taken), [Step('decode', fail_at_5, workers=2),
+                                                         Step('write', lambda i: i, discard=discard)]):
+            results.append(result)
+    assert results == [0, 1, 2, 3, 4]
+    # the items after the failed one are not all read
+    assert len(taken) < 100
+    assert all(result > 4 for result in discarded)
+
+
+def test_stopping_early_frees_the_results_left():
+    discarded = []
+    results = run_pipeline(range(50), [Step('decode', lambda i: i, discard=discarded.append)], maxsize=4)
+    assert next(results) == 0
+    time.sleep(0.1)
+    results.close()
+    assert discarded and all(result > 0 for result in discarded)
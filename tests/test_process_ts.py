@@ -0,0 +1,57 @@
+import csv
+import configparser
+
+from column_plan import compile_column_plan
+from ingest import load_data
+from manifest import Manifest
+from process_ts import seed_manifest, write_full_day_data
+
+
+def test_manifest_is_seeded_from_log_ts(tmp_path, tob3):
+    src, dst = tmp_path / "CRD", tmp_path / "ts_data"
+    src.mkdir()
+    dst.mkdir()
+    for i in (1, 2, 10):
+        (src / f"ts_data_{i}.dat").write_bytes(tob3(i))
+    (dst / "log_ts.txt").write_text("ts_data_2.dat\n")
+    (dst / "ts_data_2005-03-01_0000.dat").write_text("")
+    (dst / "meta.txt").write_text("")
+
+    manifest = Manifest(str(dst / "manifest.jsonl"))
+    assert seed_manifest(manifest, str(src), str(dst), "ts_data") == (2, 1)
+
+    manifest = Manifest(str(dst / "manifest.jsonl"))
+    assert manifest.output_done("ts_data_2005-03-01")
+    assert manifest.check_input(str(src / "ts_data_1.dat"))[0]
+    assert manifest.check_input(str(src / "ts_data_2.dat"))[0]
+    assert not manifest.check_input(str(src / "ts_data_10.dat"))[0]
+
+    # a logged file that has grown since is read again
+    (src / "ts_data_2.dat").write_bytes(tob3(3))
+    assert not manifest.check_input(str(src / "ts_data_2.dat"))[0]
+
+
+def test_no_seed_without_log_ts(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    assert seed_manifest(manifest, str(tmp_path), str(tmp_path), "ts_data") == (0, 0)
+    assert not (tmp_path / "manifest.jsonl").exists()
+
+
+def test_record_is_kept_in_day_files_although_ignored(tmp_path, tob3):
+    # as in setx.metadata: RECORD (col_2) and diag_csat are ignored
+    meta_file = tmp_path / "setx.metadata"
+    config = configparser.ConfigParser()
+    config["FileDescription"] = {"col_1_variable": "not_numeric", "col_2_variable": "ignore",
+                                 "col_3_variable": "u", "col_4_variable": "ignore"}
+    with open(meta_file, "w") as f:
+        config.write(f)
+
+    df, meta = load_data(tob3.fp2_uint2(2), compile_column_plan(str(meta_file)))
+    df["date"] = df["TIMESTAMP"].dt.date
+    filename = write_full_day_data(df, meta, df["date"].iloc[0], str(tmp_path), "ts_data")
+
+    with open(filename) as f:
+        rows = list(csv.reader(f))
+    assert rows[1][:4] == ["TIMESTAMP", "RECORD", "Ux", "diag_csat"]
+    assert [row[1] for row in rows[2:]] == [str(i) for i in range(len(df))]
+    assert all(row[3] == "" for row in rows[2:])
@@ -0,0 +1,58 @@
+import os
+import json
+
+import pytest
+
+import profiling
+from profiling import LOG_ENV, enable, print_summary, stage, summarize
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    # enable sets the variable, restored after the test
+    monkeypatch.setenv(LOG_ENV, '')
+    filename = str(tmp_path / 'profile' / 'stages.jsonl')
+    enable(filename)
+    return filename
+
+
+def test_stages_are_logged_and_summed(log, capsys):
+    for n in (10, 20):
+        with stage('decode', file=f'ts_data_{n}.dat') as s:
+            s.add(bytes=1000 * n, records=n)
+            s.add(records=1, rejected_frames=None)
+    with pytest.raises(ValueError):
+        with stage('write_day', day='2025-09-01'):
+            raise ValueError('disk full')
+
+    with open(log) as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry['stage'] for entry in entries] == ['decode', 'decode', 'write_day']
+    assert entries[0]['file'] == 'ts_data_10.dat' and entries[0]['records'] == 11
+    assert entries[0]['pid'] == os.getpid()
+    assert entries[2]['error'] == "ValueError('disk full')"
+    assert all(entry['seconds'] >= 0 and entry['cpu_seconds'] >= 0 for entry in entries)
+
+    summary = summarize(log)
+    assert list(summary) == ['decode', 'write_day']
+    assert (summary['decode']['count'], summary['decode']['bytes'], summary['decode']['records']) == (2, 30000, 32)
+    assert summary['write_day']['records'] == 0
+
+    print_summary(log)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[:3] == ['stage', 'count', 'wall']
+    assert lines[1].split()[:2] == ['decode', '2'] and lines[1].split()[6] == '32'
+
+
+def test_nothing_is_logged_unless_enabled(tmp_path, monkeypatch):
+    monkeypatch.delenv(LOG_ENV, raising=False)
+    with stage('decode') as s:
+        s.add(records=5)
+    assert s.fields == {'records': 5}
+    assert os.listdir(tmp_path) == []
+
+
+def test_peak_rss_is_reported():
+    if profiling.resource is None:
+        pytest.skip('resource is not available')
+    assert profiling.peak_rss_mb() > 0
@@ -0,0 +1,94 @@
+import struct
+
+import numpy as np
+
+from ingest import load_data
+from read_cs_files import read_cs_bulk, read_cs_files, read_cs_formats, read_cs_tob3_headers, tob3_to_datetime
+
+def test_uint2_is_not_converted_as_fp2(tob3):
+    data, meta = read_cs_files(tob3.fp2_uint2(3))[:2]
+    names = meta[2]
+    assert list(data[names.index('diag_csat')]) == [0x8000 + k for k in range(12)]
+    assert list(data[names.index('Ux')]) == [1.5] * 12
+
+    df, _ = load_data(tob3.fp2_uint2(3))
+    assert df['diag_csat'].dtype == np.uint16
+    assert df['diag_csat'].tolist() == [0x8000 + k for k in range(12)]
+
+
+def test_corrupt_frame_is_rejected(tob3):
+    data, meta, report = read_cs_files(tob3(5, corrupt=[2], interval='250 MSEC'), report=True)
+    assert data[1] == [0, 1, 2, 3, 4, 5, 6, 7, 12, 13, 14, 15, 16, 17, 18, 19]
+    assert (report['frames'], report['rejected_frames']) == (5, 1)
+    header = len(tob3(0, interval='250 MSEC'))
+    assert report['skipped'] == [(header + 2 * tob3.framesize, header + 3 * tob3.framesize)]
+
+
+def test_frames_are_found_again_after_inserted_bytes(tob3):
+    # bytes repeated by an interrupted download, after the third frame
+    good = tob3(6, interval='250 MSEC')
+    cut = len(good) - 3 * tob3.framesize
+    data, meta, report = read_cs_files(good[:cut] + good[cut - 7:cut] + good[cut:], report=True)
+    assert data[1] == list(range(24))
+    assert report['rejected_frames'] == 1
+    assert report['skipped'] == [(cut, cut + 7)]
+
+
+def test_minor_frames_hold_fewer_records(tob3):
+    # frames 1 and 3 are minor frames of one and three records
+    data = bytearray(tob3(5, interval='250 MSEC'))
+    data_start = len(data) - 5 * tob3.framesize
+    for i, n in [(1, 1), (3, 3)]:
+        start = data_start + i * tob3.framesize
+        struct.pack_into('<HH', data, start + 12 + n * 4, 0x8000 | (12 + n * 4 + 4), tob3.stamp)
+        struct.pack_into('<HH', data, start + tob3.framesize - 4, 0x8000, tob3.stamp)
+
+    offsets = [data_start + i * tob3.framesize for i in range(5)]
+    headers, counts = read_cs_tob3_headers(bytes(data), offsets, 4, 4, [tob3.stamp, 2 ** 16 - 1 - tob3.stamp])
+    assert counts.tolist() == [4, 1, 4, 3, 4]
+    assert headers[:, 2].tolist() == [0, 4, 8, 12, 16]
+
+    records = read_cs_files(bytes(data))[0][1]
+    assert records == [0, 1, 2, 3, 4, 8, 9, 10, 11, 12, 13, 14, 16, 17, 18, 19]
+
+
+CSFORMAT = ['IEEE4', 'NSec', 'Bool8', 'ASCII(6)']
+
+
+def records_buffer(n_records, seed=0):
+    """Records of an IEEE4, NSec, Bool8 and ASCII(6) field with random values, and their starts."""
+    rng = np.random.default_rng(seed)
+    words = [b'OK', b'Fault', b'\\t', b'', b'abcdef']
+    buf = b''.join(struct.pack('>f', rng.random()) + struct.pack('>Q', int(rng.integers(2 ** 63)))
+                   + struct.pack('B', int(rng.integers(256)))
+                   # garbage after the NUL ending a string
+                   + (words[int(rng.integers(len(words)))] + b'\0xyz')[:6].ljust(6, b'\0')
+                   for _ in range(n_records))
+    return buf, np.arange(n_records) * 19
+
+
+def test_bulk_nsec_and_bool8_match_the_struct_path():
+    buf, recstart = records_buffer(200)
+    pyformat = read_cs_formats(CSFORMAT)
+    unpacked, bulk = read_cs_bulk(buf, recstart, pyformat, CSFORMAT, keep=[1, 2])
+    assert unpacked == [] and sorted(bulk) == [0, 1]
+
+    for k, start in enumerate(recstart.tolist()):
+        qword, = struct.unpack_from('>Q', buf, start + 4)
+        expected = np.datetime64(tob3_to_datetime(qword), 'ns')
+        # tob3_to_datetime adds the fraction to the seconds as a float and rounds to microseconds
+        assert abs(bulk[0][k] - expected) <= np.timedelta64(1, 'us')
+        flags, = struct.unpack_from('B', buf, start + 12)
+        assert bulk[1][k].tolist() == [bool(flags >> (7 - bit) & 1) for bit in range(8)]
+
+
+def test_bulk_ascii_matches_the_struct_path():
+    buf, recstart = records_buffer(200, seed=1)
+    pyformat = read_cs_formats(CSFORMAT)
+    expected = [struct.unpack_from('6s', buf, start + 13)[0].split(b'\0')[0] for start in recstart.tolist()]
+
+    unpacked, bulk = read_cs_bulk(buf, recstart, pyformat, CSFORMAT, strings='bytes')
+    assert unpacked == [0]
+    assert bulk[3].tolist() == expected
+    _, bulk = read_cs_bulk(buf, recstart, pyformat, CSFORMAT)
+    assert bulk[3].tolist() == [value.decode('unicode_escape') for value in expected]
@@ -0,0 +1,62 @@
+import io
+import os
+import time
+
+from readahead import MIN_BLOCK, open_sequential, prefetch, warm_file
+
+
+class CountingFile(io.FileIO):
+    """Unbuffered file recording the size of every read."""
+
+    def __init__(self, filename):
+        super().__init__(filename, 'rb')
+        self.reads = []
+
+    def readinto(self, buffer):
+        n = super().readinto(buffer)
+        self.reads.append(len(buffer))
+        return n
+
+
+def test_reads_match_the_file_and_grow_while_sequential(tmp_path):
+    data = os.urandom(3 * MIN_BLOCK * 8 + 123)
+    path = tmp_path / 'ts_data_1.dat'
+    path.write_bytes(data)
+
+    raw = CountingFile(str(path))
+    with open_sequential(str(path), max_block=8 * MIN_BLOCK, raw=raw) as f:
+        chunks = iter(lambda: f.read(1000), b'')
+        assert b''.join(chunks) == data
+        # a whole-file read issues few, large reads
+        assert max(raw.reads) == 8 * MIN_BLOCK
+        assert len(raw.reads) < len(data) // MIN_BLOCK
+
+        # after a seek elsewhere, reads are small again
+        raw.reads.clear()
+        f.seek(5 * MIN_BLOCK + 7)
+        assert f.read(100) == data[5 * MIN_BLOCK + 7:5 * MIN_BLOCK + 107]
+        assert raw.reads == [MIN_BLOCK]
+        assert f.read() == data[5 * MIN_BLOCK + 107:]
+
+
+def test_warm_file_reads_header_and_byte_range(tmp_path):
+    path = tmp_path / 'ts_data_1.dat'
+    path.write_bytes(bytes(4 * MIN_BLOCK))
+    assert warm_file(str(path)) == 4 * MIN_BLOCK
+    assert warm_file(str(path), (2 * MIN_BLOCK, 3 * MIN_BLOCK)) == 2 * MIN_BLOCK
+
+
+def test_prefetch_reads_the_next_files_ahead():
+    warmed = []
+    files = [f'ts_data_{i}.dat' for i in range(5)]
+    consumed = []
+    for filename in prefetch(files, {'ts_data_2.dat': (0, 10)}, depth=2,
+                             warm=lambda f, byte_range: warmed.append((f, byte_range))):
+        consumed.append(filename)
+        # the two following files are read while this one is consumed
+        deadline = time.time() + 5
+        while len(warmed) < min(len(files), len(consumed) + 2) and time.time() < deadline:
+            time.sleep(0.001)
+        assert len(warmed) >= min(len(files), len(consumed) + 2)
+    assert consumed == files
+    assert warmed == [(f, (0, 10) if f == 'ts_data_2.dat' else None) for f in files]
@@ -0,0 +1,31 @@
+import numpy as np
+
+from record_qc import TOB3_EPOCH, analyse_records, completeness
+
+
+def test_gaps_duplicates_and_resets():
+    # records 0-5 with 3 missing and 2 repeated, then the logger restarts at 0
+    records = [0, 1, 2, 2, 4, 5, 0, 1]
+    seconds = [0., 1., 2., 2., 4., 5., 10., 11.]
+    order, report = analyse_records(records, seconds)
+    assert order.tolist() == [0, 1, 2, 4, 5, 6, 7]
+    assert report['records'] == 7
+    assert report['duplicates'] == 1
+    assert [gap[:3] for gap in report['gaps']] == [(2, 4, 1)]
+    assert report['gaps'][0][3:] == (TOB3_EPOCH + np.timedelta64(2, 's'), TOB3_EPOCH + np.timedelta64(4, 's'))
+    assert report['resets'] == [(5, 0, TOB3_EPOCH + np.timedelta64(10, 's'))]
+
+
+def test_ring_buffer_wrap_is_sorted_out():
+    # the newest frames come first in a wrapped ring buffer: not a reset
+    records = [8, 9, 10, 11, 4, 5, 6, 7]
+    seconds = [8., 9., 10., 11., 4., 5., 6., 7.]
+    order, report = analyse_records(records, seconds)
+    assert [records[i] for i in order] == list(range(4, 12))
+    assert report['resets'] == [] and report['gaps'] == []
+
+
+def test_completeness_of_a_day():
+    timestamps = np.datetime64('2025-09-01') + np.arange(0, 43200, 1800) * np.timedelta64(1, 's')
+    assert completeness(timestamps) == 0.5
+    assert completeness(timestamps[:1]) == 1.
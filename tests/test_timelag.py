@@ -0,0 +1,65 @@
+import configparser
+
+import numpy as np
+import pandas as pd
+
+from timelag import estimate_timelags, write_metadata_timelags, xcov_lags
+
+FREQ = 10.
+# co2 comes before w in the file, h2o after it
+VARIABLES = {1: 'not_numeric', 2: 'ignore', 3: 'co2', 4: 'ignore', 5: 'w', 6: 'h2o'}
+
+
+def write_metadata(path):
+    config = configparser.ConfigParser()
+    config['Timing'] = {'acquisition_frequency': str(FREQ)}
+    config['FileDescription'] = {f'col_{n}_variable': v for n, v in VARIABLES.items()}
+    with open(path, 'w') as f:
+        f.write(';GHG_METADATA\n')
+        config.write(f, space_around_delimiters=False)
+
+
+def write_day_file(path, n_samples, lags, seed=0):
+    """A day file whose co2 and h2o follow w by lags[name] samples."""
+    rng = np.random.default_rng(seed)
+    w = rng.normal(size=n_samples + 100)
+    columns = {
+        'TIMESTAMP': pd.date_range('2025-09-01', periods=n_samples, freq='100ms').strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'RECORD': np.arange(n_samples),
+        'co2': w[50 - lags['co2']:50 - lags['co2'] + n_samples] + 0.1 * rng.normal(size=n_samples),
+        'diag': np.zeros(n_samples),
+        'w': w[50:50 + n_samples],
+        'h2o': w[50 - lags['h2o']:50 - lags['h2o'] + n_samples] + 0.1 * rng.normal(size=n_samples),
+    }
+    with open(path, 'w') as f:
+        f.write('"TS","RN","mmol/m^3","","m/s","mmol/m^3"\n')
+        pd.DataFrame(columns).to_csv(f, index=False)
+
+
+def test_xcov_lags_finds_the_injected_lag():
+    rng = np.random.default_rng(1)
+    w = rng.normal(size=(4, 600))
+    scalar = np.roll(w, 7, axis=1)
+    lags, corr = xcov_lags(w - w.mean(axis=1)[:, None], scalar - scalar.mean(axis=1)[:, None], 20)
+    assert lags.tolist() == [7] * 4
+    assert np.all(corr > 0.9)
+
+
+def test_timelags_are_estimated_and_written(tmp_path):
+    meta = tmp_path / 'setx.metadata'
+    write_metadata(meta)
+    day = tmp_path / 'ts_data_2025-09-01_0000.dat'
+    write_day_file(day, 6000, {'co2': 7, 'h2o': -3})
+
+    config, scalars, ranges, per_period = estimate_timelags([str(day)], str(meta), avg_len=1, max_lag=2.)
+    assert scalars == {'co2': 3, 'h2o': 6}
+    assert len(per_period) == 10
+    assert np.allclose(per_period['co2_lag'], 0.7) and np.allclose(per_period['h2o_lag'], -0.3)
+
+    write_metadata_timelags(config, str(meta), scalars, ranges)
+    written = configparser.ConfigParser()
+    written.read(meta)
+    desc = written['FileDescription']
+    assert (desc['col_3_min_timelag'], desc['col_3_nom_timelag'], desc['col_3_max_timelag']) == ('0.70',) * 3
+    assert desc['col_6_nom_timelag'] == '-0.30'
+    assert 'col_5_nom_timelag' not in desc
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from watch import MonitorMeans, Watcher
+
+
+def monitor_records(start, periods):
+    timestamps = pd.date_range(start, periods=periods, freq="5min")
+    return pd.DataFrame({"TIMESTAMP": timestamps,
+                         "RECORD": np.arange(periods),
+                         "Ux": np.linspace(0., 1., periods, dtype=np.float32)})
+
+
+def test_monitor_means_are_updated_in_place(tmp_path):
+    df = monitor_records("2025-09-01 00:05", 40)
+    means = MonitorMeans("MonitorCSAT", str(tmp_path))
+    # chunks end within and on the edge of averaging periods, and the last
+    # chunk repeats records of a finished period (a file read again)
+    for chunk in (df[:4], df[4:5], df[5:17], df[17:30], df[10:40]):
+        means.add("MonitorCSAT_1.dat", chunk.reset_index(drop=True), ["meta"])
+        assert len(means.open) <= 6
+
+    expected = df.set_index("TIMESTAMP").resample("30min").mean(numeric_only=True)
+    written = (tmp_path / "MonitorCSAT_30min.csv").read_text()
+    assert written == expected.to_csv(index=True, lineterminator="\n")
+
+
+class RecordingSink:
+    def __init__(self):
+        self.added = []
+
+    def add(self, filename, df, data_meta, digest=None):
+        self.added.append((os.path.basename(filename), len(df)))
+
+
+def test_update_file_decodes_only_new_frames(tmp_path, tob3):
+    path = tmp_path / "ts_data_1.dat"
+    path.write_bytes(tob3(2))
+    sink = RecordingSink()
+    watcher = Watcher(str(tmp_path), {"ts_data": sink})
+    assert watcher.update_file(str(path))
+    assert not watcher.update_file(str(path))
+    assert not watcher.update_file(str(tmp_path / "MetData_1.dat"))
+
+    path.write_bytes(tob3(5))
+    os.utime(path, (1, 1))
+    assert watcher.update_file(str(path))
+    assert sink.added == [("ts_data_1.dat", 8), ("ts_data_1.dat", 12)]
+
+
+def test_every_sink_of_a_table_gets_the_new_frames(tmp_path, tob3):
+    path = tmp_path / "ts_data_1.dat"
+    path.write_bytes(tob3(2))
+    sinks = [RecordingSink(), RecordingSink()]
+    watcher = Watcher(str(tmp_path), {"ts_data": sinks})
+    assert watcher.poll() == 1
+    assert [sink.added for sink in sinks] == [[("ts_data_1.dat", 8)]] * 2
+
+
+def test_late_monitor_records_are_reported(tmp_path, capsys):
+    df = monitor_records("2025-09-01 00:05", 12)
+    means = MonitorMeans("MonitorCSAT", str(tmp_path))
+    means.add("MonitorCSAT_2.dat", df[6:].reset_index(drop=True), ["meta"])
+    means.add("MonitorCSAT_1.dat", df[:6].reset_index(drop=True), ["meta"])
+    assert "MonitorCSAT_1.dat: 6 records from 2025-09-01 00:05:00" in capsys.readouterr().out
@@ -0,0 +1,255 @@
+import os
+import glob
+import argparse
+import configparser
+import numpy as np
+import pandas as pd
+
+
+# scalars whose time lag against w is estimated, as named in the EddyPro metadata
+LAG_VARIABLES = ['co2', 'h2o', 'ch4', 'n2o']
+
+
+def read_metadata_columns(file_meta):
+    """
+    Find the w column and the gas analyser columns in an EddyPro metadata file.
+
+    Args:
+        file_meta (str): EddyPro .metadata file.
+
+    Returns:
+        tuple: A tuple containing:
+            - config (configparser.ConfigParser): The parsed metadata.
+            - w_col (int): 1-based column number of w.
+            - scalars (dict): Variable name -> 1-based column number.
+            - freq (float): Acquisition frequency in Hz.
+    """
+    config = configparser.ConfigParser()
+    config.read(file_meta)
+    desc = config['FileDescription']
+
+    w_col, scalars = None, {}
+    n_cols = max(int(key.split('_')[1]) for key in desc if key.startswith('col_'))
+    for n in range(1, n_cols + 1):
+        variable = desc.get(f'col_{n}_variable', 'ignore')
+        if variable == 'w':
+            w_col = n
+        elif variable in LAG_VARIABLES:
+            scalars[variable] = n
+
+    if w_col is None:
+        raise ValueError(f'No w column found in {file_meta}')
+
+    freq = float(config['Timing']['acquisition_frequency'])
+    return config, w_col, scalars, freq
+
+
+def load_period_matrix(files, columns, freq, n_period, min_valid=0.9):
+    """
+    Load decoded day files into one (n_periods, n_period) matrix per column.
+
+    Args:
+        files (list): Day files written by process_ts (units row, then column names).
+        columns (list): 1-based column numbers to load.
+        freq (float): Acquisition frequency in Hz.
+        n_period (int): Number of samples per averaging period.
+        min_valid (float): Minimum fraction of valid samples for a period to be kept.
+
+    Returns:
+        tuple: A tuple containing:
+            - starts (pd.DatetimeIndex): Start time of each kept period.
+            - matrices (dict): Column number -> float64 array of shape
+              (n_periods, n_period), with the period mean removed and gaps set to 0.
+    """
+    # usecols returns the columns in file order, so they are labelled by their
+    # 0-based position; a column may be asked for twice
+    positions = sorted({0} | {c - 1 for c in columns})
+    frames = []
+    for fname in files:
+        df = pd.read_csv(fname, skiprows=1, usecols=positions)
+        df.columns = positions
+        frames.append(df)
+    if not frames:
+        return pd.DatetimeIndex([]), {c: np.empty((0, n_period)) for c in columns}
+
+    df = pd.concat(frames, ignore_index=True)
+    df['TIMESTAMP'] = pd.to_datetime(df[0])
+    df = df.drop_duplicates('TIMESTAMP').sort_values('TIMESTAMP')
+
+    # periods are labelled by their start, sample position within a period from its time
+    period = pd.Timedelta(seconds=n_period / freq)
+    starts = df['TIMESTAMP'].dt.floor(period)
+    pos = ((df['TIMESTAMP'] - starts) / pd.Timedelta(seconds=1 / freq)).round().astype(np.int64).to_numpy()
+    codes, uniques = pd.factorize(starts, sort=True)
+
+    keep = pos < n_period
+    matrices = {}
+    valid = np.zeros((len(uniques), n_period), dtype=bool)
+    valid[codes[keep], pos[keep]] = True
+    for c in columns:
+        m = np.full((len(uniques), n_period), np.nan)
+        m[codes[keep], pos[keep]] = pd.to_numeric(df[c - 1], errors='coerce').to_numpy()[keep]
+        valid &= np.isfinite(m)
+        matrices[c] = m
+
+    good = valid.mean(axis=1) >= min_valid
+    for c in columns:
+        m = matrices[c][good]
+        v = valid[good]
+        m = np.where(v, m, 0.)
+        m -= (m.sum(axis=1) / v.sum(axis=1))[:, None]
+        matrices[c] = np.where(v, m, 0.)
+    return pd.DatetimeIndex(uniques[good]), matrices
+
+
+def xcov_lags(w, scalar, max_lag, batch=96):
+    """
+    Covariance maximising lag of a scalar against w for every averaging period.
+
+    The cross-covariance of each period is computed with an FFT over all
+    periods of a batch at once. A positive lag means the scalar lags behind w.
+
+    Args:
+        w (np.ndarray): Detrended w, shape (n_periods, n_period).
+        scalar (np.ndarray): Detrended scalar, same shape as w.
+        max_lag (int): Largest lag searched, in samples, in both directions.
+        batch (int): Number of periods transformed together.
+
+    Returns:
+        tuple: A tuple containing:
+            - lags (np.ndarray): Lag in samples per period.
+            - corr (np.ndarray): Correlation coefficient at that lag per period.
+    """
+    n_periods, n = w.shape
+    nfft = 1 << (2 * n - 1).bit_length()
+    lag_index = np.r_[nfft - max_lag:nfft, 0:max_lag + 1]
+    lag_values = np.r_[-max_lag:0, 0:max_lag + 1]
+
+    lags = np.zeros(n_periods, dtype=np.int64)
+    corr = np.zeros(n_periods)
+    for i in range(0, n_periods, batch):
+        wb, sb = w[i:i + batch], scalar[i:i + batch]
+        spec = np.conj(np.fft.rfft(wb, nfft, axis=1)) * np.fft.rfft(sb, nfft, axis=1)
+        xcov = np.fft.irfft(spec, nfft, axis=1)[:, lag_index] / n
+        best = np.argmax(np.abs(xcov), axis=1)
+        norm = np.sqrt((wb ** 2).mean(axis=1) * (sb ** 2).mean(axis=1))
+        lags[i:i + batch] = lag_values[best]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr[i:i + batch] = xcov[np.arange(len(best)), best] / norm
+    return lags, corr
+
+
+def lag_ranges(lags, corr, freq, min_corr=0.1, percentiles=(5, 95)):
+    """
+    Summarise per-period lags into the min/nominal/max lag written to the metadata.
+
+    Args:
+        lags (np.ndarray): Lag in samples per period.
+        corr (np.ndarray): Correlation coefficient at the lag per period.
+        freq (float): Acquisition frequency in Hz.
+        min_corr (float): Periods with a weaker absolute correlation are not used.
+        percentiles (tuple): Percentiles giving the min and max lag.
+
+    Returns:
+        dict or None: min_timelag, nom_timelag and max_timelag in seconds, and the
+        number of periods used, or None if no period is usable.
+    """
+    use = np.abs(np.nan_to_num(corr)) >= min_corr
+    if not use.any():
+        return None
+    seconds = lags[use] / freq
+    lo, hi = np.percentile(seconds, percentiles)
+    return {'min_timelag': float(lo), 'nom_timelag': float(np.median(seconds)),
+            'max_timelag': float(hi), 'n_periods': int(use.sum())}
+
+
+def write_metadata_timelags(config, file_meta, columns, ranges):
+    """
+    Write the estimated time lag ranges into an EddyPro metadata file.
+
+    Args:
+        config (configparser.ConfigParser): The parsed metadata.
+        file_meta (str): Metadata file to write.
+        columns (dict): Variable name -> 1-based column number.
+        ranges (dict): Variable name -> result of lag_ranges.
+    """
+    for variable, rng in ranges.items():
+        if rng is None:
+            continue
+        n = columns[variable]
+        for key in ['min_timelag', 'nom_timelag', 'max_timelag']:
+            config['FileDescription'][f'col_{n}_{key}'] = f'{rng[key]:.2f}'
+
+    with open(file_meta, 'w') as f:
+        f.write(';GHG_METADATA\n')
+        config.write(f, space_around_delimiters=False)
+    print(f'{file_meta} file has been written!')
+
+
+def estimate_timelags(files, file_meta, avg_len=30, max_lag=5.0, min_corr=0.1):
+    """
+    Estimate the time lag of every gas analyser column against w from day files.
+
+    Args:
+        files (list): Decoded day files.
+        file_meta (str): EddyPro metadata file describing the columns.
+        avg_len (int): Averaging period in minutes.
+        max_lag (float): Largest lag searched in seconds.
+        min_corr (float): Minimum absolute correlation for a period to count.
+
+    Returns:
+        tuple: A tuple containing:
+            - config (configparser.ConfigParser): The parsed metadata.
+            - scalars (dict): Variable name -> 1-based column number.
+            - ranges (dict): Variable name -> result of lag_ranges.
+            - per_period (pd.DataFrame): Lag (s) and correlation per period.
+    """
+    config, w_col, scalars, freq = read_metadata_columns(file_meta)
+    n_period = int(round(avg_len * 60 * freq))
+    starts, matrices = load_period_matrix(files, [w_col] + list(scalars.values()), freq, n_period)
+
+    ranges = {}
+    per_period = pd.DataFrame(index=starts)
+    for variable, col in scalars.items():
+        lags, corr = xcov_lags(matrices[w_col], matrices[col], int(round(max_lag * freq)))
+        per_period[f'{variable}_lag'] = lags / freq
+        per_period[f'{variable}_r'] = corr
+        ranges[variable] = lag_ranges(lags, corr, freq, min_corr=min_corr)
+    return config, scalars, ranges, per_period
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate time lags of gas analysers against w.")
+    parser.add_argument('-m', '--month', type=int, required=True, help='Month number (1–12)')
+    parser.add_argument('-y', '--year', type=int, required=True, help='Year (e.g., 2025)')
+    parser.add_argument('-r', '--raw', type=str, required=True, help='folder of decoded day files')
+    parser.add_argument('-f', '--meta', type=str, required=True, help='meta filename')
+    parser.add_argument('-a', '--avg', type=int, default=30, help='averaging period in minutes')
+    parser.add_argument('-l', '--max-lag', type=float, default=5.0, help='largest lag searched in seconds')
+    parser.add_argument('-c', '--min-corr', type=float, default=0.1,
+                        help='minimum absolute correlation for a period to be used')
+    parser.add_argument('-o', '--output', type=str, default=None, help='optional CSV of lags per period')
+    parser.add_argument('--write', action='store_true', help='write the lag ranges into the meta file')
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.raw, f'*_{args.year:04d}-{args.month:02d}-*.dat')))
+    print(f'Estimating time lags from {len(files)} files...')
+    config, scalars, ranges, per_period = estimate_timelags(files, args.meta, avg_len=args.avg,
+                                                            max_lag=args.max_lag, min_corr=args.min_corr)
+
+    for variable, rng in ranges.items():
+        if rng is None:
+            print(f'{variable}: no period with |r| >= {args.min_corr}')
+        else:
+            print(f"{variable}: min {rng['min_timelag']:.2f} s, nominal {rng['nom_timelag']:.2f} s, "
+                  f"max {rng['max_timelag']:.2f} s ({rng['n_periods']} periods)")
+
+    if args.output:
+        per_period.to_csv(args.output, index_label='TIMESTAMP')
+
+    if args.write:
+        write_metadata_timelags(config, args.meta, scalars, ranges)
+
+
+if __name__ == "__main__":
+    main()
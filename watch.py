@@ -0,0 +1,275 @@
+import os
+import glob
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+import pandas as pd
+from natsort import natsorted
+
+from column_plan import compile_column_plan
+from download import download_tables, verify_tob3_tail
+from ingest import load_data, write_meta_file
+from manifest import write_file
+from read_cs_files import COMPRESSED_SUFFIXES
+from scan import match_files, matches
+from process_ts import DayWriter, seed_manifest, write_full_day_data
+
+
+class MonitorMeans:
+    """
+    Half-hourly means of a monitor table (e.g. MonitorCSAT), updated as records arrive.
+
+    The means are written to dst_dir/{var}_30min.csv, with the same layout as
+    process_monitor writes. Only the records of the averaging period still
+    open are kept: the means of finished periods are appended to the file once
+    and the row of the open period is replaced on every update. Records of
+    finished periods that arrive later (e.g. a TOA5 file read again as a
+    whole) are left out of the means and reported; process_monitor computes
+    the means from all records.
+
+    Args:
+        var (str): Table name.
+        dst_dir (str): Destination directory.
+        freq (str): Averaging interval.
+    """
+
+    def __init__(self, var, dst_dir, freq="30min"):
+        self.var = var
+        self.dst_dir = dst_dir
+        self.freq = freq
+        self.open = pd.DataFrame()  # records of the open averaging period
+        self.finished_end = None  # end of the header and finished means in the file
+        self.meta = None
+        self.meta_written = None  # metadata in dst_dir/meta.txt
+
+    def add(self, filename, df, data_meta, digest=None):
+        """Add decoded records and update the means. Returns the written files."""
+        if not self.open.empty:
+            open_start = self.open["TIMESTAMP"].iloc[0].floor(self.freq)
+            late = df["TIMESTAMP"] < open_start
+            if late.any():
+                print(f"{filename}: {late.sum()} records from {df['TIMESTAMP'][late].min()} "
+                      f"are older than the open period {open_start} and left out of the means")
+                df = df[~late]
+        if df.empty:
+            return []
+        data = (pd.concat([self.open, df], ignore_index=True)
+                .drop_duplicates(subset="TIMESTAMP", keep="last")
+                .sort_values("TIMESTAMP", ignore_index=True))
+        self.meta = data_meta
+
+        means = data.set_index("TIMESTAMP").resample(self.freq).mean(numeric_only=True)
+        self.open = data[data["TIMESTAMP"] >= means.index[-1]].reset_index(drop=True)
+        file_output = os.path.join(self.dst_dir, f"{self.var}_30min.csv")
+        self.write_means(file_output, means.iloc[:-1], means.iloc[-1:])
+        self.write_meta()
+        return [file_output]
+
+    def write_means(self, file_output, finished, current):
+        """Append the finished means to the file and replace the row of the open period."""
+        if self.finished_end is None or not os.path.exists(file_output):
+            # first update of this run: the header and finished means are written anew
+            write_file(file_output, finished.to_csv(index=True, lineterminator="\n"))
+            self.finished_end = os.path.getsize(file_output)
+            finished = finished.iloc[:0]
+        with open(file_output, "r+b") as f:
+            f.seek(self.finished_end)
+            f.write(finished.to_csv(header=False, lineterminator="\n").encode())
+            self.finished_end = f.tell()
+            f.write(current.to_csv(header=False, lineterminator="\n").encode())
+            f.truncate()
+
+    def write_meta(self):
+        """Write the metadata of the decoded data to dst_dir/meta.txt, once it changed."""
+        if self.meta and self.meta != self.meta_written:
+            write_meta_file(self.meta, self.dst_dir)
+            self.meta_written = self.meta
+
+
+class Watcher:
+    """
+    Decode the frames appended to datalogger files and pass them on as they arrive.
+
+    Every poll compares the size and modification time of the files of each
+    table with the last poll. Only the frames appended since then are decoded
+    (read_cs_files byte_range); a file that shrank or was rewritten is read
+    again from the start. Frames are only read up to the first invalid frame,
+    so a frame still being written is picked up by the next poll.
+
+    Args:
+        src_dir (str): Directory of the datalogger files (e.g. DataLogger/CRD).
+        sinks (dict): Table name -> object with an add(filename, df, meta)
+            method, e.g. process_ts.DayWriter or MonitorMeans, or a list of
+            them (e.g. the day files for EddyPro and Parquet day partitions).
+        plans (dict, optional): Table name -> column plan passed to load_data.
+    """
+
+    def __init__(self, src_dir, sinks, plans=None):
+        self.src_dir = src_dir
+        self.sinks = {var: list(sink) if isinstance(sink, (list, tuple)) else [sink]
+                      for var, sink in sinks.items()}
+        self.plans = plans or {}
+        self.state = {}  # filename -> (size, mtime, end of the decoded frames)
+
+        # files that previous runs have completely processed for every
+        # DayWriter of their table are not read again
+        for var, table_sinks in self.sinks.items():
+            writers = [sink for sink in table_sinks if isinstance(sink, DayWriter)]
+            if not writers:
+                continue
+            for filename in self.files(var):
+                if all(writer.manifest.check_input(filename)[0] for writer in writers):
+                    size = os.path.getsize(filename)
+                    self.state[filename] = (size, os.path.getmtime(filename), size)
+
+    def files(self, var):
+        # in the order they were written, so monitor records arrive in time
+        # order; archive.py keeps the modification time of the originals
+        return sorted(natsorted(match_files(self.src_dir, [f"{var}*.dat"])), key=os.path.getmtime)
+
+    def poll(self):
+        """
+        Decode what is new in the watched files.
+
+        Returns:
+            int: Number of files with new data.
+        """
+        n_updated = 0
+        for var, table_sinks in self.sinks.items():
+            for filename in self.files(var):
+                n_updated += self.update(var, filename)
+
+            for sink in table_sinks:
+                if isinstance(sink, DayWriter):
+                    # a file is done once all its days are written and nothing is left to decode
+                    for name in sink.finished_inputs():
+                        size, mtime, end = self.state[name]
+                        if end == size and os.path.getsize(name) == size:
+                            sink.record_input(name, sink.manifest.digest(name))
+                    sink.write_meta()
+        return n_updated
+
+    def update_file(self, filename):
+        """
+        Decode what is new in one file, e.g. right after it was downloaded.
+
+        Can be passed as on_file to download.download_tables, so a file is
+        decoded while the other transfers are still running. Inputs are only
+        recorded as done by poll.
+
+        Returns:
+            bool: Whether the file had new data.
+        """
+        for var in self.sinks:
+            if matches(filename, [f"{var}*.dat"]):
+                return self.update(var, filename)
+        return False
+
+    def update(self, var, filename):
+        """Decode what is new in a file of table var and pass it to its sinks. Returns whether it had new data."""
+        size, mtime = os.path.getsize(filename), os.path.getmtime(filename)
+        previous = self.state.get(filename)
+        if previous is not None and previous[:2] == (size, mtime):
+            return False
+
+        if os.path.splitext(filename)[1] in COMPRESSED_SUFFIXES:
+            # archived files do not grow and are read as a whole, unless
+            # they were read completely before they were compressed
+            original = self.state.get(os.path.splitext(filename)[0])
+            self.state[filename] = (size, mtime, size)
+            if original is not None and original[2] >= original[0]:
+                return False
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {filename}")
+            df, data_meta = load_data(filename, self.plans.get(var))
+            for sink in self.sinks[var]:
+                sink.add(filename, df, data_meta)
+            return True
+
+        start = previous[2] if previous is not None and size >= previous[0] else 0
+        stop = verify_tob3_tail(filename, start)[0]
+        if stop <= start:
+            self.state[filename] = (size, mtime, start)
+            return False
+
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {filename}: bytes {start}-{stop}")
+        report = {}
+        df, data_meta = load_data(filename, self.plans.get(var), report=report,
+                                  byte_range=(start, stop))
+        for sink in self.sinks[var]:
+            sink.add(filename, df, data_meta)
+        # files other than TOB3 are always read as a whole
+        self.state[filename] = (size, mtime, report.get("byte_range", (0, stop))[1])
+        return True
+
+
+def write_provisional(writer, dst_dir):
+    """
+    Write the days of a DayWriter that are not complete yet to dst_dir.
+
+    Provisional files are replaced on every call and removed once the day file
+    has been written. They are kept apart from the day files read by EddyPro.
+
+    Args:
+        writer (DayWriter): Writer of the day files.
+        dst_dir (str): Directory of the provisional files.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    current = set()
+    if not writer.temp_df.empty:
+        for day, df_day in writer.temp_df.groupby("date"):
+            current.add(write_full_day_data(df_day, writer.meta, day, dst_dir, writer.var))
+    for filename in glob.glob(os.path.join(dst_dir, f"{writer.var}_*.dat")):
+        if filename not in current:
+            os.remove(filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode new datalogger data as soon as it arrives.")
+    parser.add_argument('-s', '--src', type=str, default='../../DataLogger/CRD/', help='datalogger files')
+    parser.add_argument('-d', '--dst', type=str, default='../../decoded_data', help='decoded data root')
+    parser.add_argument('-m', '--meta', type=str, default='EddyPro/setx.metadata',
+                        help='EddyPro metadata describing the ts_data columns')
+    parser.add_argument('-i', '--interval', type=float, default=60., help='seconds between polls')
+    parser.add_argument('--host', type=str, default=None,
+                        help='datalogger address; new data is downloaded into --src before every poll')
+    parser.add_argument('--provisional', action='store_true',
+                        help='also write the current, incomplete day of ts_data')
+    parser.add_argument('--parquet', type=str, default=None,
+                        help='also write the ts_data days as Parquet partitions to this folder (needs pyarrow)')
+    parser.add_argument('--once', action='store_true', help='poll once and exit')
+    args = parser.parse_args()
+
+    writer = DayWriter('ts_data', os.path.join(args.dst, 'ts_data'))
+    sinks = {'ts_data': [writer],
+             'MonitorCSAT': [MonitorMeans('MonitorCSAT', os.path.join(args.dst, 'MonitorCSAT'))]}
+    if args.parquet:
+        # one Parquet file per day, with its own manifest
+        sinks['ts_data'].append(DayWriter('ts_data', args.parquet, fmt='parquet'))
+    for sink in sum(sinks.values(), []):
+        os.makedirs(sink.dst_dir, exist_ok=True)
+    if not writer.manifest.inputs and not writer.manifest.outputs:
+        # first run after log_ts.txt was replaced by the manifest
+        seed_manifest(writer.manifest, args.src, writer.dst_dir, writer.var)
+    plans = {'ts_data': compile_column_plan(args.meta)}
+
+    watcher = Watcher(args.src, sinks, plans)
+    print(f"Watching {args.src} from {datetime.now()}")
+    try:
+        while True:
+            received = []
+            if args.host:
+                # every downloaded file is decoded while the other transfers go on
+                received = asyncio.run(download_tables(args.host, args.src, on_file=watcher.update_file))
+            if (watcher.poll() or received) and args.provisional:
+                write_provisional(writer, os.path.join(args.dst, 'provisional', 'ts_data'))
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print(f"Stopped at {datetime.now()}")
+
+
+if __name__ == "__main__":
+    main()